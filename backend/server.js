@@ -7,7 +7,10 @@ const axios = require('axios');
 
 // Modular Imports
 const { supabase } = require('./config/clients');
-const { checkCriticalVitals, detectDeterioration, getTriageWeights } = require('./services/mlService');
+const {
+  callTrendService, checkCriticalVitals, detectDeterioration, getTriageWeights,
+  addSimilarCase, fetchQueuePage, findSimilarCases, mirrorQueuePatient, pollSlaBreaches, syncQueueEngine
+} = require('./services/mlService');
 const { analyzeCustomSymptoms } = require('./services/aiService');
 
 const app = express();
@@ -214,6 +217,8 @@ app.post('/api/checkin', async (req, res) => {
       }
     }
 
+    await mirrorQueuePatient(patient);
+    addSimilarCase(patient);
     io.emit('queue:update', { action: 'patient_added', patient_id: patient.id });
     res.json({ success: true, patient, ai_analysis: aiAnalysis });
   } catch (error) {
@@ -229,6 +234,10 @@ app.get('/api/queue', async (req, res) => {
     const from = (page - 1) * limit;
     const to = from + parseInt(limit) - 1;
 
+    // 0. Queue engine (ML service): the page and stats without scanning the table
+    const enginePage = await fetchQueuePage({ page: parseInt(page), limit: parseInt(limit), status, hospital_id });
+    if (enginePage) return res.json(enginePage);
+
     // 1. Fetch Summary for Stats
     let statsQuery = supabase
       .from('patients')
@@ -413,7 +422,13 @@ app.post('/api/patients/:id/vitals', async (req, res) => {
     if (deteriorationAlerts && deteriorationAlerts.length > 0) scoreBoost += 15;
     if (criticalAlerts.some(a => a.severity === 'critical')) scoreBoost += 25;
     
-    const newScore = Math.min(100, patient.triage_score + scoreBoost);
+    let newScore = Math.min(100, patient.triage_score + scoreBoost);
+    
+    // ML scores are comparable with the trend-adjusted score, rule scores are not
+    const trendResult = await callTrendService(patient, newEntry, oldHistory);
+    if (trendResult && patient.triage_method.startsWith('ml')) {
+      newScore = Math.max(newScore, trendResult.score);
+    }
     
     const { data: updatedPatient, error: updateError } = await supabase
       .from('patients')
@@ -426,6 +441,7 @@ app.post('/api/patients/:id/vitals', async (req, res) => {
         meta: {
           ...currentMeta,
           vitals_history: newHistory,
+          latest_trend: trendResult,
           latest_alerts: [...(criticalAlerts || []), ...(deteriorationAlerts || [])]
         }
       })
@@ -459,6 +475,7 @@ app.post('/api/patients/:id/vitals', async (req, res) => {
       });
     }
     
+    await mirrorQueuePatient(updatedPatient);
     io.emit('queue:update', { action: 'vitals_updated', patient_id: id, new_score: newScore });
 
     res.json({ success: true, patient: updatedPatient, alerts: allAlerts, score_boost: scoreBoost });
@@ -473,8 +490,9 @@ app.post('/api/patient/:patient_id/status', async (req, res) => {
   try {
     const { patient_id } = req.params;
     const { status } = req.body;
-    const { error } = await supabase.from('patients').update({ status }).eq('id', patient_id);
+    const { data: patient, error } = await supabase.from('patients').update({ status }).eq('id', patient_id).select().single();
     if (error) throw error;
+    await mirrorQueuePatient(patient);
     io.emit('patient:updated', { patient_id, status });
     io.emit('queue:update', { action: 'status_changed' });
     res.json({ success: true });
@@ -491,8 +509,9 @@ app.post('/api/triage/recompute/:patient_id', async (req, res) => {
     const { data: patient } = await supabase.from('patients').select('*').eq('id', patient_id).single();
     if (!patient) throw new Error('Patient not found');
     const triageResult = await computeTriage(patient);
-    await supabase.from('patients').update({ triage_score: triageResult.score, triage_method: triageResult.method }).eq('id', patient_id);
+    const { data: updated } = await supabase.from('patients').update({ triage_score: triageResult.score, triage_method: triageResult.method }).eq('id', patient_id).select().single();
     await supabase.from('triage_audit').insert({ patient_id, method: triageResult.method, score: triageResult.score, explanation: triageResult.explanation });
+    await mirrorQueuePatient(updated);
     io.emit('patient:updated', { patient_id });
     io.emit('queue:update', { action: 'triage_recomputed' });
     res.json({ success: true, new_score: triageResult.score });
@@ -501,6 +520,21 @@ app.post('/api/triage/recompute/:patient_id', async (req, res) => {
   }
 });
 
+// Similar past cases for a patient, by their latest vitals
+app.get('/api/patients/:id/similar', async (req, res) => {
+  try {
+    const { data: patient, error } = await supabase.from('patients').select('*').eq('id', req.params.id).single();
+    if (error) throw error;
+    const k = Math.min(parseInt(req.query.k) || 5, 49);
+    // One extra: the patient is usually in the index already (added at check-in)
+    const cases = await findSimilarCases(patient, k + 1);
+    if (!cases) return res.status(503).json({ error: 'Similar cases unavailable' });
+    res.json({ cases: cases.filter(c => c.source !== 'live' || c.case_id !== String(patient.id)).slice(0, k) });
+  } catch (error) {
+    res.status(500).json({ error: error.message });
+  }
+});
+
 // Get Audit
 app.get('/api/audit/:patient_id', async (req, res) => {
   try {
@@ -652,7 +686,15 @@ async function computeTriage(patient) {
         method = 'ml+injury_override';
     }
 
-    return { score, method, explanation: mlResponse.data.features_used };
+    return {
+      score,
+      method,
+      explanation: {
+        probability: mlResponse.data.probability,
+        features_used: mlResponse.data.features_used,
+        contributions: mlResponse.data.contributions
+      }
+    };
 
   } catch (error) {
     console.error('ML Service unavailable, using rule fallback:', error.message);
@@ -690,10 +732,11 @@ app.post('/api/referrals', async (req, res) => {
     if (error) throw error;
     
     // 2. Update Patient Status visually (optional, or just add a flag)
-    await supabase.from('patients').update({ 
+    const { data: flagged } = await supabase.from('patients').update({ 
       redirect_recommended: true, 
       redirect_hospital_id: to_hospital_id 
-    }).eq('id', patient_id);
+    }).eq('id', patient_id).select().single();
+    await mirrorQueuePatient(flagged);
 
     // 3. AUTO-RESOLVE ALERTS FOR THIS PATIENT
     // Delete them because they are no longer relevant for the Sender
@@ -767,6 +810,7 @@ app.post('/api/referrals/:id/accept', async (req, res) => {
       })
       .eq('id', referral.patient_id)
       .select().single();
+    await mirrorQueuePatient(patient);
       
     // 4. Emit Events
     // To Receiver (Add to queue)
@@ -788,33 +832,75 @@ io.on('connection', (socket) => {
 });
 
 // SLA Worker
-setInterval(async () => {
-  try {
-    const { data: patients } = await supabase.from('patients').select('*').eq('status', 'waiting');
-    const now = new Date();
-    const SLA_THRESHOLD = 30 * 60 * 1000; 
-
-    for (const patient of patients || []) {
-      const waitTime = now - new Date(patient.arrival_ts);
-      if (waitTime > SLA_THRESHOLD) {
-        const { data: existing } = await supabase.from('alerts').select('id').eq('patient_id', patient.id).eq('alert_type', 'sla_breach').single();
-        if (!existing) {
-          await supabase.from('alerts').insert({
-            patient_id: patient.id, alert_type: 'sla_breach',
-            payload: { wait_time_mins: Math.round(waitTime / 60000), triage_score: patient.triage_score }
-          });
-          io.emit('alert:raised', { patient_id: patient.id, alert_type: 'sla_breach', wait_time_mins: Math.round(waitTime / 60000) });
-        }
+// Breaches come from the ML service's deadline scheduler as they happen
+// (score-tiered deadlines, long-polled). While it is unreachable, fall back to
+// scanning the waiting patients every 30 seconds against the flat 30-minute SLA.
+async function raiseSlaBreaches(breaches) {
+  if (breaches.length === 0) return;
+  // One lookup for the whole batch: a patient gets a single sla_breach alert
+  const { data: existing } = await supabase.from('alerts')
+    .select('patient_id')
+    .eq('alert_type', 'sla_breach')
+    .in('patient_id', breaches.map(b => b.patient_id));
+  const alerted = new Set((existing || []).map(a => String(a.patient_id)));
+
+  for (const breach of breaches) {
+    if (alerted.has(String(breach.patient_id))) continue;
+    alerted.add(String(breach.patient_id));
+    await supabase.from('alerts').insert({
+      patient_id: breach.patient_id, alert_type: 'sla_breach',
+      payload: { wait_time_mins: breach.wait_time_mins, triage_score: breach.triage_score, sla_minutes: breach.sla_minutes }
+    });
+    io.emit('alert:raised', {
+      patient_id: breach.patient_id, hospital_id: breach.hospital_id, alert_type: 'sla_breach',
+      wait_time_mins: breach.wait_time_mins, sla_minutes: breach.sla_minutes
+    });
+  }
+}
+
+async function scanSlaBreaches() {
+  const { data: patients } = await supabase.from('patients').select('id, hospital_id, triage_score, arrival_ts').eq('status', 'waiting');
+  const now = new Date();
+  const SLA_THRESHOLD = 30 * 60 * 1000; 
+
+  const overdue = (patients || []).filter(p => now - new Date(p.arrival_ts) > SLA_THRESHOLD);
+  await raiseSlaBreaches(overdue.map(p => ({
+    patient_id: p.id,
+    hospital_id: p.hospital_id,
+    triage_score: p.triage_score,
+    wait_time_mins: Math.round((now - new Date(p.arrival_ts)) / 60000),
+    sla_minutes: 30
+  })));
+}
+
+async function watchSlaBreaches() {
+  let after = 0;
+  let streamId = null;
+  for (;;) {
+    try {
+      const result = await pollSlaBreaches(after, streamId);
+      if (result) {
+        await raiseSlaBreaches(result.events);
+        streamId = result.stream_id;
+        after = result.last_seq;
+        continue;
       }
+      await scanSlaBreaches();
+    } catch (error) {
+      console.error('SLA worker error:', error.message);
     }
-  } catch (error) {
-    console.error('SLA worker error:', error.message);
+    await new Promise(resolve => setTimeout(resolve, 30000));
   }
-}, 30000);
+}
 
 // Listen
 const PORT = process.env.PORT || 4000;
 server.listen(PORT, () => {
   console.log(`\n🚀 HT-1 Triage Backend running on port ${PORT}`);
   console.log(`📊 ML Service URL: ${process.env.ML_SERVICE_URL || 'http://localhost:8000'}`);
+  syncQueueEngine();
+  watchSlaBreaches();
 });
+
+// Periodic full resync of the queue engine, in case a mirrored write was lost
+setInterval(syncQueueEngine, parseInt(process.env.QUEUE_RESYNC_MS || '300000'));
@@ -1,10 +1,12 @@
 const { groq } = require('../config/clients');
+const { classifySymptomText } = require('./mlService');
 
-async function analyzeCustomSymptoms(customSymptomText) {
-  if (!groq || !customSymptomText || customSymptomText.trim().length === 0) {
-    return { urgency_boost: 0, severity: 'unknown', explanation: 'No AI analysis available' };
-  }
+// The ML service's local text model answers first. The LLM is the slow path,
+// for texts the local model is unsure about or when the ML service is down.
+const LOCAL_MIN_CONFIDENCE = parseFloat(process.env.AI_LOCAL_MIN_CONFIDENCE || '0.6');
+const REMOTE_FALLBACK = process.env.AI_REMOTE_FALLBACK !== '0';
 
+async function analyzeWithGroq(customSymptomText) {
   try {
     const prompt = `You are a medical triage assistant. Analyze the following patient symptom description and determine its urgency level.
 
@@ -34,12 +36,43 @@ Respond ONLY with valid JSON.`;
       urgency_boost: Math.min(40, Math.max(0, parseInt(analysis.urgency_boost || 0))),
       severity: analysis.severity || 'unknown',
       explanation: analysis.explanation || 'AI analysis completed',
-      recommended_action: analysis.recommended_action || 'Standard triage protocol'
+      recommended_action: analysis.recommended_action || 'Standard triage protocol',
+      source: 'groq'
     };
   } catch (error) {
     console.error('Groq AI analysis error:', error.message);
-    return { urgency_boost: 0, severity: 'unknown', explanation: 'AI analysis failed' };
+    return null;
+  }
+}
+
+async function analyzeCustomSymptoms(customSymptomText) {
+  if (!customSymptomText || customSymptomText.trim().length === 0) {
+    return { urgency_boost: 0, severity: 'unknown', explanation: 'No AI analysis available' };
+  }
+
+  const local = await classifySymptomText(customSymptomText);
+  const useRemote = groq && REMOTE_FALLBACK && (!local || local.confidence < LOCAL_MIN_CONFIDENCE);
+  const remote = useRemote ? await analyzeWithGroq(customSymptomText) : null;
+  if (remote) {
+    // Keep the local specialty, the LLM prompt does not ask for one
+    return local ? { ...remote, specialty: local.specialty, local } : remote;
+  }
+  if (local) {
+    return {
+      urgency_boost: local.urgency_boost,
+      severity: local.severity,
+      explanation: local.explanation,
+      recommended_action: local.recommended_action,
+      specialty: local.specialty,
+      urgency: local.urgency,
+      confidence: local.confidence,
+      source: 'local'
+    };
+  }
+  if (!groq) {
+    return { urgency_boost: 0, severity: 'unknown', explanation: 'No AI analysis available' };
   }
+  return { urgency_boost: 0, severity: 'unknown', explanation: 'AI analysis failed' };
 }
 
 module.exports = { analyzeCustomSymptoms };
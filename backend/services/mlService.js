@@ -2,6 +2,8 @@ const axios = require('axios');
 const { supabase } = require('../config/clients');
 
 const ML_SERVICE_URL = process.env.ML_SERVICE_URL || 'http://localhost:8000';
+// The ML service requires this on its queue and similar-case writes when it has ML_ADMIN_TOKEN set
+const ML_ADMIN_HEADERS = process.env.ML_ADMIN_TOKEN ? { 'X-Admin-Token': process.env.ML_ADMIN_TOKEN } : {};
 
 function computeTriageRule({ age, symptoms = [], vitals = {}, weights }) {
   let score = 0;
@@ -81,7 +83,8 @@ async function callMLService(patient) {
       method: 'ml',
       score: resp.data.triage_score,
       probability: resp.data.probability,
-      features_used: resp.data.features_used
+      features_used: resp.data.features_used,
+      contributions: resp.data.contributions
     };
   } catch (error) {
     console.error('ML service error:', error.message);
@@ -89,6 +92,184 @@ async function callMLService(patient) {
   }
 }
 
+function toReading(vitals = {}) {
+  return {
+    hr: vitals.hr || 80,
+    sbp: vitals.sbp || 120,
+    spo2: vitals.spo2 || 98,
+    temp: vitals.temp || 37.0,
+    rr: vitals.rr || 16
+  };
+}
+
+// Recheck scoring: the ML service keeps each patient's trend window, so only
+// the new reading is needed. The last few earlier readings ride along in case
+// the worker that answers has no state for this patient yet.
+async function callTrendService(patient, entry, previousHistory = [], historyLimit = 6) {
+  try {
+    const payload = {
+      ...toReading(entry.vitals),
+      age: patient.age,
+      symptoms: patient.symptoms || [],
+      comorbid: patient.meta?.comorbid || 0,
+      injury_score: patient.injury_score || 0,
+      patient_id: String(patient.id),
+      timestamp: entry.timestamp,
+      history: previousHistory.slice(-historyLimit).map(h => ({ timestamp: h.timestamp, ...toReading(h.vitals) }))
+    };
+
+    const resp = await axios.post(`${ML_SERVICE_URL}/predict/trend`, payload, {
+      timeout: 3000
+    });
+
+    return {
+      method: resp.data.method,
+      score: resp.data.triage_score,
+      probability: resp.data.probability,
+      base_probability: resp.data.base_probability,
+      trend: resp.data.trend,
+      trend_contributions: resp.data.trend_contributions
+    };
+  } catch (error) {
+    console.error('ML trend service error:', error.message);
+    return null;
+  }
+}
+
+// Queue engine in the ML service: the backend mirrors every queue write there
+// and reads dashboard pages back instead of rescanning the patients table.
+// Best-effort throughout; the database stays the source of truth.
+const QUEUE_STATUSES = ['waiting', 'in_treatment'];
+let queueSync = null;
+
+function toQueuePatient(patient) {
+  return {
+    patient_id: patient.id,
+    hospital_id: patient.hospital_id,
+    triage_score: patient.triage_score,
+    arrival_ts: patient.arrival_ts,
+    status: patient.status,
+    data: patient
+  };
+}
+
+async function callQueueEngine(method, path, data) {
+  try {
+    const resp = await axios({ method, url: `${ML_SERVICE_URL}${path}`, data, headers: ML_ADMIN_HEADERS, timeout: 2000 });
+    return resp.data;
+  } catch (error) {
+    console.error('ML queue engine error:', error.message);
+    return null;
+  }
+}
+
+async function mirrorQueuePatient(patient) {
+  if (!patient) return null;
+  return callQueueEngine('put', '/queue/patients', toQueuePatient(patient));
+}
+
+async function pushQueueSnapshot() {
+  try {
+    const { data: patients, error } = await supabase.from('patients').select('*').in('status', QUEUE_STATUSES);
+    if (error) throw error;
+    return await callQueueEngine('post', '/queue/sync', { patients: patients.map(toQueuePatient) });
+  } catch (error) {
+    console.error('Queue sync error:', error.message);
+    return null;
+  }
+}
+
+// Full snapshot of the queued patients; one sync at a time
+function syncQueueEngine() {
+  if (!queueSync) {
+    queueSync = pushQueueSnapshot().finally(() => { queueSync = null; });
+  }
+  return queueSync;
+}
+
+// Same shape as GET /api/queue, or null when the caller should read the database
+async function fetchQueuePage({ page, limit, status, hospital_id }) {
+  if (!QUEUE_STATUSES.includes(status)) return null;
+  const params = new URLSearchParams({ page, limit, status });
+  if (hospital_id) params.set('hospital_id', hospital_id);
+  const result = await callQueueEngine('get', `/queue?${params}`);
+  if (!result) return null;
+  if (!result.synced) {
+    // ML service restarted with an empty engine: refill it in the background
+    syncQueueEngine();
+    return null;
+  }
+  return { patients: result.patients, pagination: result.pagination, stats: result.stats };
+}
+
+// Long poll for SLA breaches fired by the ML service's deadline scheduler.
+// Pass back the stream_id and last_seq of the previous answer.
+async function pollSlaBreaches(after = 0, streamId = null, waitSeconds = 25) {
+  try {
+    const params = new URLSearchParams({ after, timeout: waitSeconds });
+    if (streamId) params.set('stream_id', streamId);
+    const resp = await axios.get(`${ML_SERVICE_URL}/sla/breaches?${params}`, {
+      timeout: (waitSeconds + 10) * 1000
+    });
+    return resp.data;
+  } catch (error) {
+    console.error('ML SLA scheduler error:', error.message);
+    return null;
+  }
+}
+
+// Similar past cases: nearest historical (and earlier live) patients by vitals,
+// with their priority, notes or diagnosis, and disposition
+function toCaseVitals(age, vitals = {}) {
+  return {
+    age,
+    hr: vitals.hr || 80,
+    sbp: vitals.sbp || 120,
+    spo2: vitals.spo2 || null,
+    temp: vitals.temp || 37.0,
+    rr: vitals.rr || 16
+  };
+}
+
+async function findSimilarCases(patient, k = 5) {
+  try {
+    const resp = await axios.post(`${ML_SERVICE_URL}/similar`, { ...toCaseVitals(patient.age, patient.vitals), k }, {
+      timeout: 2000
+    });
+    return resp.data.cases;
+  } catch (error) {
+    console.error('ML similar cases error:', error.message);
+    return null;
+  }
+}
+
+// New arrivals join the index so later look-ups can match them
+async function addSimilarCase(patient) {
+  try {
+    const resp = await axios.post(`${ML_SERVICE_URL}/similar/cases`, {
+      ...toCaseVitals(patient.age, patient.vitals),
+      case_id: patient.id,
+      triage_score: patient.triage_score,
+      summary: [...(patient.symptoms || []), patient.meta?.custom_symptoms].filter(Boolean).join(', ')
+    }, { headers: ML_ADMIN_HEADERS, timeout: 2000 });
+    return resp.data;
+  } catch (error) {
+    console.error('ML similar cases error:', error.message);
+    return null;
+  }
+}
+
+// Local specialty / urgency classifier for free-text symptoms (ML service)
+async function classifySymptomText(text) {
+  try {
+    const resp = await axios.post(`${ML_SERVICE_URL}/classify/symptoms`, { text }, { timeout: 1000 });
+    return resp.data;
+  } catch (error) {
+    console.error('ML symptom classifier error:', error.message);
+    return null;
+  }
+}
+
 async function getTriageWeights() {
   const { data, error } = await supabase
     .from('admin_settings')
@@ -125,7 +306,8 @@ async function computeTriage(patient) {
       method: 'ml',
       explanation: {
         probability: mlResult.probability,
-        features_used: mlResult.features_used
+        features_used: mlResult.features_used,
+        contributions: mlResult.contributions
       }
     };
   }
@@ -389,4 +571,8 @@ function detectDeterioration(vitalsHistory) {
   return alerts.length > 0 ? alerts : null;
 }
 
-module.exports = { computeTriage, checkCriticalVitals, detectDeterioration, getTriageWeights };
+module.exports = {
+  computeTriage, callTrendService, checkCriticalVitals, detectDeterioration, getTriageWeights,
+  addSimilarCase, classifySymptomText, fetchQueuePage, findSimilarCases, mirrorQueuePatient, pollSlaBreaches,
+  syncQueueEngine
+};
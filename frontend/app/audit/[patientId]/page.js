@@ -141,6 +141,26 @@ export default function AuditPage({ params }) {
                           </div>
                         </div>
                       )}
+
+                      {audit.explanation.contributions?.values && (
+                        <div className="mt-3">
+                          <p className="text-gray-500 uppercase text-[10px] font-bold tracking-wider mb-2">
+                            Contributions ({audit.explanation.contributions.units === 'log_odds' ? 'log-odds' : 'probability'})
+                          </p>
+                          <div className="space-y-1">
+                            {Object.entries(audit.explanation.contributions.values)
+                              .sort(([, a], [, b]) => Math.abs(b) - Math.abs(a))
+                              .map(([key, value]) => (
+                                <div key={key} className="flex justify-between text-xs bg-white/5 p-2 rounded">
+                                  <span className="text-slate-400">{key}</span>
+                                  <span className={`font-mono ${value > 0 ? 'text-red-400' : 'text-green-400'}`}>
+                                    {value > 0 ? '+' : ''}{value.toFixed(3)}
+                                  </span>
+                                </div>
+                              ))}
+                          </div>
+                        </div>
+                      )}
                     </div>
                   )}
 
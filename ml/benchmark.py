@@ -0,0 +1,694 @@
+# benchmark.py
+# Reproducible load and latency benchmark for the triage ML service
+#
+# Drives ml_service.app in-process (straight through the ASGI stack:
+# middleware, validation, serialization) and/or over local HTTP against
+# serve.py, with synthetic patients drawn from generate_and_train.py.
+# Reports throughput and p50/p95/p99 latency for single, batch and
+# concurrent modes and writes everything to JSON for cross-commit comparison.
+#
+# Usage:
+#   python benchmark.py                                  # in-process, writes benchmark_results.json
+#   python benchmark.py --transport both --out new.json  # in-process + HTTP
+#   python benchmark.py --compare old.json               # flag regressions against a saved run
+#   python benchmark.py --startup --scaling 1,2,4 --coalescing
+#   python benchmark.py --coldstart                      # launch -> first prediction, fast start on/off
+
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import ml_service
+import model_registry
+from generate_and_train import generate_row
+from ml_service import PredictRequest, build_feature_matrix
+from trends import VITALS, TrendStore, TrendWindow
+
+# A run counts as a regression when throughput drops or p99 rises by more than this
+REGRESSION_THRESHOLD = 0.10
+
+# Time from launching serve.py to the first 200 from /predict; the backend gives up after 3s
+COLD_START_TARGET_SECONDS = 1.5
+
+
+def synthetic_payloads(n, seed=42):
+    """/predict bodies sampled from the generate_and_train.py distributions."""
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(n):
+        age, hr, sbp, spo2, temp, rr, chest_pain, breathless, comorbid, injury_score, _ = generate_row(rng)
+        symptoms = []
+        if chest_pain:
+            symptoms.append('chest_pain')
+        if breathless:
+            symptoms.append('shortness_of_breath')
+        payloads.append({
+            'age': age, 'hr': hr, 'sbp': sbp, 'spo2': spo2, 'temp': temp, 'rr': rr,
+            'injury_score': injury_score, 'symptoms': symptoms, 'comorbid': comorbid,
+        })
+    return payloads
+
+
+def latency_stats(latencies, elapsed, rows):
+    lat = np.asarray(latencies) * 1000.0
+    return {
+        'requests': len(latencies),
+        'rows': rows,
+        'seconds': round(elapsed, 6),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'rows_per_sec': round(rows / elapsed, 1),
+        'mean_ms': round(float(lat.mean()), 4),
+        'p50_ms': round(float(np.percentile(lat, 50)), 4),
+        'p95_ms': round(float(np.percentile(lat, 95)), 4),
+        'p99_ms': round(float(np.percentile(lat, 99)), 4),
+        'max_ms': round(float(lat.max()), 4),
+    }
+
+
+def batch_bodies(payloads, size):
+    return [json.dumps({'patients': payloads[i:i + size]}).encode()
+            for i in range(0, len(payloads) - size + 1, size)]
+
+
+# ---------------------------------------------------------------------------
+# In-process transport: ASGI calls into ml_service.app
+# ---------------------------------------------------------------------------
+
+async def asgi_post(app, path, body):
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return {'type': 'http.disconnect'}
+
+    status = 0
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'POST', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'root_path': '', 'query_string': b'',
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+    }
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"POST {path} returned {status}")
+
+
+def run_inprocess(path, bodies, rows_per_body, concurrency=1):
+    async def client(share, latencies):
+        for body in share:
+            start = time.perf_counter()
+            await asgi_post(ml_service.app, path, body)
+            latencies.append(time.perf_counter() - start)
+
+    async def drive():
+        latencies = []
+        shares = [bodies[i::concurrency] for i in range(concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(client(share, latencies) for share in shares))
+        return time.perf_counter() - start, latencies
+
+    elapsed, latencies = asyncio.run(drive())
+    return latency_stats(latencies, elapsed, len(bodies) * rows_per_body)
+
+
+# ---------------------------------------------------------------------------
+# HTTP transport: keep-alive clients in separate processes
+# ---------------------------------------------------------------------------
+
+def _http_worker(host, port, path, bodies, results):
+    conn = http.client.HTTPConnection(host, port)
+    headers = {'Content-Type': 'application/json'}
+    latencies = []
+    for body in bodies:
+        start = time.perf_counter()
+        conn.request('POST', path, body, headers)
+        resp = conn.getresponse()
+        resp.read()
+        latencies.append(time.perf_counter() - start)
+        if resp.status != 200:
+            raise RuntimeError(f"POST {path} returned {resp.status}")
+    results.put(latencies)
+
+
+def run_http(host, port, path, bodies, rows_per_body, concurrency=1):
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_http_worker, args=(host, port, path, bodies[i::concurrency], queue))
+             for i in range(concurrency)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    latencies = []
+    for _ in procs:
+        latencies.extend(queue.get())
+    elapsed = time.perf_counter() - start
+    for p in procs:
+        p.join()
+    return latency_stats(latencies, elapsed, len(bodies) * rows_per_body)
+
+
+def wait_ready(port, host='127.0.0.1', timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/ready')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def start_server(registry_dir, port, workers=1):
+    """Launch serve.py against a registry holding the benchmarked model."""
+    env = dict(os.environ, ML_WORKERS=str(workers), ML_PORT=str(port), ML_HOST='127.0.0.1',
+               ML_REGISTRY_DIR=registry_dir, ML_ACCESS_LOG='0', ML_WATCH_INTERVAL='0')
+    server = subprocess.Popen([sys.executable, 'serve.py'], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_ready(port):
+        server.terminate()
+        raise RuntimeError(f"serve.py with {workers} worker(s) never became ready")
+    return server
+
+
+def run_modes(runner, payloads, batch_sizes, concurrency):
+    """single / batch_<size> / concurrent_<c> through one transport."""
+    single_bodies = [json.dumps(p).encode() for p in payloads]
+    results = {'single': runner('/predict', single_bodies, 1)}
+    for size in batch_sizes:
+        bodies = batch_bodies(payloads, size)
+        if bodies:
+            results[f'batch_{size}'] = runner('/predict/batch', bodies, size)
+    results[f'concurrent_{concurrency}'] = runner('/predict', single_bodies, 1, concurrency)
+    return results
+
+
+def check_parity(payloads):
+    """Compare the service scorer against sklearn's predict_proba row by row."""
+    X = build_feature_matrix([PredictRequest(**p) for p in payloads])
+    expected = np.rint(ml_service.active.model.predict_proba(X)[:, 1] * 100).astype(int)
+    batch = np.rint(ml_service.active.scorer.predict_proba(X) * 100).astype(int)
+    single = np.array([int(round(ml_service.active.scorer.predict_one(row) * 100)) for row in X])
+    mismatches = int((batch != expected).sum() + (single != expected).sum())
+    # Contributions must add up to the prediction they explain
+    probs, explanations = ml_service.explain_rows(ml_service.active, X)
+    if explanations is not None:
+        for prob, e in zip(probs.tolist(), explanations):
+            total = e['baseline'] + sum(e['values'].values())
+            if e['units'] == 'log_odds':
+                total = 1.0 / (1.0 + np.exp(-total))
+            mismatches += int(abs(total - prob) > 1e-4)
+    return mismatches
+
+
+def bench_row_latency(payloads, repeat=3):
+    """Per-row inference latency (us) for sklearn vs the service scorer."""
+    rows = build_feature_matrix([PredictRequest(**p) for p in payloads]).tolist()
+    timings = {}
+    for name, fn in (
+        ('sklearn predict_proba', lambda r: ml_service.active.model.predict_proba([r])[0][1]),
+        (f'scorer ({ml_service.active.scorer.kind})', ml_service.active.scorer.predict_one),
+    ):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for r in rows:
+                fn(r)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best / len(rows) * 1e6
+    return timings
+
+
+def bench_explain(payloads, repeat=3):
+    """Cost of per-feature contributions: scorer-level and end-to-end /predict."""
+    X = build_feature_matrix([PredictRequest(**p) for p in payloads])
+    current = ml_service.active
+    result = {}
+    if not hasattr(current.scorer, 'explain'):
+        return result
+    rows = X.tolist()
+    for name, fn in (('predict_one_us', current.scorer.predict_one),
+                     ('explain_one_us', lambda r: ml_service.explain_rows(current, np.asarray([r])))):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for r in rows:
+                fn(r)
+            best = min(best, time.perf_counter() - start)
+        result[name] = round(best / len(rows) * 1e6, 2)
+    for name, fn in (('batch_predict_ms', lambda: current.scorer.predict_proba(X)),
+                     ('batch_explain_ms', lambda: ml_service.explain_rows(current, X))):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        result[name] = round(best * 1000, 3)
+    bodies = [json.dumps(p).encode() for p in payloads]
+    saved = ml_service.EXPLAIN
+    try:
+        for flag in (False, True):
+            ml_service.EXPLAIN = flag
+            result[f"predict_p50_ms_explain_{'on' if flag else 'off'}"] = run_inprocess('/predict', bodies, 1)['p50_ms']
+    finally:
+        ml_service.EXPLAIN = saved
+    return result
+
+
+def _window_features_numpy(history):
+    """Reference trend features recomputed from scratch over a window of readings."""
+    t = np.array([ts for ts, _ in history]) / 60.0
+    values = np.array([v for _, v in history], dtype=np.float64)
+    vitals = {}
+    for i, name in enumerate(VITALS):
+        slope = np.polyfit(t - t[0], values[:, i], 1)[0] * 60 if len(t) > 1 else 0.0
+        vitals[name] = {'slope_per_hour': slope, 'delta': values[-1, i] - values[-2, i] if len(t) > 1 else 0.0,
+                        'std': values[:, i].std()}
+    return vitals
+
+
+def bench_trends(n_patients=500, readings=24, seed=42):
+    """Per-reading cost of the O(1) trend windows vs recomputing from the full history,
+    and parity of the running sums against numpy on the same window."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, [3, 4, 0.7, 1, 0.1], size=(n_patients, readings, len(VITALS)))
+    series = np.array([85, 125, 96, 17, 37.0]) + np.cumsum(steps, axis=1)
+    times = 1.7e9 + np.cumsum(rng.integers(5, 45, size=(n_patients, readings)) * 60, axis=1)
+    feeds = [[(float(times[p, r]), tuple(series[p, r].tolist())) for r in range(readings)] for p in range(n_patients)]
+
+    store = TrendStore(max_patients=n_patients)
+    start = time.perf_counter()
+    for r in range(readings):
+        for p in range(n_patients):
+            store.update(p, *feeds[p][r])
+    incremental_us = (time.perf_counter() - start) / (n_patients * readings) * 1e6
+
+    start = time.perf_counter()
+    for r in range(readings):
+        for p in range(n_patients):
+            window = TrendWindow()
+            for reading in feeds[p][:r + 1]:
+                window.add(*reading)
+            window.features()
+    replay_us = (time.perf_counter() - start) / (n_patients * readings) * 1e6
+
+    mismatches = 0
+    window_size = TrendWindow().max_readings
+    for p in range(n_patients):
+        got = store.get(p)
+        kept = [reading for reading in feeds[p] if feeds[p][-1][0] - reading[0] <= TrendWindow().max_minutes * 60]
+        want = _window_features_numpy(kept[-window_size:])
+        for name in VITALS:
+            for key, value in want[name].items():
+                if abs(got['vitals'][name][key] - value) > 1e-3:
+                    mismatches += 1
+    return {'incremental_us': round(incremental_us, 2), 'replay_history_us': round(replay_us, 2),
+            'readings': readings, 'patients': n_patients, 'parity_mismatches': mismatches}
+
+
+def bench_memory(payloads):
+    """Model footprint and peak allocations for one batch, sklearn vs scorer."""
+    X = build_feature_matrix([PredictRequest(**p) for p in payloads])
+    result = {
+        'sklearn model (pickled)': len(pickle.dumps(ml_service.active.model)),
+    }
+    if hasattr(ml_service.active.scorer, 'nbytes'):
+        result['scorer arrays'] = ml_service.active.scorer.nbytes
+    for name, fn in (
+        ('sklearn batch peak', lambda: ml_service.active.model.predict_proba(X)),
+        ('scorer batch peak', lambda: ml_service.active.scorer.predict_proba(X)),
+    ):
+        tracemalloc.start()
+        fn()
+        result[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+# Runs in a fresh interpreter so imports, page faults and RSS are measured cold
+STARTUP_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import model_registry
+from scoring import build_scorer
+model, scorer, manifest = model_registry.load_version(sys.argv[2], registry_dir=sys.argv[1],
+                                                      prefer_arrays=sys.argv[3] == 'arrays')
+scorer = scorer or build_scorer(model)
+scorer.predict_one([50, 100, 120, 95, 37.0, 16, 0, 0, 0, 0])
+elapsed = time.perf_counter() - start
+status = dict(line.split(':', 1) for line in open('/proc/self/status') if ':' in line)
+kb = lambda key: int(status.get(key, '0 kB').split()[0])
+print(json.dumps({'secs': elapsed, 'rss_kb': kb('VmRSS'), 'anon_kb': kb('RssAnon'), 'file_kb': kb('RssFile'),
+                  'sklearn_imported': 'sklearn' in sys.modules}))
+'''
+
+
+def bench_startup(model):
+    """Cold load of a registry artifact: pickle+sklearn vs memory-mapped arrays."""
+    import model_registry
+
+    results = {}
+    with tempfile.TemporaryDirectory() as registry_dir:
+        version = model_registry.publish(model, ml_service.FEATURE_NAMES, registry_dir=registry_dir)
+        for fmt in ('pickle', 'arrays'):
+            runs = []
+            for _ in range(3):
+                out = subprocess.run(
+                    [sys.executable, '-c', STARTUP_PROBE, registry_dir, version, fmt],
+                    capture_output=True, text=True, check=True
+                )
+                runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            results[fmt] = min(runs, key=lambda r: r['secs'])
+    return results
+
+
+def _first_prediction(port, body, deadline):
+    """Poll /ready every 5 ms, then time the first /predict on the ready server (ms)."""
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/ready')
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status == 200:
+                start = time.perf_counter()
+                conn.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    raise RuntimeError(f"first /predict returned {resp.status}")
+                return (time.perf_counter() - start) * 1000
+        except OSError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError("serve.py never became ready")
+
+
+def bench_coldstart(registry_dir, payloads, port=8097, repeat=3):
+    """Launch serve.py -> first successful /predict, per startup mode (median of runs).
+
+    The legacy modes serve ml_service.model_path (a bare pickle) from an empty
+    registry; with fast start only the first of the runs compiles it, the
+    others load the compiled-array cache.
+    """
+    empty_registry = tempfile.mkdtemp(prefix='empty-registry-')
+    modes = {
+        'fast': {'ML_FAST_START': '1'},
+        'no_warmup': {'ML_FAST_START': '0'},
+        'pickle': {'ML_FAST_START': '0', 'ML_MODEL_FORMAT': 'pickle'},
+        'legacy_fast': {'ML_FAST_START': '1', 'ML_REGISTRY_DIR': empty_registry},
+        'legacy': {'ML_FAST_START': '0', 'ML_REGISTRY_DIR': empty_registry},
+    }
+    body = json.dumps(payloads[0]).encode()
+    results = {}
+    for mode, extra in modes.items():
+        if mode.startswith('legacy') and not os.path.exists(ml_service.model_path):
+            continue
+        runs = []
+        with tempfile.TemporaryDirectory() as compiled_cache:
+            for _ in range(repeat):
+                env = dict(os.environ, ML_WORKERS='1', ML_PORT=str(port), ML_HOST='127.0.0.1',
+                           ML_REGISTRY_DIR=registry_dir, ML_ACCESS_LOG='0', ML_WATCH_INTERVAL='0',
+                           ML_FEEDBACK='0', ML_COMPILED_CACHE=compiled_cache)
+                env.update(extra)
+                start = time.perf_counter()
+                server = subprocess.Popen([sys.executable, 'serve.py'], env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    first_ms = _first_prediction(port, body, time.time() + 60)
+                    total = time.perf_counter() - start
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                    conn.request('GET', '/health')
+                    reported = json.loads(conn.getresponse().read())['startup']
+                finally:
+                    server.terminate()
+                    server.wait()
+                runs.append({'first_prediction_seconds': round(total, 4), 'first_request_ms': round(first_ms, 3),
+                             **{k: reported[k] for k in ('import_seconds', 'load_seconds', 'warmup_seconds',
+                                                         'ready_seconds', 'sklearn_imported')}})
+        runs.sort(key=lambda r: r['first_prediction_seconds'])
+        results[mode] = runs[len(runs) // 2]
+    os.rmdir(empty_registry)
+    return results
+
+
+def bench_coalescing(payloads, concurrency=64, max_batch=64, max_wait_ms=2.0):
+    """In-process concurrent /predict load with and without the micro-batcher."""
+    from coalescer import MicroBatcher
+
+    requests = [PredictRequest(**p) for p in payloads]
+
+    async def client(share, latencies):
+        for req in share:
+            start = time.perf_counter()
+            await ml_service.predict(req)
+            latencies.append(time.perf_counter() - start)
+
+    async def drive():
+        latencies = []
+        shares = [requests[i::concurrency] for i in range(concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(client(share, latencies) for share in shares))
+        return time.perf_counter() - start, latencies
+
+    results = {}
+    saved_cache, saved_coalescer = ml_service.prediction_cache.maxsize, ml_service.coalescer
+    ml_service.prediction_cache.maxsize = 0
+    try:
+        for name, batcher in (
+            ('direct', None),
+            ('coalesced', MicroBatcher(ml_service._score_active_batch, max_batch, max_wait_ms)),
+        ):
+            ml_service.coalescer = batcher
+            elapsed, latencies = asyncio.run(drive())
+            results[name] = {
+                'rps': len(requests) / elapsed,
+                'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'p99_ms': float(np.percentile(latencies, 99) * 1000),
+                'mean_batch': batcher.batch_size.snapshot()['mean'] if batcher else 1.0,
+            }
+    finally:
+        ml_service.prediction_cache.maxsize = saved_cache
+        ml_service.coalescer = saved_coalescer
+    return results
+
+
+def bench_worker_scaling(worker_counts, registry_dir, payloads, clients=8, port=8097):
+    """/predict throughput of serve.py over local HTTP for each worker count."""
+    bodies = [json.dumps(p).encode() for p in payloads]
+    results = {}
+    for workers in worker_counts:
+        server = start_server(registry_dir, port, workers)
+        try:
+            results[workers] = run_http('127.0.0.1', port, '/predict', bodies, 1, clients)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """Print per-mode throughput / p99 deltas; returns the number of regressions."""
+    regressions = 0
+    print(f"Comparison against {baseline['meta'].get('commit') or 'baseline'}:")
+    for transport, modes in current['results'].items():
+        for mode, stats in modes.items():
+            base = baseline.get('results', {}).get(transport, {}).get(mode)
+            if base is None:
+                continue
+            rate = stats['rows_per_sec'] / base['rows_per_sec'] - 1
+            p99 = stats['p99_ms'] / base['p99_ms'] - 1 if base['p99_ms'] else 0.0
+            flag = rate < -REGRESSION_THRESHOLD or p99 > REGRESSION_THRESHOLD
+            regressions += flag
+            print(f"  {'✗' if flag else '✓'} {transport:9s} {mode:15s} rows/s {rate:+7.1%}  p99 {p99:+7.1%}")
+    return regressions
+
+
+def print_modes(transport, modes):
+    print(f"{transport}:")
+    for mode, r in modes.items():
+        print(f"  {mode:15s} {r['rows_per_sec']:10.0f} rows/s {r['requests_per_sec']:9.0f} req/s  "
+              f"p50 {r['p50_ms']:7.3f}  p95 {r['p95_ms']:7.3f}  p99 {r['p99_ms']:7.3f} ms")
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the triage ML service")
+    parser.add_argument('--n', type=int, default=2000, help="number of synthetic patients")
+    parser.add_argument('--seed', type=int, default=42, help="seed for the synthetic patients")
+    parser.add_argument('--model', default=ml_service.model_path, help="model file to benchmark")
+    parser.add_argument('--transport', choices=('inprocess', 'http', 'both'), default='inprocess')
+    parser.add_argument('--batch-sizes', default='10,100,1000', help="comma-separated /predict/batch sizes")
+    parser.add_argument('--concurrency', type=int, default=16, help="clients in concurrent mode")
+    parser.add_argument('--workers', type=int, default=1, help="serve.py workers for the HTTP transport")
+    parser.add_argument('--port', type=int, default=8097, help="port for the spawned serve.py")
+    parser.add_argument('--out', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    parser.add_argument('--startup', action='store_true', help="measure cold load time and RSS per artifact format")
+    parser.add_argument('--coldstart', action='store_true',
+                        help="time serve.py launch -> first successful /predict, with and without fast start")
+    parser.add_argument('--scaling', help="comma-separated worker counts to load-test serve.py with, e.g. 1,2,4")
+    parser.add_argument('--coalescing', action='store_true', help="compare direct vs micro-batched /predict")
+    args = parser.parse_args()
+
+    ml_service.swap_model(ml_service.load_model_file(args.model))
+    ml_service.prediction_cache.maxsize = 0  # measure the scoring path, not cache hits
+    payloads = synthetic_payloads(args.n, args.seed)
+    batch_sizes = [int(s) for s in args.batch_sizes.split(',') if s]
+
+    print("🏥 HT-1 Triage ML Service Benchmark")
+    print("=" * 60)
+    print(f"Patients: {args.n} (seed {args.seed}), model: {args.model} "
+          f"({type(ml_service.active.model).__name__}, scorer: {ml_service.active.scorer.kind})")
+    print()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+            'n': args.n,
+            'seed': args.seed,
+            'model_type': type(ml_service.active.model).__name__,
+            'scorer': ml_service.active.scorer.kind,
+            'concurrency': args.concurrency,
+        },
+        'results': {},
+    }
+
+    if args.transport in ('inprocess', 'both'):
+        report['results']['inprocess'] = run_modes(run_inprocess, payloads, batch_sizes, args.concurrency)
+        print_modes('In-process (ASGI)', report['results']['inprocess'])
+
+    with tempfile.TemporaryDirectory() as registry_dir:
+        model_registry.publish(ml_service.active.model, ml_service.FEATURE_NAMES, registry_dir=registry_dir)
+
+        if args.transport in ('http', 'both'):
+            server = start_server(registry_dir, args.port, args.workers)
+            try:
+                runner = lambda path, bodies, rows, c=1: run_http('127.0.0.1', args.port, path, bodies, rows, c)
+                report['results']['http'] = run_modes(runner, payloads, batch_sizes, args.concurrency)
+            finally:
+                server.terminate()
+                server.wait()
+            print_modes(f'HTTP (serve.py, {args.workers} worker(s))', report['results']['http'])
+
+        if args.coldstart:
+            report['coldstart'] = bench_coldstart(registry_dir, payloads, port=args.port)
+            print(f"serve.py launch -> first successful /predict (median of 3, target {COLD_START_TARGET_SECONDS}s):")
+            for mode, r in report['coldstart'].items():
+                ok = "✓" if r['first_prediction_seconds'] <= COLD_START_TARGET_SECONDS else "⚠"
+                warm = f"{r['warmup_seconds']*1000:.0f} ms" if r['warmup_seconds'] is not None else "-"
+                print(f"  {ok} {mode:11s}: {r['first_prediction_seconds']*1000:7.0f} ms  (first request "
+                      f"{r['first_request_ms']:6.2f} ms; import {r['import_seconds']*1000:.0f} ms, "
+                      f"load {r['load_seconds']*1000:.0f} ms, warmup {warm}, sklearn imported: {r['sklearn_imported']})")
+            print()
+
+        if args.scaling:
+            counts = [int(c) for c in args.scaling.split(',')]
+            scaling = bench_worker_scaling(counts, registry_dir, payloads[:2000], port=args.port)
+            report['scaling'] = {str(w): r for w, r in scaling.items()}
+            print(f"serve.py /predict throughput over HTTP (8 keep-alive clients, {os.cpu_count()} CPU):")
+            for workers, r in scaling.items():
+                print(f"  {workers:2d} worker(s): {r['requests_per_sec']:8.0f} req/s  p99 {r['p99_ms']:7.3f} ms  "
+                      f"({r['requests_per_sec'] / scaling[counts[0]]['requests_per_sec']:.2f}x)")
+            print()
+
+    print("Single-row inference latency:")
+    report['row_latency_us'] = bench_row_latency(payloads[:500])
+    for name, us in report['row_latency_us'].items():
+        print(f"  {name:22s}: {us:8.1f} us/row")
+    print()
+
+    print(f"Contribution overhead ({ml_service.active.scorer.kind} scorer, {min(args.n, 1000)} rows):")
+    report['explain'] = bench_explain(payloads[:1000])
+    e = report['explain']
+    if e:
+        print(f"  single row : {e['predict_one_us']:8.1f} us -> {e['explain_one_us']:8.1f} us with contributions")
+        print(f"  batch      : {e['batch_predict_ms']:8.2f} ms -> {e['batch_explain_ms']:8.2f} ms")
+        print(f"  /predict   : p50 {e['predict_p50_ms_explain_off']:.3f} ms -> {e['predict_p50_ms_explain_on']:.3f} ms")
+    else:
+        print("  (no compiled scorer, contributions unavailable)")
+    print()
+
+    report['trends'] = bench_trends()
+    t = report['trends']
+    print(f"Vitals trends ({t['patients']} patients x {t['readings']} readings):")
+    print(f"  per reading: {t['incremental_us']:.1f} us incremental vs {t['replay_history_us']:.1f} us "
+          f"replaying the history ({t['replay_history_us'] / t['incremental_us']:.1f}x)")
+    status = '✓ slopes, deltas and std match' if t['parity_mismatches'] == 0 else f"✗ {t['parity_mismatches']} mismatches"
+    print(f"  parity vs numpy: {status}")
+    print()
+
+    print(f"Memory ({min(args.n, 1000)}-row batch):")
+    report['memory_bytes'] = bench_memory(payloads[:1000])
+    for name, size in report['memory_bytes'].items():
+        print(f"  {name:24s}: {size/1024:10.1f} KB")
+    print()
+
+    if args.startup:
+        print("Cold start (load + first prediction, fresh process):")
+        report['startup'] = bench_startup(ml_service.active.model)
+        for fmt, r in report['startup'].items():
+            print(f"  {fmt:7s}: {r['secs']*1000:7.1f} ms  RSS {r['rss_kb']/1024:6.1f} MB "
+                  f"(anon {r['anon_kb']/1024:.1f} MB, file-backed {r['file_kb']/1024:.1f} MB)  "
+                  f"sklearn imported: {r['sklearn_imported']}")
+        print()
+
+    if args.coalescing:
+        print("Concurrent /predict, 64 in-flight requests (in-process):")
+        report['coalescing'] = bench_coalescing(payloads)
+        for name, r in report['coalescing'].items():
+            print(f"  {name:10s}: {r['rps']:9.0f} req/s  p50 {r['p50_ms']:6.2f} ms  "
+                  f"p99 {r['p99_ms']:6.2f} ms  mean batch {r['mean_batch']:.1f}")
+        print()
+
+    parity_errors = check_parity(payloads) + report['trends']['parity_mismatches']
+    report['parity_mismatches'] = parity_errors
+    print(f"Scorer parity vs sklearn: {'✓ identical triage_score, contributions add up' if parity_errors == 0 else f'✗ {parity_errors} mismatches'}")
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {args.out}")
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report)
+    print("=" * 60)
+    if parity_errors or regressions:
+        sys.exit(1)
@@ -0,0 +1,98 @@
+# coalescer.py
+# Micro-batching for /predict under concurrent load
+#
+# Concurrent requests are queued for up to `max_wait_ms` (or until
+# `max_batch` rows are waiting), scored as one matrix in a worker thread,
+# and each caller's future is resolved with its own probability and
+# explanation from that same scoring call. Each row carries the model
+# snapshot its request took; rows queued across a hot swap are scored in one
+# group per snapshot, so a response never mixes versions.
+
+import asyncio
+
+import numpy as np
+
+from metrics import Histogram, SIZE_BUCKETS
+
+WAIT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50)
+
+
+class MicroBatcher:
+    def __init__(self, score_batch, max_batch=64, max_wait_ms=2.0):
+        self.score_batch = score_batch  # (model, (n, n_features) array) -> ((n,) probabilities, n explanations or None)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_size = Histogram(SIZE_BUCKETS)
+        self.queue_depth = Histogram(SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(WAIT_BUCKETS_MS)
+        self.batches = 0
+        self.errors = 0
+        self._queue = None
+        self._full = None
+        self._task = None
+
+    def _ensure_started(self):
+        # Created lazily so the queue binds to the worker's running event loop
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, model, features):
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((model, features, future, loop.time()))
+        if self._queue.qsize() >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            if self._queue.qsize() + 1 < self.max_batch:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [first]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.queue_depth.observe(len(batch) + self._queue.qsize())
+            self.batch_size.observe(len(batch))
+            now = loop.time()
+            groups = {}
+            for model, features, future, enqueued in batch:
+                self.queue_wait_ms.observe((now - enqueued) * 1000.0)
+                groups.setdefault(id(model), (model, []))[1].append((features, future))
+
+            # Almost always one group; two only while a hot swap is in flight
+            for model, rows in groups.values():
+                X = np.array([features for features, _ in rows], dtype=np.float64)
+                try:
+                    probs, explanations = await loop.run_in_executor(None, self.score_batch, model, X)
+                except Exception as e:
+                    self.errors += 1
+                    for _, future in rows:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.batches += 1
+                for (_, future), prob, explanation in zip(rows, probs.tolist(), explanations or [None] * len(rows)):
+                    if not future.done():
+                        future.set_result((prob, explanation))
+
+    def stats(self):
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'batches': self.batches,
+            'errors': self.errors,
+            'batch_size': self.batch_size.snapshot(),
+            'queue_depth': self.queue_depth.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot(),
+        }
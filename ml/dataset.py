@@ -0,0 +1,241 @@
+# dataset.py
+# Cached, typed columnar build of the training inputs
+#
+# Parsing the two source CSVs, coercing vitals and matching the complaints
+# happens once; the unified feature matrix and labels are written
+# as one .npy file per column with narrow dtypes, keyed on the sha256 of
+# the source files. Later runs memory-map the cache and only rebuild when
+# a source CSV changes.
+#
+# Layout:
+#   dataset_cache/
+#     <key>/manifest.json   <- source hashes, columns, dtypes, row count
+#     <key>/age.npy ...     <- one array per feature, plus high_priority.npy
+#
+# Usage: python dataset.py [--rebuild]
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import feature_spec
+from model_registry import file_sha256
+from symptoms import default_matcher
+
+DATA_DIR = os.getenv("ML_DATA_DIR", "../data_for_ml")
+CACHE_DIR = os.getenv("ML_DATASET_CACHE", "dataset_cache")
+SOURCES = ("synthetic_medical_triage.csv", "data.csv")
+MANIFEST_FILE = "manifest.json"
+LABEL = 'high_priority'
+
+# Bump when the build logic (or the symptom table) changes so existing caches are not reused
+BUILD_VERSION = 4
+
+# Vitals keep fractional medians; flags and counts fit in a byte
+DTYPES = {**feature_spec.DTYPES, LABEL: np.uint8}
+
+
+def combine_sources(data_dir=DATA_DIR):
+    """Parse the source CSVs into the unified (X, y) frames."""
+    # =============================================================================
+    # DATASET 1: Synthetic Medical Triage (18,000 samples)
+    # Features: age, heart_rate, sbp, spo2, temperature, symptom_count,
+    #           comorbid_count, previous_er_visits, arrival_mode, triage_level
+    # =============================================================================
+
+    print("\n📊 Loading synthetic_medical_triage.csv...")
+    df_synthetic = pd.read_csv(os.path.join(data_dir, "synthetic_medical_triage.csv"))
+    print(f"   Loaded {len(df_synthetic)} samples")
+    print(f"   Columns: {list(df_synthetic.columns)}")
+
+    # Map arrival_mode to numeric
+    df_synthetic['arrival_mode_num'] = df_synthetic['arrival_mode'].map({
+        'walk_in': 0,
+        'ambulance': 1
+    }).fillna(0)
+
+    # Triage level: 0=low, 1=medium, 2=high, 3=critical
+    # Convert to binary: 0,1 = low priority (0), 2,3 = high priority (1)
+    df_synthetic['high_priority'] = (df_synthetic['triage_level'] >= 2).astype(int)
+
+    print(f"   High priority distribution: {df_synthetic['high_priority'].value_counts().to_dict()}")
+
+    # =============================================================================
+    # DATASET 2: Real ER Data (1,267 samples with KTAS triage)
+    # KTAS: 1=Resuscitation, 2=Emergency, 3=Urgent, 4=Less Urgent, 5=Non-urgent
+    # =============================================================================
+
+    print("\n📊 Loading data.csv (real ER data with KTAS triage)...")
+    df_real = pd.read_csv(os.path.join(data_dir, "data.csv"), sep=';', encoding='latin-1')
+    print(f"   Loaded {len(df_real)} real emergency room cases")
+    print(f"   KTAS distribution: {df_real['KTAS_expert'].value_counts().sort_index().to_dict()}")
+
+    # Map KTAS to high priority (1,2,3 = high/critical; 4,5 = low priority)
+    df_real['high_priority'] = (df_real['KTAS_expert'] <= 3).astype(int)
+
+    # Extract vital signs (handle missing values)
+    df_real['Age'] = pd.to_numeric(df_real['Age'], errors='coerce')
+    df_real['HR'] = pd.to_numeric(df_real['HR'], errors='coerce')
+    df_real['SBP'] = pd.to_numeric(df_real['SBP'], errors='coerce')
+    df_real['Saturation'] = pd.to_numeric(df_real['Saturation'], errors='coerce')
+    df_real['BT'] = pd.to_numeric(df_real['BT'], errors='coerce')
+    df_real['RR'] = pd.to_numeric(df_real['RR'], errors='coerce')
+    df_real['NRS_pain'] = pd.to_numeric(df_real['NRS_pain'], errors='coerce')
+
+    # Injury indicator
+    df_real['is_injury'] = (df_real['Injury'] == 2).astype(int)  # 2 = injury in dataset
+
+    # Arrival mode (1=walk, 2=119 ambulance, 3=private, 4=transfer)
+    df_real['arrival_severity'] = df_real['Arrival mode'].map({
+        1: 0,  # walk = low
+        3: 0,  # private = low
+        2: 1,  # ambulance = high
+        4: 1   # transfer = high
+    }).fillna(0)
+
+    print(f"   High priority distribution: {df_real['high_priority'].value_counts().to_dict()}")
+
+    # =============================================================================
+    # COMBINE DATASETS - Create unified feature set
+    # =============================================================================
+
+    print("\n🔄 Combining datasets with unified features...")
+
+    # Features we'll use: feature_spec.FEATURES. Columns a source lacks
+    # (respiratory rate in the synthetic set, injury score in both) take the
+    # spec default.
+
+    # From synthetic dataset
+    X_synthetic = pd.DataFrame({
+        'age': df_synthetic['age'],
+        'hr': df_synthetic['heart_rate'],
+        'sbp': df_synthetic['systolic_blood_pressure'],
+        'spo2': df_synthetic['oxygen_saturation'],
+        'temp': df_synthetic['body_temperature'],
+        'chest_pain': (df_synthetic['pain_level'] >= 6).astype(int),  # High pain = potential chest pain
+        'breathless': (df_synthetic['oxygen_saturation'] < 94).astype(int),  # Low SpO2 = breathing issue
+        'comorbid': df_synthetic['chronic_disease_count'].clip(0, 2)
+    })
+    y_synthetic = df_synthetic['high_priority']
+
+    # From real ER dataset
+    # Detect chest pain and breathlessness from chief complaint (one automaton
+    # pass per distinct complaint, same synonym table as ml_service)
+    df_real['Chief_complain'] = df_real['Chief_complain'].fillna('')
+    flags = default_matcher().flag_matrix(df_real['Chief_complain'].tolist(), ['chest_pain', 'shortness_of_breath'])
+    df_real['chest_pain_detected'] = flags[:, 0]
+    df_real['breathless_detected'] = flags[:, 1]
+
+    X_real = pd.DataFrame({
+        'age': df_real['Age'],
+        'hr': df_real['HR'],
+        'sbp': df_real['SBP'],
+        'spo2': df_real['Saturation'],
+        'temp': df_real['BT'],
+        'rr': df_real['RR'],
+        'chest_pain': df_real['chest_pain_detected'],
+        'breathless': df_real['breathless_detected'],
+        'comorbid': df_real['is_injury']  # Using injury as comorbid indicator
+    })
+    y_real = df_real['high_priority']
+
+    # Fill missing values with medians from synthetic dataset (spec default if it has no such column)
+    for col in X_real.columns:
+        if X_real[col].isna().sum() > 0:
+            source = 'median' if col in X_synthetic else 'spec default'
+            median_val = X_synthetic[col].median() if col in X_synthetic else feature_spec.DEFAULTS[col]
+            X_real[col] = X_real[col].fillna(median_val)
+            print(f"   Filled {col} NaN with {source}: {median_val:.1f}")
+
+    # Combine datasets, in spec order
+    X_combined = pd.concat([X_synthetic, X_real], ignore_index=True)
+    X_combined = X_combined.reindex(columns=feature_spec.FEATURE_NAMES).fillna(feature_spec.DEFAULTS)
+    y_combined = pd.concat([y_synthetic, y_real], ignore_index=True)
+    return X_combined, y_combined
+
+
+def cache_key(data_dir=DATA_DIR):
+    sources = {name: file_sha256(os.path.join(data_dir, name)) for name in SOURCES}
+    h = hashlib.sha256(json.dumps({'build': BUILD_VERSION, 'sources': sources}, sort_keys=True).encode())
+    return h.hexdigest()[:16], sources
+
+
+def write_cache(X, y, key, sources, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    # Build in a temp dir and rename into place, like registry versions
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=cache_dir)
+    try:
+        columns = dict(X.items())
+        columns[LABEL] = y
+        for name, values in columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), values.to_numpy().astype(DTYPES[name]))
+        manifest = {
+            'key': key,
+            'build_version': BUILD_VERSION,
+            'sources': sources,
+            'features': list(X.columns),
+            'label': LABEL,
+            'dtypes': {name: np.dtype(DTYPES[name]).name for name in columns},
+            'n_rows': len(X),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        target = os.path.join(cache_dir, key)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Builds for older source versions are never read again
+    for name in os.listdir(cache_dir):
+        if name != key and not name.startswith('.'):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    return manifest
+
+
+def read_cache(key, cache_dir=CACHE_DIR, mmap=True):
+    path = os.path.join(cache_dir, key)
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+              for name in manifest['features'] + [manifest['label']]}
+    X = pd.DataFrame({name: arrays[name] for name in manifest['features']}, copy=False)
+    y = pd.Series(arrays[manifest['label']], name=manifest['label'], copy=False)
+    return X, y, manifest
+
+
+def load_dataset(data_dir=DATA_DIR, cache_dir=CACHE_DIR, rebuild=False):
+    """Return (X, y) for training, from the cache when the sources are unchanged."""
+    start = time.perf_counter()
+    key, sources = cache_key(data_dir)
+    if not rebuild and os.path.exists(os.path.join(cache_dir, key, MANIFEST_FILE)):
+        X, y, manifest = read_cache(key, cache_dir)
+        print(f"✓ Loaded cached dataset {key} ({manifest['n_rows']} rows) in "
+              f"{(time.perf_counter() - start)*1000:.1f} ms")
+        return X, y
+
+    print(f"🔄 Building dataset cache {key} from {', '.join(SOURCES)}...")
+    X, y = combine_sources(data_dir)
+    write_cache(X, y, key, sources, cache_dir)
+    X, y, _ = read_cache(key, cache_dir)
+    print(f"✓ Dataset cache written to '{os.path.join(cache_dir, key)}' in {time.perf_counter() - start:.2f}s")
+    return X, y
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cached training dataset")
+    parser.add_argument('--rebuild', action='store_true', help="ignore an existing cache")
+    args = parser.parse_args()
+    X, y = load_dataset(rebuild=args.rebuild)
+    print(f"   {len(X)} rows, features: {list(X.columns)}, high priority: {int(y.sum())}")
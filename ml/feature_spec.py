@@ -0,0 +1,161 @@
+# feature_spec.py
+# The triage model's input features, declared once for training and serving
+#
+# Column order, storage dtype, default for a missing column, the
+# plausible range and the typical mean / std of every feature. generate_and_train.py,
+# train_with_real_data.py (through dataset.py), test_model.py and ml_service
+# all build their matrices here, and ml_service checks each artifact
+# against the spec before serving it.
+#
+# Batch featurizers return C-contiguous (n, len(FEATURES)) float64 matrices
+# filled a column at a time instead of from one Python list per row.
+
+import operator
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+
+class Feature(NamedTuple):
+    name: str
+    dtype: type  # Narrowest dtype that holds the values (dataset cache columns)
+    default: Optional[float]  # Used when a source has no such column; None = required
+    low: float
+    high: float
+    mean: float  # Of the synthetic training distribution; for manifests without feature_stats
+    std: float
+    symptom: Optional[str] = None  # Flag derived from this canonical symptom (symptoms.SYNONYMS)
+
+
+FEATURES = (
+    Feature('age', np.float32, None, 0, 120, 45.5, 25.97),
+    Feature('hr', np.float32, None, 20, 250, 110.1, 34.95),
+    Feature('sbp', np.float32, None, 40, 300, 125.0, 32.0),
+    Feature('spo2', np.float32, None, 50, 100, 90.0, 6.05),
+    Feature('temp', np.float32, 37.0, 30.0, 45.0, 37.16, 0.99),
+    Feature('rr', np.float32, 16, 4, 60, 18.05, 5.47),
+    Feature('chest_pain', np.uint8, 0, 0, 1, 0.12, 0.326, symptom='chest_pain'),
+    Feature('breathless', np.uint8, 0, 0, 1, 0.12, 0.324, symptom='shortness_of_breath'),
+    Feature('comorbid', np.uint8, 0, 0, 2, 0.36, 0.591),
+    Feature('injury_score', np.uint8, 0, 0, 100, 6.24, 17.96),
+)
+FEATURE_NAMES = [f.name for f in FEATURES]
+DTYPES = {f.name: f.dtype for f in FEATURES}
+DEFAULTS = {f.name: f.default for f in FEATURES if f.default is not None}
+
+# Features read straight off a request object vs. derived from its symptoms
+_ATTR_COLS = [i for i, f in enumerate(FEATURES) if f.symptom is None]
+_SYMPTOM_COLS = [(i, f.symptom) for i, f in enumerate(FEATURES) if f.symptom is not None]
+_get_attrs = operator.attrgetter(*(FEATURES[i].name for i in _ATTR_COLS))
+_col_getters = [(i, operator.attrgetter(FEATURES[i].name)) for i in _ATTR_COLS]
+
+
+def from_frame(df):
+    """Feature matrix from a DataFrame (or dict of columns); absent columns take their default."""
+    n = len(df[next(iter(df.keys()))]) if len(df) else 0
+    X = np.empty((n, len(FEATURES)), dtype=np.float64)
+    for j, f in enumerate(FEATURES):
+        if f.name in df:
+            X[:, j] = df[f.name]
+        elif f.default is not None:
+            X[:, j] = f.default
+        else:
+            raise KeyError(f"Required feature '{f.name}' is missing")
+    return X
+
+
+def from_requests(reqs, found, symptom_index):
+    """Feature matrix for request objects with the spec's attributes.
+
+    `found` holds each request's matched symptom indices and `symptom_index`
+    maps canonical symptom names to those indices (symptoms.SymptomMatcher).
+    """
+    X = np.empty((len(reqs), len(FEATURES)), dtype=np.float64)
+    for j, get in _col_getters:
+        X[:, j] = list(map(get, reqs))
+    for j, symptom in _SYMPTOM_COLS:
+        idx = symptom_index[symptom]
+        X[:, j] = [idx in f for f in found]
+    return X
+
+
+def from_request(req, found, symptom_index):
+    """One request as a list in FEATURES order (the single-row /predict path)."""
+    row = list(_get_attrs(req))
+    # _SYMPTOM_COLS is ascending, so each insert lands at its final position
+    for j, symptom in _SYMPTOM_COLS:
+        row.insert(j, 1 if symptom_index[symptom] in found else 0)
+    return row
+
+
+def out_of_range(X):
+    """{feature: rows outside [low, high]} for the features with any."""
+    low = np.array([f.low for f in FEATURES])
+    high = np.array([f.high for f in FEATURES])
+    counts = ((X < low) | (X > high)).sum(axis=0)
+    return {f.name: int(c) for f, c in zip(FEATURES, counts) if c}
+
+
+def feature_stats(X):
+    """{feature: {'mean', 'std'}} of a training matrix, stored in the registry manifest."""
+    X = np.asarray(X, dtype=np.float64)
+    return {f.name: {'mean': round(float(m), 6), 'std': round(float(s), 6)}
+            for f, m, s in zip(FEATURES, X.mean(axis=0), X.std(axis=0))}
+
+
+def stats_arrays(stats=None):
+    """(mean, std) arrays in FEATURES order, looked up by name in feature_stats() output.
+
+    Features missing there (all of them for manifests written before
+    feature_stats) take the spec's mean / std. A zero std (constant
+    column) becomes 1, so standardizing never divides by zero.
+    """
+    stats = stats or {}
+    mean = np.array([stats.get(f.name, {}).get('mean', f.mean) for f in FEATURES], dtype=np.float64)
+    std = np.array([stats.get(f.name, {}).get('std', f.std) for f in FEATURES], dtype=np.float64)
+    std[std <= 0] = 1.0
+    return mean, std
+
+
+# A column with at least this share of rows at its spec default was mostly filled in, not measured
+MOSTLY_DEFAULT_SHARE = 0.9
+
+
+def signal_problems(X):
+    """{feature: problem} for training columns that carry no or little signal.
+
+    'constant' columns (one value in every row) are ignored by any model;
+    'mostly default' ones hold the spec default in MOSTLY_DEFAULT_SHARE of the
+    rows, as when most sources lack the column.
+    """
+    problems = {}
+    for j, f in enumerate(FEATURES):
+        column = X[:, j]
+        if len(column) and (column == column[0]).all():
+            problems[f.name] = f"constant ({column[0]:g} in every row)"
+        elif f.default is not None and len(column):
+            share = float((column == f.default).mean())
+            if share >= MOSTLY_DEFAULT_SHARE:
+                problems[f.name] = f"mostly default ({share:.0%} of rows are {f.default:g})"
+    return problems
+
+
+def artifact_problems(feature_names, model=None, scorer=None):
+    """Ways a model artifact disagrees with the spec; empty when it can be served."""
+    problems = []
+    if list(feature_names) != FEATURE_NAMES:
+        problems.append(f"declares features {list(feature_names)}, spec is {FEATURE_NAMES}")
+    names_in = getattr(model, 'feature_names_in_', None)
+    if names_in is not None and list(names_in) != FEATURE_NAMES:
+        problems.append(f"was fitted on columns {list(names_in)}")
+    n_in = getattr(model, 'n_features_in_', None)
+    if n_in is not None and n_in != len(FEATURES):
+        problems.append(f"was fitted on {n_in} features, spec has {len(FEATURES)}")
+    if scorer is not None:
+        n_scorer = getattr(scorer, 'n_features', None)
+        if n_scorer is not None and n_scorer != len(FEATURES):
+            problems.append(f"scorer takes {n_scorer} features, spec has {len(FEATURES)}")
+        used = getattr(scorer, 'feature', None)
+        if used is not None and len(used) and int(used.max()) >= len(FEATURES):
+            problems.append(f"scorer splits on feature index {int(used.max())}, spec has {len(FEATURES)}")
+    return problems
@@ -0,0 +1,265 @@
+# metrics.py
+# Minimal in-process metrics with Prometheus text exposition (no external dependencies)
+#
+# Metrics live in the process that records them; with serve.py each worker
+# keeps its own and a scrape of /metrics sees the worker that answered.
+
+import bisect
+import contextvars
+import threading
+import time
+
+# Power-of-two buckets for sizes and depths
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+# Seconds, from 10us up to the backend's 3s timeout
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 3.0)
+
+SCORE_BUCKETS = (10, 20, 30, 40, 50, 60, 70, 80, 85, 90, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus `le` semantics."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def observe_many(self, values):
+        # One lock round-trip for a whole batch of observations
+        idxs = [bisect.bisect_left(self.buckets, v) for v in values]
+        with self._lock:
+            for idx in idxs:
+                self.counts[idx] += 1
+            self.sum += float(sum(values))
+            self.count += len(idxs)
+
+    def cumulative(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        running = 0
+        bounds = []
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            bounds.append((bound, running))
+        return bounds, total, count
+
+    def snapshot(self):
+        bounds, total, count = self.cumulative()
+        buckets = {f"le_{bound:g}": n for bound, n in bounds}
+        buckets["le_inf"] = count
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'mean': round(total / count, 6) if count else 0.0,
+            'buckets': buckets,
+        }
+
+
+class _Family:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        return list(self._children.items())
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Family):
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, *labelvalues, amount=1):
+        self.labels(*labelvalues).inc(amount)
+
+
+class Gauge(_Family):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value, *labelvalues):
+        self.labels(*labelvalues).set(value)
+
+
+class HistogramFamily(_Family):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value, *labelvalues):
+        self.labels(*labelvalues).observe(value)
+
+    def observe_many(self, values, *labelvalues):
+        self.labels(*labelvalues).observe_many(values)
+
+
+def _label_str(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def render_histogram(name, labelnames, labelvalues, hist):
+    bounds, total, count = hist.cumulative()
+    lines = [
+        f"{name}_bucket{_label_str(labelnames, labelvalues, [('le', f'{b:g}')])} {n}"
+        for b, n in bounds
+    ]
+    lines.append(f"{name}_bucket{_label_str(labelnames, labelvalues, [('le', '+Inf')])} {count}")
+    lines.append(f"{name}_sum{_label_str(labelnames, labelvalues)} {total:.9g}")
+    lines.append(f"{name}_count{_label_str(labelnames, labelvalues)} {count}")
+    return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        return self._add(HistogramFamily(name, documentation, buckets, labelnames))
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def reset(self, *families):
+        """Drop the recorded samples of `families` (default: all); collectors are unaffected."""
+        for family in families or self._families:
+            with family._lock:
+                family._children.clear()
+
+    def collector(self, fn):
+        """Register fn() -> list of exposition lines, evaluated at scrape time."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for labelvalues, child in family.samples():
+                if family.type == 'histogram':
+                    lines.extend(render_histogram(family.name, family.labelnames, labelvalues, child))
+                else:
+                    lines.append(f"{family.name}{_label_str(family.labelnames, labelvalues)} {child.value:.9g}")
+        for fn in self._collectors:
+            lines.extend(fn())
+        return "\n".join(lines) + "\n"
+
+
+# Per-request stage timestamps, set by RequestMetricsMiddleware and
+# filled in by handlers through mark()
+_request_marks = contextvars.ContextVar('request_marks', default=None)
+
+
+def mark(stage):
+    marks = _request_marks.get()
+    if marks is not None:
+        marks[stage] = time.perf_counter()
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware: request counts, errors and per-stage latency.
+
+    Stages are derived from handler marks:
+      parse     request start -> 'handler' (routing, body read, validation)
+      featurize 'handler' -> 'featurized'
+      infer     'featurized' -> 'inferred'
+      respond   'inferred' -> response start (serialization)
+    """
+
+    STAGES = (('parse', 'start', 'handler'), ('featurize', 'handler', 'featurized'),
+              ('infer', 'featurized', 'inferred'), ('respond', 'inferred', 'response'))
+
+    def __init__(self, app, requests, errors, latency, stage_latency):
+        self.app = app
+        self.requests = requests
+        self.errors = errors
+        self.latency = latency
+        self.stage_latency = stage_latency
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        marks = {'start': time.perf_counter()}
+        token = _request_marks.set(marks)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                marks['response'] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_marks.reset(token)
+            end = time.perf_counter()
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            code = str(status[0])
+            self.requests.inc(path, code)
+            if status[0] >= 400:
+                self.errors.inc(path, code)
+            self.latency.labels(path).observe(end - marks['start'])
+            for stage, begin, finish in self.STAGES:
+                if begin in marks and finish in marks:
+                    self.stage_latency.labels(path, stage).observe(marks[finish] - marks[begin])
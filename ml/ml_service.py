@@ -1,12 +1,108 @@
 # ml_service.py
 # FastAPI service that serves triage predictions using the trained model
 
-from fastapi import FastAPI, HTTPException
+import time
+_import_start = time.perf_counter()  # Before the heavy imports, for startup timings
+
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import joblib
+import asyncio
+import json
+import numpy as np
 import os
-from typing import List
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import feature_spec
+import model_registry
+import metrics
+from coalescer import MicroBatcher
+from model_registry import RegistryError
+from online_learning import OnlineLearner
+from prediction_cache import PredictionCache
+from queue_engine import QueueEngine
+from sla_scheduler import SlaScheduler, parse_tiers
+from similar_cases import MAX_K, SimilarCases, priority_level
+from text_triage import TextTriage
+from scoring import build_scorer
+from symptoms import default_matcher
+from trends import TrendStore, adjust_probability, trend_shift
+
+# Feature order, shared with training through feature_spec.py
+FEATURE_NAMES = feature_spec.FEATURE_NAMES
+
+# Upper bound on rows accepted by /predict/batch in a single call
+MAX_BATCH_SIZE = int(os.getenv("ML_MAX_BATCH", 5000))
+
+# Repeat predictions (rechecks, recomputes, client retries); ML_CACHE_SIZE=0 disables
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv("ML_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("ML_CACHE_TTL", 300))
+)
+
+# Micro-batching of concurrent /predict calls (ML_COALESCE=1 enables)
+COALESCE = os.getenv("ML_COALESCE", "0") == "1"
+COALESCE_MAX_BATCH = int(os.getenv("ML_COALESCE_MAX_BATCH", 64))
+COALESCE_WAIT_MS = float(os.getenv("ML_COALESCE_WAIT_MS", 2))
+
+# Seconds between checks of the registry's ACTIVE marker; 0 disables the watcher
+WATCH_INTERVAL = float(os.getenv("ML_WATCH_INTERVAL", 5))
+
+# 'arrays' serves the memory-mapped compiled artifact when a version has one, 'pickle' forces joblib
+MODEL_FORMAT = os.getenv("ML_MODEL_FORMAT", "arrays")
+
+# Online learning from /feedback outcomes (ML_FEEDBACK=1 enables; needs ML_ADMIN_TOKEN); linear models only
+FEEDBACK = os.getenv("ML_FEEDBACK", "0") == "1"
+FEEDBACK_BATCH = int(os.getenv("ML_FEEDBACK_BATCH", 32))
+FEEDBACK_CHECKPOINT_ROWS = int(os.getenv("ML_FEEDBACK_CHECKPOINT_ROWS", 500))
+FEEDBACK_CHECKPOINT_SECONDS = float(os.getenv("ML_FEEDBACK_CHECKPOINT_SECONDS", 60))
+FEEDBACK_KEEP_VERSIONS = int(os.getenv("ML_FEEDBACK_KEEP_VERSIONS", 5))  # Inactive online checkpoints kept
+
+# Per-feature contributions in every prediction (ML_EXPLAIN=0 disables). Linear terms are
+# taken against the model's own training means, so they read as "vs. a typical patient"
+EXPLAIN = os.getenv("ML_EXPLAIN", "1") == "1"
+
+# Per-patient vitals trend windows behind /predict/trend
+trend_store = TrendStore(
+    max_patients=int(os.getenv("ML_TREND_MAX_PATIENTS", 10000)),
+    ttl=float(os.getenv("ML_TREND_TTL_HOURS", 24)) * 3600,
+    max_readings=int(os.getenv("ML_TREND_WINDOW", 6)),
+    max_minutes=float(os.getenv("ML_TREND_WINDOW_MINUTES", 240))
+)
+
+# Per-hospital patient queues behind /queue (the backend mirrors its writes here)
+queue_engine = QueueEngine(aging_per_minute=float(os.getenv("ML_QUEUE_AGING_PER_MIN", 0.1)))
+
+# SLA deadlines of the waiting patients, fed by the same writes; breaches are long-polled from /sla/breaches
+sla_scheduler = SlaScheduler(
+    tiers=parse_tiers(os.getenv("ML_SLA_TIERS", "85:10,60:20,0:30")),  # min score:minutes, ...
+    tick=float(os.getenv("ML_SLA_TICK_SECONDS", 1))
+)
+sla_wakeup = asyncio.Event()
+
+# Nearest historical cases behind /similar (ML_SIMILAR=0 disables); loaded in prepare()
+SIMILAR = os.getenv("ML_SIMILAR", "1") == "1"
+similar_index = None
+
+# Local specialty / urgency classifier for free-text symptoms behind /classify/symptoms
+# (ML_TEXT_TRIAGE=0 disables); loaded in prepare()
+TEXT_TRIAGE = os.getenv("ML_TEXT_TRIAGE", "1") == "1"
+text_model = None
+
+# Fast start (ML_FAST_START=0 disables): pickle-only artifacts are served through
+# model_registry's compiled-array cache, so restarts skip joblib and sklearn, and a
+# few requests are driven through the app before the worker reports ready
+FAST_START = os.getenv("ML_FAST_START", "1") == "1"
+WARMUP_ROUNDS = int(os.getenv("ML_WARMUP_ROUNDS", 20))
+
+# Required in the X-Admin-Token header of /admin/* calls, the queue / SLA writes and
+# similar-case inserts when set
+ADMIN_TOKEN = os.getenv("ML_ADMIN_TOKEN")
 
 class PredictRequest(BaseModel):
     age: int
@@ -16,14 +112,120 @@ class PredictRequest(BaseModel):
     temp: float = 37.0  # Default normal temperature
     rr: int = 16  # Default normal respiratory rate
     injury_score: int = 0  # New core feature
-    symptoms: List[str]
+    symptoms: List[str]  # Codes ('chest_pain') or free text ('SOB since morning')
+    complaint: Optional[str] = None  # Free-text chief complaint
     comorbid: int = 0
 
+    def symptom_texts(self):
+        return self.symptoms + [self.complaint] if self.complaint else self.symptoms
+
+class Contributions(BaseModel):
+    units: str  # 'log_odds' (linear, gradient boosting) or 'probability' (forests)
+    baseline: float  # Model output before any feature is considered
+    values: Dict[str, float]  # baseline + sum(values) = this prediction, in units
+
 class PredictResponse(BaseModel):
     probability: float
     triage_score: int
     method: str
     features_used: dict
+    symptoms_detected: List[str] = []
+    contributions: Optional[Contributions] = None
+
+class FeedbackItem(PredictRequest):
+    high_priority: int  # Clinician outcome: 1 = needed urgent care, 0 = did not
+
+class FeedbackRequest(BaseModel):
+    outcomes: List[FeedbackItem]
+
+class VitalsReading(BaseModel):
+    timestamp: datetime
+    hr: int
+    sbp: int
+    spo2: int
+    temp: float = 37.0
+    rr: int = 16
+
+class TrendPredictRequest(PredictRequest):
+    patient_id: str
+    timestamp: Optional[datetime] = None  # When these vitals were taken; defaults to now
+    # Earlier readings, oldest first. Only replayed when this worker has no
+    # (or stale) state for the patient; the last few are enough.
+    history: Optional[List[VitalsReading]] = None
+
+class TrendPredictResponse(PredictResponse):
+    patient_id: str
+    base_probability: float  # Snapshot model output before the trend shift
+    trend: dict  # readings, span_minutes, per-vital slope_per_hour / delta / std
+    trend_contributions: Dict[str, float]  # Log-odds added per worsening vital
+
+class ReloadRequest(BaseModel):
+    version: Optional[str] = None  # Activate this registry version first
+
+class BatchPredictRequest(BaseModel):
+    patients: List[PredictRequest]
+
+class QueuePatient(BaseModel):
+    patient_id: Union[int, str]
+    hospital_id: Union[int, str] = 1
+    triage_score: int
+    arrival_ts: Optional[datetime] = None  # Defaults to now
+    status: str = 'waiting'
+    data: Optional[dict] = None  # The patient row, returned as-is in queue pages
+
+class QueueUpdate(BaseModel):
+    triage_score: Optional[int] = None
+    status: Optional[str] = None
+    hospital_id: Optional[Union[int, str]] = None  # Transfer
+    data: Optional[dict] = None
+
+class QueueSyncRequest(BaseModel):
+    patients: List[QueuePatient]
+
+class CaseVitals(BaseModel):
+    age: int
+    hr: int
+    sbp: int
+    spo2: Optional[int] = None  # Unknown: matched on the other vitals
+    temp: float = 37.0
+    rr: int = 16
+
+    def row(self):
+        return [self.age, self.hr, self.sbp, self.spo2, self.temp, self.rr]
+
+class SimilarRequest(CaseVitals):
+    k: int = 5
+
+class SimilarBatchRequest(BaseModel):
+    patients: List[CaseVitals]
+    k: int = 5
+
+class SimilarCaseInsert(CaseVitals):
+    case_id: Union[int, str]  # Patient id; inserting the same id twice is a no-op
+    triage_score: Optional[int] = None  # Sets priority when that is not given
+    priority: Optional[str] = None
+    high_priority: Optional[bool] = None  # Defaults to priority CRITICAL or HIGH
+    summary: str = ''
+    disposition: str = ''
+
+class SymptomTextRequest(BaseModel):
+    text: str  # Free-text symptom description, e.g. the check-in custom_symptoms
+
+class BatchPredictResponse(BaseModel):
+    count: int
+    predictions: List[PredictResponse]
+
+# Synonym automaton shared with training (dataset.py); results are cached per text
+symptom_matcher = default_matcher()
+
+def build_feature_matrix(reqs: List[PredictRequest], found=None) -> np.ndarray:
+    """Build an (n, 10) float64 matrix in FEATURE_NAMES order, one column at a time.
+
+    `found` is the per-request symptom sets from symptom_matcher.match, when the caller already has them.
+    """
+    if found is None:
+        found = [symptom_matcher.match(r.symptom_texts()) for r in reqs]
+    return feature_spec.from_requests(reqs, found, symptom_matcher.index)
 
 app = FastAPI(
     title="HT-1 Triage ML Service",
@@ -31,6 +233,25 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Prometheus-style metrics, exposed on /metrics
+metrics_registry = metrics.MetricsRegistry()
+REQUESTS = metrics_registry.counter('ml_requests_total', 'HTTP requests by route and status', ('route', 'status'))
+ERRORS = metrics_registry.counter('ml_request_errors_total', 'HTTP responses with status >= 400', ('route', 'status'))
+LATENCY = metrics_registry.histogram('ml_request_latency_seconds', 'End-to-end request latency',
+                                     metrics.LATENCY_BUCKETS, ('route',))
+STAGE_LATENCY = metrics_registry.histogram('ml_stage_latency_seconds', 'Latency per stage: parse, featurize, infer, respond',
+                                           metrics.LATENCY_BUCKETS, ('route', 'stage'))
+PREDICTIONS = metrics_registry.counter('ml_predictions_total', 'Rows scored', ('route',))
+SCORES = metrics_registry.histogram('ml_triage_score', 'Distribution of returned triage scores', metrics.SCORE_BUCKETS)
+# Families fed by requests, cleared after warmup
+REQUEST_METRICS = (REQUESTS, ERRORS, LATENCY, STAGE_LATENCY, PREDICTIONS, SCORES)
+MODEL_LOAD_SECONDS = metrics_registry.gauge('ml_model_load_seconds', 'Duration of the last model load', ('version',))
+
+app.add_middleware(
+    metrics.RequestMetricsMiddleware,
+    requests=REQUESTS, errors=ERRORS, latency=LATENCY, stage_latency=STAGE_LATENCY
+)
+
 # CORS middleware for cross-origin requests
 app.add_middleware(
     CORSMiddleware,
@@ -40,78 +261,721 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load model at startup
-model = None
-model_path = 'triage_model.pkl'
+# Active model snapshot. A reload builds a complete new ActiveModel and swaps
+# the module reference, so request handlers read `active` once and never lock.
+class ActiveModel(NamedTuple):
+    model: object  # None when served from a memory-mapped array artifact
+    scorer: object
+    version: str
+    manifest: dict
+    load_seconds: float = 0.0
+    feature_mean: object = None  # Training mean / std in FEATURES order (feature_spec.stats_arrays)
+    feature_std: object = None
+
+active = None
+model_path = 'triage_model.pkl'  # Legacy single-file model, used when the registry is empty
+_reload_lock = threading.Lock()
+
+# Set by serve.py when running several forked workers: one shared slot per
+# worker, flipped to 1 once that worker has a model and is accepting requests
+worker_readiness = None
+expected_workers = 1
+worker_index = 0
+
+def check_features(manifest, model=None, scorer=None):
+    """Refuse artifacts that do not take feature_spec's columns, in its order."""
+    problems = feature_spec.artifact_problems(manifest.get('feature_names') or [], model, scorer)
+    if problems:
+        raise RegistryError(f"Model {manifest.get('version')} does not match the feature spec: {'; '.join(problems)}")
+
+def load_model_file(path, version='legacy', compiled_cache=None):
+    """Load a bare pickle; with compiled_cache, through model_registry.load_pickle_compiled."""
+    start = time.perf_counter()
+    if compiled_cache:
+        model, scorer, info = model_registry.load_pickle_compiled(path, compiled_cache)
+    else:
+        import joblib
+        model = joblib.load(path)
+        scorer = build_scorer(model)
+        names = getattr(model, 'feature_names_in_', None)
+        info = {'model_type': type(model).__name__, 'feature_names': list(names) if names is not None else None}
+    # Legacy files carry no manifest; sklearn records the columns of a DataFrame fit
+    manifest = {'version': version, 'model_type': info['model_type'],
+                'feature_names': info['feature_names'] or FEATURE_NAMES}
+    check_features(manifest, model, scorer)
+    return ActiveModel(model, scorer, version, manifest, time.perf_counter() - start,
+                       *feature_spec.stats_arrays())
+
+def load_registry_model(version):
+    start = time.perf_counter()
+    model, scorer, manifest = model_registry.load_version(
+        version, prefer_arrays=MODEL_FORMAT == 'arrays',
+        compiled_cache=model_registry.COMPILED_CACHE_DIR if FAST_START else None
+    )
+    scorer = scorer or build_scorer(model)
+    check_features(manifest, model, scorer)
+    return ActiveModel(model, scorer, version, manifest, time.perf_counter() - start,
+                       *feature_spec.stats_arrays(manifest.get('feature_stats')))
+
+def swap_model(new):
+    global active
+    active = new
+    # Entries are keyed by version, so this only frees memory held by the old model
+    prediction_cache.clear()
+    MODEL_LOAD_SECONDS.set(new.load_seconds, new.version)
+    print(f"✓ Model {new.version} active ({new.manifest.get('model_type')}, scorer: {new.scorer.kind}, "
+          f"loaded in {new.load_seconds*1000:.0f} ms)")
+
+def reload_model(version=None, force=False):
+    """Load the requested (or registry-active) version and swap it in."""
+    with _reload_lock:
+        if version is not None:
+            model_registry.set_active(version)
+        target = model_registry.active_version()
+        if target is None:
+            if not os.path.exists(model_path):
+                return None
+            if force or active is None:
+                cache = model_registry.COMPILED_CACHE_DIR if FAST_START and MODEL_FORMAT == 'arrays' else None
+                swap_model(load_model_file(model_path, compiled_cache=cache))
+            return active
+        if force or active is None or active.version != target:
+            swap_model(load_registry_model(target))
+        return active
+
+def _watch_registry():
+    last_mtime = model_registry.active_marker_mtime()
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        mtime = model_registry.active_marker_mtime()
+        if mtime == last_mtime:
+            continue
+        last_mtime = mtime
+        try:
+            reload_model()
+        except Exception as e:
+            print(f"⚠ Warning: model reload failed, keeping {active.version if active else 'no model'}: {e}")
+
+# Startup timings, reported by /health and /metrics. serve.py fills these in
+# the parent before forking, so workers inherit them along with the warm state.
+startup = {
+    'fast_start': FAST_START,
+    'import_seconds': None,
+    'load_seconds': None,
+    'warmup_seconds': None,
+    'warmup_first_request_ms': None,
+    'warmup_last_request_ms': None,
+    'ready_seconds': None,  # Process start -> ready, including interpreter startup
+    'sklearn_imported': None,
+}
+_warmed_version = None
+
+# Warmup bodies: a low-risk patient, a high-risk one, and free-text symptoms
+WARMUP_PATIENTS = [
+    {'age': 30, 'hr': 75, 'sbp': 120, 'spo2': 98, 'symptoms': []},
+    {'age': 78, 'hr': 135, 'sbp': 85, 'spo2': 88, 'temp': 39.2, 'rr': 28, 'symptoms': ['chest_pain'], 'comorbid': 2},
+    {'age': 52, 'hr': 98, 'sbp': 150, 'spo2': 94, 'symptoms': ['SOB since morning'], 'complaint': 'dizzy, chest tightness'},
+]
+
+def process_uptime():
+    """Seconds since this process started (Linux /proc), or None."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+async def _asgi_post(path, payload):
+    body = json.dumps(payload).encode()
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+    }
+    await app(scope, receive, send)
+    return status[0] if status else 500
+
+async def warmup(rounds=WARMUP_ROUNDS):
+    """Drive requests through the full ASGI stack so no real request pays first-call costs.
+
+    Routing, validation, the scorer, contributions and serialization all
+    run once here. The request metrics and the prediction cache are reset
+    afterwards, so warmup traffic never shows up in them; the model-load
+    gauge is kept.
+    """
+    global _warmed_version
+    if active is None or rounds <= 0:
+        return None
+    start = time.perf_counter()
+    saved_cache = prediction_cache.maxsize
+    prediction_cache.maxsize = 0
+    latencies = []
+    try:
+        for i in range(rounds):
+            patient = dict(WARMUP_PATIENTS[i % len(WARMUP_PATIENTS)], age=20 + i)
+            t0 = time.perf_counter()
+            status = await _asgi_post('/predict', patient)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if status != 200:
+                raise RuntimeError(f"warmup /predict returned {status}")
+        status = await _asgi_post('/predict/batch', {'patients': WARMUP_PATIENTS * 4})
+        if status != 200:
+            raise RuntimeError(f"warmup /predict/batch returned {status}")
+    finally:
+        prediction_cache.maxsize = saved_cache
+        metrics_registry.reset(*REQUEST_METRICS)
+    _warmed_version = active.version
+    startup.update({
+        'warmup_seconds': round(time.perf_counter() - start, 4),
+        'warmup_first_request_ms': round(latencies[0], 3),
+        'warmup_last_request_ms': round(latencies[-1], 3),
+    })
+    return startup
+
+async def prepare():
+    """Load (if needed) and warm the model, and open the similar-cases index and text model; fills in `startup`. Returns the active model."""
+    global similar_index, text_model
+    start = time.perf_counter()
+    try:
+        if reload_model() is None:
+            print(f"⚠ Warning: No model in registry '{model_registry.REGISTRY_DIR}' and '{model_path}' not found. Run generate_and_train.py first.")
+    except Exception as e:
+        print(f"⚠ Warning: Failed to load model: {e}")
+    if startup['load_seconds'] is None:
+        startup['load_seconds'] = round(time.perf_counter() - start, 4)
+    if FAST_START and active is not None and _warmed_version != active.version:
+        try:
+            # warmup() returns None when it skips (ML_WARMUP_ROUNDS=0) and leaves the timings unset
+            if await warmup() is not None:
+                print(f"✓ Warmed up in {startup['warmup_seconds']*1000:.0f} ms (first request "
+                      f"{startup['warmup_first_request_ms']:.1f} ms, last {startup['warmup_last_request_ms']:.2f} ms)")
+        except Exception as e:
+            print(f"⚠ Warning: warmup failed: {e}")
+    if SIMILAR and similar_index is None:
+        # Only a prebuilt index is memory-mapped; the CSVs are not needed (or shipped) to serve
+        try:
+            similar_index = await run_in_threadpool(SimilarCases.load)
+        except Exception as e:
+            print(f"⚠ WARNING: Similar-cases index unavailable ({e}). /similar returns 503.")
+    if TEXT_TRIAGE and text_model is None:
+        # Only a prebuilt model is loaded; training here would hold up readiness for seconds
+        try:
+            text_model = await run_in_threadpool(TextTriage.load)
+        except Exception as e:
+            print(f"⚠ WARNING: Text triage model unavailable ({e}). /classify/symptoms returns 503, "
+                  f"so check-in symptom text falls back to Groq.")
+    if startup['ready_seconds'] is None and active is not None:
+        startup['ready_seconds'] = round(process_uptime(), 4)
+        startup['sklearn_imported'] = 'sklearn' in sys.modules
+    return active
+
+async def _run_sla_clock():
+    """Advance the SLA wheel once per tick and wake the /sla/breaches long polls."""
+    global sla_wakeup
+    while True:
+        await asyncio.sleep(max(0.0, sla_scheduler.next_tick_at() - time.time()))
+        try:
+            fired = sla_scheduler.advance()
+        except Exception as e:
+            print(f"⚠ Warning: SLA clock failed: {e}")
+            # The failed tick is still due, so retrying at once would spin the event loop
+            await asyncio.sleep(1)
+            continue
+        if fired:
+            sla_wakeup.set()
+            sla_wakeup = asyncio.Event()
 
 @app.on_event("startup")
 async def load_model():
-    global model
-    if os.path.exists(model_path):
-        model = joblib.load(model_path)
-        print(f"✓ Model loaded from {model_path}")
+    await prepare()
+    app.state.sla_clock = asyncio.get_running_loop().create_task(_run_sla_clock())
+    if worker_readiness is not None and active is not None:
+        worker_readiness[worker_index] = 1
+    if WATCH_INTERVAL > 0:
+        threading.Thread(target=_watch_registry, name="registry-watcher", daemon=True).start()
+
+def require_model():
+    current = active
+    if current is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model not loaded. Please train the model first using generate_and_train.py"
+        )
+    return current
+
+def _score_active_batch(current, X):
+    # `current` is the snapshot the rows' requests took in require_model(), not the live global
+    return explain_rows(current, X)
+
+coalescer = MicroBatcher(_score_active_batch, COALESCE_MAX_BATCH, COALESCE_WAIT_MS) if COALESCE else None
+
+def explain_rows(current, X):
+    """(probabilities, explanations) for a feature matrix; explanations is None without a compiled scorer."""
+    scorer = current.scorer
+    if not EXPLAIN or not hasattr(scorer, 'explain'):
+        return scorer.predict_proba(X), None
+    # The explaining pass also yields the probabilities, so the model is only walked once
+    if scorer.kind == 'linear':
+        probs, baseline, contrib = scorer.explain(X, current.feature_mean)
     else:
-        print(f"⚠ Warning: Model file '{model_path}' not found. Run generate_and_train.py first.")
+        probs, baseline, contrib = scorer.explain(X)
+    units = scorer.units
+    explanations = [
+        {'units': units, 'baseline': b, 'values': dict(zip(FEATURE_NAMES, c))}
+        for b, c in zip(np.round(baseline, 6).tolist(), np.round(contrib, 6).tolist())
+    ]
+    return probs, explanations
+
+async def score_features(current, row):
+    """(probability, explanation or None) for one feature row."""
+    if coalescer is not None:
+        # The batch's single explaining pass yields this row's explanation too
+        return await coalescer.submit(current, row)
+    if current.scorer.kind == 'sklearn':
+        # sklearn's predict_proba is too slow to run on the event loop
+        return await run_in_threadpool(current.scorer.predict_one, row), None
+    if EXPLAIN:
+        probs, explanations = explain_rows(current, np.asarray([row], dtype=np.float64))
+        return float(probs[0]), explanations[0]
+    return current.scorer.predict_one(row), None
+
+def _publish_online(model, metrics, activate, feature_stats):
+    version = model_registry.publish(model, FEATURE_NAMES, metrics=metrics, activate=activate,
+                                     feature_stats=feature_stats)
+    if activate:
+        reload_model()
+    _prune_online_versions()
+    return version
+
+def _prune_online_versions():
+    """Delete all but the newest FEEDBACK_KEEP_VERSIONS online checkpoints (never the active one)."""
+    current = model_registry.active_version()
+    online = [v for v in model_registry.list_versions()
+              if v != current and 'online_base_version' in model_registry.read_manifest(v).get('metrics', {})]
+    for version in online[:max(len(online) - FEEDBACK_KEEP_VERSIONS, 0)]:
+        try:
+            model_registry.delete_version(version)
+        except (RegistryError, OSError) as e:
+            print(f"⚠ Warning: could not prune online version {version}: {e}")
+
+learner = OnlineLearner(
+    FEATURE_NAMES, lambda: active, _publish_online, batch_size=FEEDBACK_BATCH,
+    checkpoint_rows=FEEDBACK_CHECKPOINT_ROWS, checkpoint_seconds=FEEDBACK_CHECKPOINT_SECONDS
+) if FEEDBACK else None
+
+@metrics_registry.collector
+def _collect_runtime():
+    lines = [
+        "# HELP ml_model_info Active model version",
+        "# TYPE ml_model_info gauge",
+    ]
+    if active is not None:
+        lines.append(f'ml_model_info{{version="{active.version}",scorer="{active.scorer.kind}"}} 1')
+    cache = prediction_cache.stats()
+    lines += [
+        "# HELP ml_cache_events_total Prediction cache lookups and removals",
+        "# TYPE ml_cache_events_total counter",
+    ] + [f'ml_cache_events_total{{event="{e}"}} {cache[e]}' for e in ('hits', 'misses', 'evictions', 'expirations')] + [
+        "# HELP ml_cache_size Entries in the prediction cache",
+        "# TYPE ml_cache_size gauge",
+        f"ml_cache_size {cache['size']}",
+    ]
+    if learner is not None:
+        stats = learner.stats()
+        lines += [
+            "# HELP ml_feedback_rows_total Feedback rows learned from, dropped, or skipped",
+            "# TYPE ml_feedback_rows_total counter",
+        ] + [f'ml_feedback_rows_total{{outcome="{o}"}} {stats[k]}' for o, k in
+             (('learned', 'rows_seen'), ('dropped', 'dropped'), ('skipped', 'skipped_non_linear'))] + [
+            "# HELP ml_feedback_checkpoints_total Online model checkpoints published",
+            "# TYPE ml_feedback_checkpoints_total counter",
+            f"ml_feedback_checkpoints_total {stats['checkpoints']}",
+            "# HELP ml_feedback_checkpoints_activated_total Online checkpoints that passed the holdout check",
+            "# TYPE ml_feedback_checkpoints_activated_total counter",
+            f"ml_feedback_checkpoints_activated_total {stats['activated']}",
+        ]
+    trends = trend_store.stats()
+    queue = queue_engine.stats()
+    sla = sla_scheduler.stats()
+    similar = similar_index.stats() if similar_index is not None else None
+    phases = [p for p in ('import', 'load', 'warmup', 'ready') if startup[f'{p}_seconds'] is not None]
+    lines += [
+        "# HELP ml_startup_seconds Startup phase durations (ready: process start to ready)",
+        "# TYPE ml_startup_seconds gauge",
+    ] + [f'ml_startup_seconds{{phase="{p}"}} {startup[f"{p}_seconds"]:.6g}' for p in phases] + [
+        "# HELP ml_trend_patients Patients with trend state in this process",
+        "# TYPE ml_trend_patients gauge",
+        f"ml_trend_patients {trends['patients']}",
+        "# HELP ml_trend_updates_total Readings added to trend windows",
+        "# TYPE ml_trend_updates_total counter",
+        f"ml_trend_updates_total {trends['updates']}",
+        "# HELP ml_queue_patients Patients in the queue engine by status",
+        "# TYPE ml_queue_patients gauge",
+    ] + [f'ml_queue_patients{{status="{s}"}} {queue["by_status"].get(s, 0)}' for s in queue_engine.statuses] + [
+        "# HELP ml_queue_operations_total Queue engine writes",
+        "# TYPE ml_queue_operations_total counter",
+        f"ml_queue_operations_total {queue['operations']}",
+        "# HELP ml_sla_scheduled Waiting patients with a pending SLA deadline",
+        "# TYPE ml_sla_scheduled gauge",
+        f"ml_sla_scheduled {sla['scheduled']}",
+        "# HELP ml_sla_breaches_total SLA breaches fired",
+        "# TYPE ml_sla_breaches_total counter",
+        f"ml_sla_breaches_total {sla['fired']}",
+        "# HELP ml_sla_max_late_seconds Longest delay between a deadline and its breach event",
+        "# TYPE ml_sla_max_late_seconds gauge",
+        f"ml_sla_max_late_seconds {sla['max_late_seconds']}",
+    ]
+    if similar is not None:
+        lines += [
+            "# HELP ml_similar_cases Cases in the similar-cases index (delta: inserted since the last rebuild)",
+            "# TYPE ml_similar_cases gauge",
+            f'ml_similar_cases{{part="tree"}} {similar["cases"] - similar["delta"]}',
+            f'ml_similar_cases{{part="delta"}} {similar["delta"]}',
+            "# HELP ml_similar_inserts_total Live cases inserted into the similar-cases index",
+            "# TYPE ml_similar_inserts_total counter",
+            f"ml_similar_inserts_total {similar['inserts']}",
+        ]
+    if coalescer is not None:
+        for name, hist in (('batch_size', coalescer.batch_size), ('queue_depth', coalescer.queue_depth),
+                           ('queue_wait_ms', coalescer.queue_wait_ms)):
+            lines += [f"# HELP ml_coalescer_{name} Micro-batcher {name.replace('_', ' ')}",
+                      f"# TYPE ml_coalescer_{name} histogram"]
+            lines += metrics.render_histogram(f"ml_coalescer_{name}", (), (), hist)
+    return lines
+
+def require_admin(token):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
 
 @app.get("/")
 def root():
     return {
         "service": "HT-1 Triage ML Service",
         "status": "running",
-        "model_loaded": model is not None
+        "model_loaded": active is not None
     }
 
 @app.get("/health")
 def health():
     return {
         "status": "healthy",
-        "model_loaded": model is not None
+        "model_loaded": active is not None,
+        "model_version": active.version if active is not None else None,
+        "scorer": active.scorer.kind if active is not None else None,
+        "cache": prediction_cache.stats(),
+        "coalescer": coalescer.stats() if coalescer is not None else None,
+        "feedback": learner.stats() if learner is not None else None,
+        "startup": startup,
+        "trends": trend_store.stats(),
+        "queue": queue_engine.stats(),
+        "sla": sla_scheduler.stats(),
+        "similar": similar_index.stats() if similar_index is not None else None,
+        "text_triage": text_model.stats() if text_model is not None else None
     }
 
-@app.post("/predict", response_model=PredictResponse)
-def predict(req: PredictRequest):
-    if model is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Model not loaded. Please train the model first using generate_and_train.py"
-        )
-    
-    # Extract features in the correct order (must match training order)
-    # Order: age, hr, sbp, spo2, temp, rr, chest_pain, breathless, comorbid, injury_score
-    chest_pain = 1 if 'chest_pain' in req.symptoms else 0
-    breathless = 1 if 'shortness_of_breath' in req.symptoms else 0
+@app.get("/ready")
+def ready():
+    # Only ready once every worker (not just the one answering) has the model
+    if worker_readiness is not None:
+        ready_workers = sum(worker_readiness[:])
+    else:
+        ready_workers = int(active is not None)
+    body = {
+        "ready": active is not None and ready_workers >= expected_workers,
+        "ready_workers": ready_workers,
+        "expected_workers": expected_workers,
+        "model_version": active.version if active is not None else None
+    }
+    if not body["ready"]:
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
+async def score_request(req: PredictRequest, route, observe=True):
+    """Score one patient snapshot; shared by /predict and /predict/trend."""
+    current = require_model()
     
-    features = [[
-        req.age,
-        req.hr,
-        req.sbp,
-        req.spo2,
-        req.temp,
-        req.rr,
-        chest_pain,
-        breathless,
-        req.comorbid,
-        req.injury_score
-    ]]
+    # Features in training order (feature_spec.FEATURES)
+    found = symptom_matcher.match(req.symptom_texts())
+    features = [feature_spec.from_request(req, found, symptom_matcher.index)]
     
-    # Get probability
-    prob = model.predict_proba(features)[0][1]
+    # Get probability (cached on the quantized feature tuple)
+    metrics.mark('featurized')
+    key = None
+    cached = None
+    if prediction_cache.enabled:
+        key = (current.version,) + PredictionCache.make_key(features[0])
+        cached = prediction_cache.get(key)
+    if cached is None:
+        cached = await score_features(current, features[0])
+        if key is not None:
+            prediction_cache.put(key, cached)
+    prob, explanation = cached
     score = int(round(prob * 100))
+    metrics.mark('inferred')
+    PREDICTIONS.inc(route)
+    if observe:
+        SCORES.observe(score)
     
     # Feature contributions for explainability
-    # Feature contributions for explainability
-    feature_names = ['age', 'hr', 'sbp', 'spo2', 'temp', 'rr', 'chest_pain', 'breathless', 'comorbid', 'injury_score']
     features_used = {
-        name: float(val) for name, val in zip(feature_names, features[0])
+        name: float(val) for name, val in zip(FEATURE_NAMES, features[0])
     }
     
     return {
         'probability': float(prob),
         'triage_score': score,
         'method': 'ml',
-        'features_used': features_used
+        'features_used': features_used,
+        'symptoms_detected': symptom_matcher.names_of(found),
+        'contributions': explanation
     }
 
+@app.post("/predict", response_model=PredictResponse)
+async def predict(req: PredictRequest):
+    metrics.mark('handler')
+    return await score_request(req, '/predict')
+
+@app.post("/predict/trend", response_model=TrendPredictResponse)
+async def predict_trend(req: TrendPredictRequest):
+    """Score a recheck: update the patient's trend window with this reading and
+    shift the snapshot probability by the worsening trends."""
+    metrics.mark('handler')
+    timestamp = req.timestamp.timestamp() if req.timestamp is not None else time.time()
+    history = [(r.timestamp.timestamp(), (r.hr, r.sbp, r.spo2, r.rr, r.temp)) for r in req.history or ()]
+    try:
+        trend = trend_store.update(req.patient_id, timestamp, (req.hr, req.sbp, req.spo2, req.rr, req.temp), history)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await score_request(req, '/predict/trend', observe=False)
+    shift, trend_contributions = trend_shift(trend)
+    prob = adjust_probability(result['probability'], shift) if shift else result['probability']
+    SCORES.observe(int(round(prob * 100)))
+    result.update({
+        'patient_id': req.patient_id,
+        'base_probability': result['probability'],
+        'probability': prob,
+        'triage_score': int(round(prob * 100)),
+        'method': 'ml+trend' if shift else 'ml',
+        'trend': trend,
+        'trend_contributions': trend_contributions
+    })
+    return result
+
+@app.delete("/trend/{patient_id}")
+def delete_trend(patient_id: str):
+    """Drop a patient's trend state (discharge, or a chart correction)."""
+    return {"patient_id": patient_id, "removed": trend_store.discard(patient_id)}
+
+@app.post("/predict/batch", response_model=BatchPredictResponse)
+def predict_batch(req: BatchPredictRequest):
+    metrics.mark('handler')
+    current = require_model()
+    if len(req.patients) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(req.patients)} rows (max {MAX_BATCH_SIZE})"
+        )
+    if not req.patients:
+        return {'count': 0, 'predictions': []}
+
+    # One feature matrix and one predict_proba call for the whole batch
+    found = [symptom_matcher.match(p.symptom_texts()) for p in req.patients]
+    X = build_feature_matrix(req.patients, found)
+    metrics.mark('featurized')
+    probs, explanations = explain_rows(current, X)
+    scores = np.rint(probs * 100).astype(int)
+    metrics.mark('inferred')
+    PREDICTIONS.inc('/predict/batch', amount=len(scores))
+    SCORES.observe_many(scores.tolist())
+
+    predictions = [
+        {
+            'probability': float(prob),
+            'triage_score': int(score),
+            'method': 'ml',
+            'features_used': dict(zip(FEATURE_NAMES, row)),
+            'symptoms_detected': symptom_matcher.names_of(symptoms),
+            'contributions': explanation
+        }
+        for prob, score, row, symptoms, explanation in zip(
+            probs.tolist(), scores.tolist(), X.tolist(), found, explanations or [None] * len(found)
+        )
+    ]
+    return {'count': len(predictions), 'predictions': predictions}
+
+@app.post("/feedback", status_code=202)
+def feedback(req: FeedbackRequest, x_admin_token: Optional[str] = Header(None)):
+    if learner is None:
+        raise HTTPException(status_code=404, detail="Online learning is disabled (set ML_FEEDBACK=1)")
+    # Feedback can change the served model, so it is never open
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Set ML_ADMIN_TOKEN to accept feedback")
+    require_admin(x_admin_token)
+    if len(req.outcomes) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(req.outcomes)} rows (max {MAX_BATCH_SIZE})"
+        )
+    # Only featurize and enqueue here; the learner thread does the fitting
+    X = build_feature_matrix(req.outcomes)
+    accepted = learner.submit(X, [1 if o.high_priority else 0 for o in req.outcomes])
+    return {"accepted": accepted, "dropped": len(req.outcomes) - accepted, "queued": learner.stats()['queued']}
+
+def _queue_arrival(p: QueuePatient):
+    return p.arrival_ts.timestamp() if p.arrival_ts is not None else time.time()
+
+@app.get("/queue")
+def get_queue(status: str = 'waiting', hospital_id: Optional[str] = None, page: int = 1, limit: int = 10):
+    """A page of a hospital's queue (all hospitals without hospital_id) with its stats."""
+    if page < 1 or limit < 1:
+        raise HTTPException(status_code=400, detail="page and limit must be >= 1")
+    try:
+        result = queue_engine.page(hospital_id, status, page, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result['synced'] = queue_engine.synced
+    return result
+
+@app.put("/queue/patients")
+def put_queue_patient(p: QueuePatient, x_admin_token: Optional[str] = Header(None)):
+    """Add a patient, or replace their entry (check-in, or any full row update)."""
+    require_admin(x_admin_token)
+    arrival = _queue_arrival(p)
+    queued = queue_engine.upsert(p.patient_id, p.hospital_id, p.triage_score, arrival, p.status, p.data)
+    sla_scheduler.track(p.patient_id, p.hospital_id, p.triage_score, arrival, p.status)
+    return {"patient_id": str(p.patient_id), "queued": queued}
+
+@app.patch("/queue/patients/{patient_id}")
+def patch_queue_patient(patient_id: str, req: QueueUpdate, x_admin_token: Optional[str] = Header(None)):
+    """Rescore, change status and/or transfer a queued patient."""
+    require_admin(x_admin_token)
+    queued = queue_engine.update(patient_id, score=req.triage_score, status=req.status,
+                                 hospital_id=req.hospital_id, data=req.data)
+    entry = queue_engine.get(patient_id)
+    if entry is not None:
+        sla_scheduler.track(patient_id, *entry)
+    else:
+        sla_scheduler.forget(patient_id)
+    return {"patient_id": patient_id, "queued": queued}
+
+@app.delete("/queue/patients/{patient_id}")
+def delete_queue_patient(patient_id: str, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    sla_scheduler.forget(patient_id)
+    return {"patient_id": patient_id, "removed": queue_engine.remove(patient_id)}
+
+@app.post("/queue/sync")
+def sync_queue(req: QueueSyncRequest, x_admin_token: Optional[str] = Header(None)):
+    """Replace the engine's contents with a snapshot of the queued patients."""
+    require_admin(x_admin_token)
+    rows = [(p.patient_id, p.hospital_id, p.triage_score, _queue_arrival(p), p.status, p.data) for p in req.patients]
+    count = queue_engine.replace(rows)
+    sla_scheduler.replace(row[:5] for row in rows)
+    return {"queued": count, "received": len(req.patients)}
+
+@app.get("/sla/breaches")
+async def sla_breaches(after: int = 0, stream_id: Optional[str] = None, timeout: float = 25):
+    """Breach events with seq > after, waiting up to `timeout` seconds for the next one.
+
+    Pass back the stream_id of the previous answer: after a restart the
+    sequence starts over, and a stale stream_id gets the log from the start.
+    """
+    if stream_id != sla_scheduler.stream_id:
+        after = 0
+    events = sla_scheduler.events_after(after)
+    if not events and timeout > 0:
+        try:
+            await asyncio.wait_for(sla_wakeup.wait(), min(timeout, 60))
+        except asyncio.TimeoutError:
+            pass
+        events = sla_scheduler.events_after(after)
+    return {"stream_id": sla_scheduler.stream_id, "last_seq": sla_scheduler.last_seq, "events": events}
+
+def require_similar():
+    index = similar_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="Similar-cases index not loaded")
+    return index
+
+def similar_results(neighbours):
+    return [{'distance': round(distance, 4), **case} for distance, case in neighbours]
+
+@app.post("/similar")
+def similar(req: SimilarRequest):
+    """The k (at most MAX_K) historical or live cases nearest to these vitals, closest first."""
+    index = require_similar()
+    return {"k": min(max(req.k, 1), MAX_K), "cases": similar_results(index.search(req.row(), req.k)[0])}
+
+@app.post("/similar/batch")
+def similar_batch(req: SimilarBatchRequest):
+    index = require_similar()
+    if len(req.patients) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size {len(req.patients)} exceeds limit of {MAX_BATCH_SIZE}")
+    if not req.patients:
+        return {"count": 0, "results": []}
+    found = index.search([p.row() for p in req.patients], req.k)
+    return {"count": len(found), "results": [similar_results(neighbours) for neighbours in found]}
+
+@app.post("/similar/cases")
+def similar_insert(req: SimilarCaseInsert, x_admin_token: Optional[str] = Header(None)):
+    """Add an arriving patient to the index; later /similar queries can return it."""
+    require_admin(x_admin_token)
+    index = require_similar()
+    priority = req.priority or (priority_level(req.triage_score) if req.triage_score is not None else '')
+    high_priority = req.high_priority if req.high_priority is not None else priority in ('CRITICAL', 'HIGH')
+    inserted = index.insert(req.row(), req.case_id, priority=priority, high_priority=high_priority,
+                            summary=req.summary, disposition=req.disposition)
+    return {"inserted": inserted, "case_id": str(req.case_id), "index": index.stats()}
+
+@app.post("/classify/symptoms")
+def classify_symptoms(req: SymptomTextRequest):
+    """Urgency boost, severity and specialty for a symptom text, from the local text model."""
+    model = text_model
+    if model is None:
+        raise HTTPException(status_code=503, detail="Text triage model not loaded")
+    if not req.text.strip():
+        raise HTTPException(status_code=400, detail="Empty symptom text")
+    return model.classify(req.text)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/models")
+def admin_models(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return {
+        "active_version": active.version if active is not None else None,
+        "versions": [model_registry.read_manifest(v) for v in model_registry.list_versions()]
+    }
+
+@app.post("/admin/reload")
+def admin_reload(req: Optional[ReloadRequest] = None, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    try:
+        current = reload_model(version=req.version if req else None, force=True)
+    except RegistryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if current is None:
+        raise HTTPException(status_code=404, detail="No model available to load")
+    return {"status": "reloaded", "model_version": current.version, "manifest": current.manifest}
+
+startup['import_seconds'] = round(time.perf_counter() - _import_start, 4)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("ML_PORT", 8000))
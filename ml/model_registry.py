@@ -0,0 +1,215 @@
+# model_registry.py
+# Versioned model registry shared by the training scripts and ml_service
+#
+# Layout:
+#   models/
+#     ACTIVE              <- name of the version being served
+#     v1/manifest.json    <- feature order, metrics, scorer spec, sha256 per file
+#     v1/coef.npy ...     <- compiled scorer arrays (loaded with mmap, no pickle)
+#     v1/model.pkl        <- sklearn estimator, for models without a compiled scorer
+#     v2/...
+#
+# Pickle-only artifacts (older versions, the legacy triage_model.pkl) can be
+# compiled once into compiled_cache/<sha256>/, so later cold starts
+# memory-map arrays instead of importing joblib and sklearn.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from scoring import SklearnScorer, build_scorer, load_scorer, save_scorer
+
+REGISTRY_DIR = os.getenv("ML_REGISTRY_DIR", "models")
+COMPILED_CACHE_DIR = os.getenv("ML_COMPILED_CACHE", "compiled_cache")
+ACTIVE_FILE = "ACTIVE"
+MODEL_FILE = "model.pkl"
+MANIFEST_FILE = "manifest.json"
+
+
+class RegistryError(Exception):
+    pass
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = [
+        name for name in os.listdir(registry_dir)
+        if name.startswith('v') and name[1:].isdigit()
+        and os.path.exists(os.path.join(registry_dir, name, MANIFEST_FILE))
+    ]
+    return sorted(versions, key=lambda v: int(v[1:]))
+
+
+def active_version(registry_dir=REGISTRY_DIR):
+    path = os.path.join(registry_dir, ACTIVE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+def active_marker_mtime(registry_dir=REGISTRY_DIR):
+    try:
+        return os.stat(os.path.join(registry_dir, ACTIVE_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def set_active(version, registry_dir=REGISTRY_DIR):
+    if version not in list_versions(registry_dir):
+        raise RegistryError(f"Unknown model version '{version}'")
+    # Write-then-rename so readers never see a half-written marker
+    tmp = os.path.join(registry_dir, f".{ACTIVE_FILE}.tmp")
+    with open(tmp, 'w') as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(registry_dir, ACTIVE_FILE))
+
+
+def read_manifest(version, registry_dir=REGISTRY_DIR):
+    path = os.path.join(registry_dir, version, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise RegistryError(f"Unknown model version '{version}'")
+    with open(path) as f:
+        return json.load(f)
+
+
+def publish(model, feature_names, metrics=None, registry_dir=REGISTRY_DIR, activate=True,
+            include_pickle=True, feature_stats=None):
+    """Store a fitted model as the next version and (by default) make it active.
+
+    Compiled scorers are always exported as raw arrays; the pickle is kept
+    alongside unless include_pickle is False. feature_stats (per-feature
+    training mean / std, feature_spec.feature_stats) go into the manifest
+    as the reference for explanations.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    existing = list_versions(registry_dir)
+    version = f"v{int(existing[-1][1:]) + 1 if existing else 1}"
+
+    # Build the version in a temp dir, then rename it into place
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=registry_dir)
+    try:
+        scorer = build_scorer(model)
+        scorer_spec = None
+        if not isinstance(scorer, SklearnScorer):
+            scorer_spec = save_scorer(scorer, staging)
+        if include_pickle or scorer_spec is None:
+            import joblib
+            joblib.dump(model, os.path.join(staging, MODEL_FILE))
+        manifest = {
+            'version': version,
+            'model_type': type(model).__name__,
+            'feature_names': list(feature_names),
+            'metrics': metrics or {},
+            'feature_stats': feature_stats,
+            'scorer': scorer_spec,
+            'files': {
+                name: file_sha256(os.path.join(staging, name))
+                for name in sorted(os.listdir(staging))
+            },
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, os.path.join(registry_dir, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if activate:
+        set_active(version, registry_dir)
+    return version
+
+
+def delete_version(version, registry_dir=REGISTRY_DIR):
+    if version == active_version(registry_dir):
+        raise RegistryError(f"Cannot delete the active version '{version}'")
+    if version not in list_versions(registry_dir):
+        raise RegistryError(f"Unknown model version '{version}'")
+    shutil.rmtree(os.path.join(registry_dir, version))
+
+
+def verify_files(version, manifest, registry_dir=REGISTRY_DIR):
+    # Manifests written before array export only carried the pickle's hash
+    files = manifest.get('files') or {MODEL_FILE: manifest['sha256']}
+    for name, digest in files.items():
+        if file_sha256(os.path.join(registry_dir, version, name)) != digest:
+            raise RegistryError(f"Model {version}: '{name}' does not match its manifest hash")
+
+
+def load_version(version, registry_dir=REGISTRY_DIR, prefer_arrays=True, mmap=True, compiled_cache=None):
+    """Load a version after checking its files against the manifest.
+
+    Returns (model, scorer, manifest). When the version has a compiled
+    array artifact (and prefer_arrays is set) the arrays are memory-mapped
+    and model is None; otherwise the pickle is loaded and scorer is None.
+    With compiled_cache set, a pickle-only version goes through
+    load_pickle_compiled instead.
+    """
+    manifest = read_manifest(version, registry_dir)
+    verify_files(version, manifest, registry_dir)
+    version_dir = os.path.join(registry_dir, version)
+    model_path = os.path.join(version_dir, MODEL_FILE)
+    if manifest.get('scorer') and (prefer_arrays or not os.path.exists(model_path)):
+        return None, load_scorer(version_dir, manifest['scorer'], mmap=mmap), manifest
+    if prefer_arrays and compiled_cache:
+        digest = (manifest.get('files') or {MODEL_FILE: manifest['sha256']})[MODEL_FILE]
+        model, scorer, _ = load_pickle_compiled(model_path, compiled_cache, digest, mmap)
+        return model, scorer, manifest
+    import joblib
+    return joblib.load(model_path), None, manifest
+
+
+def load_pickle_compiled(path, cache_dir=COMPILED_CACHE_DIR, sha256=None, mmap=True):
+    """Load a pickled model through the compiled-array cache.
+
+    Returns (model, scorer, info). On a cache hit model is None and neither
+    joblib nor sklearn is imported. On a miss the pickle is loaded, and a
+    compilable model is written to the cache for next time. info holds
+    model_type and the fitted feature_names / n_features_in.
+    """
+    key = (sha256 or file_sha256(path))[:16]
+    target = os.path.join(cache_dir, key)
+    manifest_path = os.path.join(target, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            info = json.load(f)
+        return None, load_scorer(target, info['scorer'], mmap=mmap), info
+
+    import joblib
+    model = joblib.load(path)
+    scorer = build_scorer(model)
+    names = getattr(model, 'feature_names_in_', None)
+    info = {
+        'model_type': type(model).__name__,
+        'feature_names': list(names) if names is not None else None,
+        'n_features_in': int(model.n_features_in_) if hasattr(model, 'n_features_in_') else None,
+        'source': os.path.abspath(path),
+    }
+    if isinstance(scorer, SklearnScorer):
+        return model, scorer, info
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=cache_dir)
+    try:
+        info['scorer'] = save_scorer(scorer, staging)
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(info, f, indent=2)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+    except OSError:
+        # A read-only filesystem only costs the next start a recompile
+        shutil.rmtree(staging, ignore_errors=True)
+    return model, scorer, info
@@ -0,0 +1,230 @@
+# online_learning.py
+# Incremental updates of the linear triage model from clinician outcomes
+#
+# /feedback only enqueues featurized rows. A background thread drains the
+# queue in mini-batches into an SGD logistic regression warm-started from the
+# active model, and periodically checkpoints it into the registry as a new
+# LogisticRegression version.
+#
+# Every holdout_every-th row is held out instead of learned from. A
+# checkpoint is activated (and ml_service hot-swaps to it; other serve.py
+# workers pick it up through the registry watcher) only when its log loss on
+# those rows is no worse than the active model's. Otherwise it is published
+# inactive, for inspection.
+#
+# SGD runs on features standardized with the base model's training mean /
+# std (from its manifest, by feature name); the scaling is folded back into
+# coef/intercept, so checkpoints score raw features exactly like any other
+# linear model, and they inherit the base model's feature stats.
+
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class OnlineLearner:
+    def __init__(self, feature_names, current_model, publish, batch_size=32, flush_seconds=1.0,
+                 checkpoint_rows=500, checkpoint_seconds=60.0, max_queue=10000, learning_rate=0.01,
+                 holdout_every=5, holdout_rows=2000, min_holdout=50):
+        self.feature_names = list(feature_names)
+        self.current_model = current_model  # () -> ActiveModel or None
+        self.publish = publish  # (model, metrics, activate, feature_stats) -> version, called from the learner thread
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.checkpoint_rows = checkpoint_rows
+        self.checkpoint_seconds = checkpoint_seconds
+        self.learning_rate = learning_rate
+        self.holdout_every = holdout_every
+        self.min_holdout = min_holdout
+        self._holdout = deque(maxlen=holdout_rows)
+        self._rows_received = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._sgd = None
+        self._mean = self._std = None  # Standardization of the base model's features
+        self._feature_stats = None
+        self.base_version = None
+        self.checkpoint_version = None
+        self.rows_seen = 0
+        self.rows_since_checkpoint = 0
+        self.updates = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.checkpoints = 0
+        self.activated = 0
+        self.errors = 0
+        self.last_checkpoint = time.monotonic()
+        self.recent_log_loss = None
+
+    def submit(self, X, y):
+        """Queue labeled rows without blocking; returns how many were accepted."""
+        self._ensure_started()
+        accepted = 0
+        for row, label in zip(X, y):
+            try:
+                self._queue.put_nowait((row, label))
+                accepted += 1
+            except queue.Full:
+                self.dropped += 1
+        return accepted
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="online-learner", daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        rows = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        X = np.array([row for row, _ in rows], dtype=np.float64)
+        y = np.array([label for _, label in rows], dtype=np.int64)
+        return X, y
+
+    def _run(self):
+        while True:
+            X, y = self._next_batch()
+            try:
+                self.update(X, y)
+                if self._checkpoint_due():
+                    self.checkpoint()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠ Warning: online update failed: {e}")
+
+    def sync(self, current):
+        """Warm-start from `current` (an ActiveModel) unless it is our own checkpoint.
+
+        Returns False when the active model is not linear and cannot be updated.
+        """
+        if current.version in (self.base_version, self.checkpoint_version) and self._sgd is not None:
+            return True
+        if current.scorer.kind != 'linear':
+            return False
+        from sklearn.linear_model import SGDClassifier
+
+        sgd = SGDClassifier(loss='log_loss', learning_rate='constant', eta0=self.learning_rate,
+                            alpha=1e-5, random_state=42)
+        # Raw-feature coefficients -> standardized space
+        mean, std = current.feature_mean, current.feature_std
+        sgd.coef_ = (current.scorer.coef * std)[None, :]
+        sgd.intercept_ = np.array([current.scorer.intercept + float(current.scorer.coef @ mean)])
+        sgd.classes_ = np.array([0, 1])
+        sgd.t_ = 1.0
+        sgd.n_features_in_ = len(self.feature_names)
+        self._sgd = sgd
+        self._mean, self._std = mean, std
+        self._feature_stats = current.manifest.get('feature_stats')
+        self.base_version = current.version
+        self.checkpoint_version = None
+        self.rows_since_checkpoint = 0
+        return True
+
+    def update(self, X, y):
+        current = self.current_model()
+        if current is None or not self.sync(current):
+            self.skipped += len(y)
+            return
+        held = (np.arange(len(y)) + self._rows_received) % self.holdout_every == 0
+        self._rows_received += len(y)
+        self._holdout.extend(zip(X[held], y[held]))
+        X, y = X[~held], y[~held]
+        if not len(y):
+            return
+        Z = (X - self._mean) / self._std
+        # Progressive validation: loss on each batch before learning from it
+        p = np.clip(self._sgd.predict_proba(Z)[:, 1], 1e-7, 1 - 1e-7)
+        loss = float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+        self.recent_log_loss = loss if self.recent_log_loss is None else 0.9 * self.recent_log_loss + 0.1 * loss
+        self._sgd.partial_fit(Z, y, classes=np.array([0, 1]))
+        self.updates += 1
+        self.rows_seen += len(y)
+        self.rows_since_checkpoint += len(y)
+
+    def _checkpoint_due(self):
+        if self.rows_since_checkpoint == 0:
+            return False
+        return (self.rows_since_checkpoint >= self.checkpoint_rows
+                or time.monotonic() - self.last_checkpoint >= self.checkpoint_seconds)
+
+    def to_model(self):
+        """Current weights as a fitted LogisticRegression over raw features."""
+        from sklearn.linear_model import LogisticRegression
+
+        coef = self._sgd.coef_[0] / self._std
+        model = LogisticRegression()
+        model.coef_ = coef[None, :]
+        model.intercept_ = np.array([self._sgd.intercept_[0] - float(coef @ self._mean)])
+        model.classes_ = np.array([0, 1])
+        model.n_features_in_ = len(self.feature_names)
+        model.n_iter_ = np.array([self.updates])
+        return model
+
+    def holdout_losses(self):
+        """(checkpoint log loss, active model log loss) on the held-out rows; None when too few."""
+        current = self.current_model()
+        if len(self._holdout) < self.min_holdout or current is None:
+            return None
+        X = np.array([row for row, _ in self._holdout], dtype=np.float64)
+        y = np.array([label for _, label in self._holdout], dtype=np.float64)
+
+        def log_loss(p):
+            p = np.clip(p, 1e-7, 1 - 1e-7)
+            return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+        candidate = self._sgd.predict_proba((X - self._mean) / self._std)[:, 1]
+        return log_loss(candidate), log_loss(current.scorer.predict_proba(X))
+
+    def checkpoint(self):
+        rows = self.rows_since_checkpoint
+        losses = self.holdout_losses()
+        activate = losses is not None and losses[0] <= losses[1]
+        self.checkpoint_version = self.publish(self.to_model(), {
+            'online_base_version': self.base_version,
+            'online_rows': self.rows_seen,
+            'online_updates': self.updates,
+            'online_log_loss': round(self.recent_log_loss, 4) if self.recent_log_loss is not None else None,
+            'holdout_rows': len(self._holdout),
+            'holdout_log_loss': round(losses[0], 4) if losses else None,
+            'active_holdout_log_loss': round(losses[1], 4) if losses else None,
+        }, activate, self._feature_stats)
+        self.rows_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+        self.checkpoints += 1
+        self.activated += activate
+        if activate:
+            print(f"✓ Online checkpoint {self.checkpoint_version} activated ({rows} new rows, base "
+                  f"{self.base_version}, holdout log loss {losses[0]:.4f} vs {losses[1]:.4f})")
+        elif losses is None:
+            print(f"⚠ Online checkpoint {self.checkpoint_version} not activated: "
+                  f"{len(self._holdout)}/{self.min_holdout} holdout rows")
+        else:
+            print(f"⚠ Online checkpoint {self.checkpoint_version} not activated: "
+                  f"holdout log loss {losses[0]:.4f} vs {losses[1]:.4f} for the active model")
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'rows_seen': self.rows_seen,
+            'rows_since_checkpoint': self.rows_since_checkpoint,
+            'updates': self.updates,
+            'checkpoints': self.checkpoints,
+            'activated': self.activated,
+            'holdout_rows': len(self._holdout),
+            'dropped': self.dropped,
+            'skipped_non_linear': self.skipped,
+            'errors': self.errors,
+            'base_version': self.base_version,
+            'checkpoint_version': self.checkpoint_version,
+            'recent_log_loss': round(self.recent_log_loss, 4) if self.recent_log_loss is not None else None,
+        }
@@ -0,0 +1,462 @@
+# rescore.py
+# Backtest a model version: rescore historical cases with the old and new model and diff them
+#
+# Inputs are streamed in --chunk rows at a time. The format of each file is
+# recognised from its header:
+#   synthetic_medical_triage.csv, data.csv (KTAS, ';'-separated),
+#   HT1_Training_Dataset_4000.csv   <- mapped to features as in dataset.py
+#   patients export (.csv or .jsonl) <- id, age, vitals, symptoms, meta columns;
+#                                      featurized like the backend's /predict call
+#   triage_audit export              <- features_used from ML-scored rows
+#   any file with feature_spec columns (age, hr, sbp, spo2, ...)
+# Files in another format (patient_dataset.csv, medical_triage_500.csv: no
+# vitals) are skipped with a warning.
+#
+# Chunks are featurized and scored by a process pool. Each worker memory-maps
+# both models' compiled arrays and makes one predict_proba call per model per
+# chunk. At most 2 chunks per worker are in flight, and results are written
+# as they arrive, so memory stays flat however long the input is. The summary
+# is computed from a 101 x 101 histogram of (old score, new score).
+#
+# Outputs:
+#   <out>.npy    <- one 8-byte record per scored row: source (index into the
+#                   summary's sources), row (0-based data row in that file), old, new
+#   <out>.json   <- per source and overall: score deltas, percentiles, and
+#                   cases crossing the critical threshold in either direction
+#
+# Models: a registry version ('v3'), 'active', or a pickle path (e.g. a
+# retrained triage_model.pkl), loaded through model_registry's compiled cache.
+#
+# Usage:
+#   python rescore.py --new triage_model.pkl                      # active version vs. candidate, on data_for_ml
+#   python rescore.py --old v2 --new v3 patients.jsonl triage_audit.csv --workers 4 --out backtest
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import feature_spec
+import model_registry
+from model_registry import RegistryError
+from queue_engine import CRITICAL_SCORE
+from symptoms import default_matcher
+
+DATA_DIR = os.getenv("ML_DATA_DIR", "../data_for_ml")
+CHUNK_ROWS = 100_000
+MAX_SCORE = 100
+
+# One record per scored row
+RESULT_DTYPE = np.dtype([('source', '<u2'), ('row', '<u4'), ('old', 'u1'), ('new', 'u1')])
+
+# What the backend sends for a vital it does not have (mlService.js callMLService)
+VITAL_DEFAULTS = {'hr': 80, 'sbp': 120, 'spo2': 98, 'temp': 37.0, 'rr': 16}
+
+FLAG_SYMPTOMS = ['chest_pain', 'shortness_of_breath']
+
+
+# ---- input formats -----------------------------------------------------------
+
+def _numeric(values):
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _as_dict(value):
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str) and value.strip().startswith('{'):
+        try:
+            parsed = json.loads(value)
+            return parsed if isinstance(parsed, dict) else {}
+        except ValueError:
+            return {}
+    return {}
+
+
+def _as_list(value):
+    """A symptoms cell: list, JSON array, Postgres array literal or comma-separated text."""
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    if not isinstance(value, str) or not value.strip():
+        return []
+    text = value.strip()
+    if text.startswith('['):
+        try:
+            return [str(v) for v in json.loads(text)]
+        except ValueError:
+            pass
+    if text.startswith('{') and text.endswith('}'):
+        text = text[1:-1]
+    return [part.strip().strip('"') for part in text.split(',') if part.strip()]
+
+
+def _synthetic(frame):
+    # Same mapping as dataset.combine_sources
+    return {
+        'age': frame['age'],
+        'hr': frame['heart_rate'],
+        'sbp': frame['systolic_blood_pressure'],
+        'spo2': frame['oxygen_saturation'],
+        'temp': frame['body_temperature'],
+        'chest_pain': (frame['pain_level'] >= 6).astype(int),
+        'breathless': (frame['oxygen_saturation'] < 94).astype(int),
+        'comorbid': frame['chronic_disease_count'].clip(0, 2),
+    }
+
+
+def _ktas(frame):
+    flags = default_matcher().flag_matrix(frame['Chief_complain'].fillna('').tolist(), FLAG_SYMPTOMS)
+    return {
+        'age': _numeric(frame['Age']),
+        'hr': _numeric(frame['HR']),
+        'sbp': _numeric(frame['SBP']),
+        'spo2': _numeric(frame['Saturation']),
+        'temp': _numeric(frame['BT']),
+        'rr': _numeric(frame['RR']),
+        'chest_pain': flags[:, 0],
+        'breathless': flags[:, 1],
+        'comorbid': (frame['Injury'] == 2).astype(int),  # dataset.py uses injury as the comorbid flag
+    }
+
+
+def _ht1(frame):
+    return {
+        'age': frame['age'],
+        'hr': frame['heart_rate_bpm'],
+        'sbp': frame['systolic_bp_mmhg'],
+        'spo2': frame['oxygen_saturation_pct'],
+        'temp': frame['temperature_celsius'],
+        'rr': frame['respiratory_rate_per_min'],
+        'chest_pain': frame['chest_pain'],
+        'breathless': frame['shortness_of_breath'],
+        'comorbid': frame['comorbidities'].clip(0, 2),
+    }
+
+
+def _patients(frame):
+    # The /predict payload the backend builds: vitals, the symptom list and meta.comorbid
+    matcher = default_matcher()
+    vitals = [_as_dict(v) for v in frame['vitals']]
+    meta = [_as_dict(v) for v in frame['meta']] if 'meta' in frame else [{}] * len(frame)
+    flags = np.array([matcher.flags(_as_list(s), FLAG_SYMPTOMS) for s in frame['symptoms']],
+                     dtype=np.float64).reshape(len(frame), len(FLAG_SYMPTOMS))
+    # `vitals.hr || 80`: a 0 or empty vital takes the default too
+    columns = {name: _numeric([v.get(name) or None for v in vitals]) for name in VITAL_DEFAULTS}
+    return {
+        'age': _numeric(frame['age']),
+        **columns,
+        'chest_pain': flags[:, 0],
+        'breathless': flags[:, 1],
+        'comorbid': _numeric([m.get('comorbid') or 0 for m in meta]),
+    }
+
+
+def _audit(frame):
+    # Rule-scored rows have no features_used; they come out NaN and are skipped
+    used = [_as_dict(_as_dict(e).get('features_used')) for e in frame['explanation']]
+    return {name: _numeric([u.get(name) for u in used]) for name in feature_spec.FEATURE_NAMES}
+
+
+def _features(frame):
+    return {name: _numeric(frame[name]) for name in feature_spec.FEATURE_NAMES if name in frame}
+
+
+class Format(NamedTuple):
+    name: str
+    columns: frozenset  # Header columns that identify the format (and the only ones read)
+    featurize: Callable  # DataFrame chunk -> {feature: column}, NaN where missing
+    read: dict = {}  # Extra pandas.read_csv arguments
+    optional: frozenset = frozenset()  # Read when present
+
+
+# Most specific first; the bare feature columns match many files
+FORMATS = (
+    Format('synthetic', frozenset({'age', 'heart_rate', 'systolic_blood_pressure', 'oxygen_saturation',
+                                   'body_temperature', 'pain_level', 'chronic_disease_count'}), _synthetic),
+    Format('ktas', frozenset({'Age', 'HR', 'SBP', 'Saturation', 'BT', 'RR', 'Chief_complain', 'Injury'}), _ktas,
+           {'sep': ';', 'encoding': 'latin-1'}),
+    Format('ht1', frozenset({'age', 'heart_rate_bpm', 'systolic_bp_mmhg', 'oxygen_saturation_pct',
+                             'temperature_celsius', 'respiratory_rate_per_min', 'chest_pain',
+                             'shortness_of_breath', 'comorbidities'}), _ht1),
+    Format('patients', frozenset({'age', 'vitals', 'symptoms'}), _patients, optional=frozenset({'meta'})),
+    Format('triage_audit', frozenset({'patient_id', 'explanation'}), _audit),
+    Format('features', frozenset(n for n in feature_spec.FEATURE_NAMES if n not in feature_spec.DEFAULTS),
+           _features, optional=frozenset(feature_spec.FEATURE_NAMES)),
+)
+FORMATS_BY_NAME = {f.name: f for f in FORMATS}
+
+
+def detect_format(path):
+    """The Format for a file, from its header line (or first JSON record); None if unsupported."""
+    with open(path, encoding='latin-1') as f:
+        first = f.readline().strip()
+    if path.endswith('.jsonl'):
+        keys = set(json.loads(first)) if first else set()
+        return next((f for f in FORMATS if f.columns <= keys), None)
+    for fmt in FORMATS:
+        header = {c.strip().strip('"') for c in first.split(fmt.read.get('sep', ','))}
+        if fmt.columns <= header:
+            return fmt
+    return None
+
+
+def read_chunks(path, fmt, chunk_rows=CHUNK_ROWS):
+    """DataFrames of at most chunk_rows rows, holding only the format's columns."""
+    wanted = fmt.columns | fmt.optional
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            batch = []
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    batch.append({k: record.get(k) for k in wanted if k in record})
+                if len(batch) >= chunk_rows:
+                    yield pd.DataFrame.from_records(batch)
+                    batch = []
+            if batch:
+                yield pd.DataFrame.from_records(batch)
+        return
+    yield from pd.read_csv(path, usecols=lambda c: c in wanted, chunksize=chunk_rows, **fmt.read)
+
+
+def featurize(fmt, frame):
+    """(X, kept row positions): NaN vitals take the backend defaults; rows still missing a value are dropped."""
+    columns = fmt.featurize(frame)
+    X = np.empty((len(frame), len(feature_spec.FEATURES)), dtype=np.float64)
+    for j, f in enumerate(feature_spec.FEATURES):
+        X[:, j] = columns[f.name] if f.name in columns else np.nan
+        fill = VITAL_DEFAULTS.get(f.name, f.default)
+        if fill is not None:
+            X[np.isnan(X[:, j]), j] = fill
+    kept = np.flatnonzero(~np.isnan(X).any(axis=1))
+    return X[kept], kept
+
+
+# ---- models ------------------------------------------------------------------
+
+def load_scorer(spec):
+    """(label, scorer) for 'active', a registry version, or a pickle path."""
+    if spec == 'active':
+        version = model_registry.active_version()
+        if version is None:
+            raise RegistryError(f"No active version in '{model_registry.REGISTRY_DIR}'; pass a version or a .pkl path")
+        spec = version
+    if os.path.isfile(spec):
+        model, scorer, info = model_registry.load_pickle_compiled(spec, model_registry.COMPILED_CACHE_DIR)
+        label, names = os.path.basename(spec), info['feature_names'] or feature_spec.FEATURE_NAMES
+    else:
+        if spec not in model_registry.list_versions():
+            raise RegistryError(f"'{spec}' is neither a registry version nor a file")
+        model, scorer, manifest = model_registry.load_version(spec, compiled_cache=model_registry.COMPILED_CACHE_DIR)
+        label, names = spec, manifest.get('feature_names') or feature_spec.FEATURE_NAMES
+    problems = feature_spec.artifact_problems(names, model, scorer)
+    if problems:
+        raise RegistryError(f"Model {label} does not match the feature spec: {'; '.join(problems)}")
+    return label, scorer
+
+
+_scorers = None
+
+
+def _init_worker(old_spec, new_spec):
+    global _scorers
+    _scorers = (load_scorer(old_spec)[1], load_scorer(new_spec)[1])
+
+
+def score_chunk(fmt_name, frame):
+    """(kept row positions, old scores, new scores) for one chunk, in a worker."""
+    X, kept = featurize(FORMATS_BY_NAME[fmt_name], frame)
+    if not len(kept):
+        return kept, np.empty(0, np.uint8), np.empty(0, np.uint8)
+    # Same rounding as /predict/batch
+    old, new = (np.rint(scorer.predict_proba(X) * 100).astype(np.uint8) for scorer in _scorers)
+    return kept, old, new
+
+
+def scored_chunks(jobs, workers, old_spec, new_spec):
+    """(job, result) in job order; at most 2 * workers chunks are queued or running."""
+    if workers <= 1:
+        _init_worker(old_spec, new_spec)
+        for meta, fmt_name, frame in jobs:
+            yield meta, score_chunk(fmt_name, frame)
+        return
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(old_spec, new_spec)) as pool:
+        pending = deque()
+        for meta, fmt_name, frame in jobs:
+            pending.append((meta, pool.submit(score_chunk, fmt_name, frame)))
+            del frame
+            if len(pending) >= 2 * workers:
+                meta, future = pending.popleft()
+                yield meta, future.result()
+        while pending:
+            meta, future = pending.popleft()
+            yield meta, future.result()
+
+
+# ---- results -----------------------------------------------------------------
+
+class ResultsFile:
+    """Appends records to <path>.partial, then writes the .npy header and copies them in."""
+
+    def __init__(self, path):
+        self.path = path
+        self.partial = path + '.partial'
+        self.rows = 0
+        self._f = open(self.partial, 'wb')
+
+    def write(self, records):
+        records.tofile(self._f)
+        self.rows += len(records)
+
+    def close(self):
+        self._f.close()
+        with open(self.path, 'wb') as out, open(self.partial, 'rb') as src:
+            np.lib.format.write_array_header_1_0(out, {'descr': np.lib.format.dtype_to_descr(RESULT_DTYPE),
+                                                       'fortran_order': False, 'shape': (self.rows,)})
+            while block := src.read(1 << 24):
+                out.write(block)
+        os.remove(self.partial)
+
+
+def summarize(joint, threshold):
+    """Score and delta statistics from a (101, 101) count matrix of (old, new) scores."""
+    n = int(joint.sum())
+    scores = np.arange(MAX_SCORE + 1)
+    old_counts, new_counts = joint.sum(axis=1), joint.sum(axis=0)
+    delta = scores[None, :] - scores[:, None]
+    delta_counts = np.bincount((delta + MAX_SCORE).ravel(), weights=joint.ravel(), minlength=2 * MAX_SCORE + 1)
+    summary = {'rows': n}
+    if not n:
+        return summary
+
+    def percentile(q):
+        return int(np.searchsorted(np.cumsum(delta_counts), q / 100 * n, side='left')) - MAX_SCORE
+
+    summary.update({
+        'mean_old': round(float(old_counts @ scores / n), 3),
+        'mean_new': round(float(new_counts @ scores / n), 3),
+        'mean_delta': round(float(delta_counts @ np.arange(-MAX_SCORE, MAX_SCORE + 1) / n), 3),
+        'mean_abs_delta': round(float((joint * np.abs(delta)).sum() / n), 3),
+        'changed': int(n - np.trace(joint)),
+        'changed_by_10_or_more': int(joint[np.abs(delta) >= 10].sum()),
+        'delta_percentiles': {f"p{q}": percentile(q) for q in (1, 5, 25, 50, 75, 95, 99)},
+        'critical_old': int(old_counts[threshold:].sum()),
+        'critical_new': int(new_counts[threshold:].sum()),
+        'became_critical': int(joint[:threshold, threshold:].sum()),
+        'no_longer_critical': int(joint[threshold:, :threshold].sum()),
+    })
+    return summary
+
+
+def input_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.csv')) + glob.glob(os.path.join(path, '*.jsonl')))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore historical cases with two models and diff the triage scores")
+    parser.add_argument('inputs', nargs='*', default=[DATA_DIR],
+                        help="CSV/JSONL files or directories (default: data_for_ml)")
+    parser.add_argument('--old', default='active', help="baseline: 'active', a registry version or a .pkl path")
+    parser.add_argument('--new', required=True, help="candidate: a registry version or a .pkl path")
+    parser.add_argument('--out', default='rescore_results', help="writes <out>.npy and <out>.json")
+    parser.add_argument('--chunk', type=int, default=CHUNK_ROWS, help="rows per chunk")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threshold', type=int, default=CRITICAL_SCORE, help="critical score cut-off")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        # Load once here: fails fast, and fills the compiled cache the workers read
+        old_label, _ = load_scorer(args.old)
+        new_label, _ = load_scorer(args.new)
+    except (RegistryError, OSError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"Rescoring with {old_label} (old) and {new_label} (new), {args.workers} worker(s), "
+          f"{args.chunk:,} rows per chunk")
+
+    sources = []
+    for path in input_files(args.inputs):
+        fmt = detect_format(path)
+        if fmt is None:
+            print(f"⚠ Skipping {path}: not a recognised case format")
+            continue
+        sources.append({'path': path, 'format': fmt.name, 'read': 0, 'skipped': 0})
+    if not sources:
+        print("❌ No inputs to rescore")
+        sys.exit(1)
+
+    def jobs():
+        for index, source in enumerate(sources):
+            fmt = FORMATS_BY_NAME[source['format']]
+            offset = 0
+            for frame in read_chunks(source['path'], fmt, args.chunk):
+                yield (index, offset, len(frame)), fmt.name, frame
+                offset += len(frame)
+
+    joints = np.zeros((len(sources), MAX_SCORE + 1, MAX_SCORE + 1), dtype=np.int64)
+    results = ResultsFile(args.out + '.npy')
+    try:
+        for (index, offset, n_rows), (kept, old, new) in scored_chunks(jobs(), args.workers, args.old, args.new):
+            records = np.empty(len(kept), dtype=RESULT_DTYPE)
+            records['source'] = index
+            records['row'] = offset + kept
+            records['old'] = old
+            records['new'] = new
+            results.write(records)
+            joints[index] += np.bincount(old.astype(np.int64) * (MAX_SCORE + 1) + new,
+                                         minlength=(MAX_SCORE + 1) ** 2).reshape(MAX_SCORE + 1, MAX_SCORE + 1)
+            sources[index]['read'] += n_rows
+            sources[index]['skipped'] += n_rows - len(kept)
+    finally:
+        results.close()
+    elapsed = time.perf_counter() - start
+
+    summary = {
+        'old': old_label,
+        'new': new_label,
+        'threshold': args.threshold,
+        'results': args.out + '.npy',
+        'seconds': round(elapsed, 2),
+        'sources': [{**source, **summarize(joints[i], args.threshold)} for i, source in enumerate(sources)],
+        'total': summarize(joints.sum(axis=0), args.threshold),
+    }
+    with open(args.out + '.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'source':34} {'rows':>10} {'skipped':>8} {'mean Δ':>8} {'|Δ|':>6} {'changed':>9} "
+          f"{'≥' + str(args.threshold) + ' old':>9} {'new':>8} {'+crit':>7} {'-crit':>7}")
+    for row in summary['sources'] + [{'path': 'total', 'skipped': sum(s['skipped'] for s in sources),
+                                      **summary['total']}]:
+        if not row.get('rows'):
+            print(f"{os.path.basename(row['path'])[:34]:34} {0:>10} {row['skipped']:>8,}")
+            continue
+        print(f"{os.path.basename(row['path'])[:34]:34} {row['rows']:>10,} {row['skipped']:>8,} "
+              f"{row['mean_delta']:>+8.2f} {row['mean_abs_delta']:>6.2f} {row['changed']:>9,} "
+              f"{row['critical_old']:>9,} {row['critical_new']:>8,} {row['became_critical']:>7,} "
+              f"{row['no_longer_critical']:>7,}")
+    total = summary['total']
+    if total.get('rows'):
+        p = total['delta_percentiles']
+        print(f"\nΔ percentiles: p1 {p['p1']:+d}, p5 {p['p5']:+d}, p50 {p['p50']:+d}, p95 {p['p95']:+d}, "
+              f"p99 {p['p99']:+d}; {total['changed_by_10_or_more']:,} rows moved by 10+ points")
+    rate = total.get('rows', 0) / elapsed if elapsed else 0
+    print(f"✓ {total.get('rows', 0):,} rows in {elapsed:.1f} s ({rate:,.0f} rows/s) -> {args.out}.npy, {args.out}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# scoring.py
+# Scoring engines used by ml_service on the hot path
+# LogisticRegression models are evaluated directly from coef_/intercept_,
+# tree ensembles are flattened into contiguous node arrays,
+# everything else falls back to sklearn's predict_proba
+#
+# Compiled scorers can be saved as raw .npy arrays and loaded back with
+# mmap_mode='r', which needs neither pickle nor sklearn
+
+import os
+import threading
+
+import numpy as np
+
+TREE_LEAF = -1
+
+
+class LinearScorer:
+    """Sigmoid over a dot product, no sklearn input validation per call."""
+
+    kind = 'linear'
+    units = 'log_odds'
+
+    def __init__(self, coef, intercept):
+        self.coef = np.ascontiguousarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(intercept)[0])
+        self.n_features = self.coef.shape[0]
+        # Endpoints run on the threadpool, so each thread gets its own row buffer
+        self._local = threading.local()
+
+    def _row_buffer(self):
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty(self.n_features, dtype=np.float64)
+        return row
+
+    def predict_one(self, values):
+        row = self._row_buffer()
+        row[:] = values
+        z = row @ self.coef + self.intercept
+        return float(1.0 / (1.0 + np.exp(-z)))
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        z = X @ self.coef + self.intercept
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def explain(self, X, reference=None):
+        """(probabilities, baseline, contributions) with exact log-odds terms.
+
+        Contributions are coef * (x - reference); baseline is the log-odds at
+        the reference row, so baseline + contributions.sum(axis=1) is the logit.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        reference = np.zeros(self.n_features) if reference is None else np.asarray(reference, dtype=np.float64)
+        contrib = (X - reference) * self.coef
+        baseline = self.intercept + float(reference @ self.coef)
+        z = baseline + contrib.sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-z)), np.full(X.shape[0], baseline), contrib
+
+    def to_arrays(self):
+        return {'coef': self.coef}, {'intercept': self.intercept}
+
+    @classmethod
+    def from_arrays(cls, arrays, params):
+        return cls(arrays['coef'], params['intercept'])
+
+
+class TreeEnsembleScorer:
+    """Vectorized walk over trees flattened into one set of node arrays.
+
+    Leaves point to themselves, so every row can take exactly `max_depth`
+    steps without masking. `combine` is 'mean' for forests (average of leaf
+    probabilities) or 'logit' for gradient boosting (sigmoid of
+    init_raw + learning_rate * sum of leaf values). Internal nodes carry the
+    sample-weighted mean of their subtree's leaf values, used by explain().
+    """
+
+    kind = 'trees'
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'is_leaf')
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 combine='mean', init_raw=0.0, learning_rate=1.0, is_leaf=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.combine = combine
+        self.init_raw = float(init_raw)
+        self.learning_rate = float(learning_rate)
+        if is_leaf is None:
+            is_leaf = self.left == np.arange(self.left.shape[0], dtype=np.int32)
+        self.is_leaf = np.ascontiguousarray(is_leaf, dtype=bool)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left,
+                                      self.right, self.value, self.roots))
+
+    def leaf_indices(self, X):
+        # sklearn compares float32 inputs against float64 thresholds; do the same
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, n_features = X.shape
+        flat = X.ravel()
+        base = (np.arange(n, dtype=np.int64) * n_features)[:, None]
+        idx = np.repeat(self.roots[None, :], n, axis=0)
+        for depth in range(1, self.max_depth + 1):
+            go_left = flat[base + self.feature[idx]] <= self.threshold[idx]
+            idx = np.where(go_left, self.left[idx], self.right[idx])
+            # Most paths end well before the deepest leaf
+            if depth % 4 == 0 and self.is_leaf[idx].all():
+                break
+        return idx
+
+    def predict_proba(self, X):
+        leaf = self.value[self.leaf_indices(X)]
+        if self.combine == 'mean':
+            return leaf.mean(axis=1)
+        raw = self.init_raw + (leaf * self.learning_rate).sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-raw))
+
+    def predict_one(self, values):
+        return float(self.predict_proba(np.asarray([values]))[0])
+
+    @property
+    def units(self):
+        return 'probability' if self.combine == 'mean' else 'log_odds'
+
+    # Rows explained per pass; bounds the (rows x trees) work arrays
+    EXPLAIN_CHUNK_ROWS = 256
+
+    def explain(self, X):
+        """(probabilities, baseline, contributions) by path attribution (Saabas).
+
+        Each split credits its feature with value(child) - value(parent); the
+        terms telescope, so baseline (the root values) plus the row's
+        contributions equals its prediction in `units`. Large inputs are
+        explained EXPLAIN_CHUNK_ROWS rows at a time, so memory stays bounded.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        step = self.EXPLAIN_CHUNK_ROWS
+        if X.shape[0] <= step:
+            return self._explain_chunk(X)
+        parts = [self._explain_chunk(X[start:start + step]) for start in range(0, X.shape[0], step)]
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    def _explain_chunk(self, X):
+        n, n_features = X.shape
+        flat = X.ravel()
+        base = (np.arange(n, dtype=np.int64) * n_features)[:, None]
+        idx = np.repeat(self.roots[None, :], n, axis=0)
+        contrib = np.zeros(n * n_features)
+        for depth in range(1, self.max_depth + 1):
+            # Credit each split as it is taken; leaves loop on themselves, so their deltas are 0
+            slots = base + self.feature[idx]
+            child = np.where(flat[slots] <= self.threshold[idx], self.left[idx], self.right[idx])
+            contrib += np.bincount(slots.ravel(), weights=(self.value[child] - self.value[idx]).ravel(),
+                                   minlength=n * n_features)
+            idx = child
+            if depth % 4 == 0 and self.is_leaf[idx].all():
+                break
+        contrib = contrib.reshape(n, n_features)
+        leaf = self.value[idx]
+        roots = self.value[self.roots]
+        if self.combine == 'mean':
+            scale = 1.0 / len(self.roots)
+            proba = leaf.mean(axis=1)
+            baseline = roots.mean()
+        else:
+            scale = self.learning_rate
+            proba = 1.0 / (1.0 + np.exp(-(self.init_raw + (leaf * self.learning_rate).sum(axis=1))))
+            baseline = self.init_raw + self.learning_rate * roots.sum()
+        return proba, np.full(n, baseline), contrib * scale
+
+    def to_arrays(self):
+        params = {
+            'max_depth': self.max_depth,
+            'combine': self.combine,
+            'init_raw': self.init_raw,
+            'learning_rate': self.learning_rate,
+        }
+        return {name: getattr(self, name) for name in self.ARRAYS}, params
+
+    @classmethod
+    def from_arrays(cls, arrays, params):
+        return cls(**arrays, **params)
+
+
+def _flatten_trees(trees, node_values):
+    """Concatenate fitted sklearn trees into global node arrays.
+
+    `node_values(tree_)` returns the per-node output used at the leaves.
+    """
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        t = tree.tree_
+        n = t.node_count
+        is_leaf = t.children_left == TREE_LEAF
+        own = np.arange(n)
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(np.where(is_leaf, np.inf, t.threshold))
+        left.append(np.where(is_leaf, own, t.children_left) + offset)
+        right.append(np.where(is_leaf, own, t.children_right) + offset)
+        value.append(_subtree_means(t, node_values(t)))
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, t.max_depth)
+    return dict(
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        left=np.concatenate(left),
+        right=np.concatenate(right),
+        value=np.concatenate(value),
+        roots=np.array(roots),
+        max_depth=max_depth,
+    )
+
+
+def _subtree_means(t, values):
+    """Replace internal-node values by the weighted mean of their children.
+
+    Leaves keep their (possibly post-fit updated, as in gradient boosting)
+    values; each internal node gets the sample-weighted mean of its
+    children, computed level by level from the bottom.
+    """
+    values = np.array(values, dtype=np.float64)
+    left, right = t.children_left, t.children_right
+    weight = t.weighted_n_node_samples
+    levels = []
+    frontier = np.array([0])
+    while frontier.size:
+        internal = frontier[left[frontier] != TREE_LEAF]
+        levels.append(internal)
+        frontier = np.concatenate([left[internal], right[internal]])
+    for nodes in reversed(levels):
+        l, r = left[nodes], right[nodes]
+        values[nodes] = (weight[l] * values[l] + weight[r] * values[r]) / (weight[l] + weight[r])
+    return values
+
+
+def _class_fraction(t):
+    # Positive-class probability at each node (weighted counts normalised)
+    counts = t.value[:, 0, :]
+    return counts[:, 1] / counts.sum(axis=1)
+
+
+def compile_forest(model):
+    from sklearn.tree import DecisionTreeClassifier
+
+    trees = [model] if isinstance(model, DecisionTreeClassifier) else model.estimators_
+    return TreeEnsembleScorer(**_flatten_trees(trees, _class_fraction), combine='mean')
+
+
+def compile_gradient_boosting(model):
+    arrays = _flatten_trees(model.estimators_[:, 0], lambda t: t.value[:, 0, 0])
+    # Constant raw prediction of the init estimator (class prior log-odds)
+    init_raw = model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0]
+    return TreeEnsembleScorer(**arrays, combine='logit', init_raw=init_raw,
+                              learning_rate=model.learning_rate)
+
+
+class SklearnScorer:
+    """Fallback for models without a compiled path."""
+
+    kind = 'sklearn'
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict_one(self, values):
+        return float(self.model.predict_proba([values])[0][1])
+
+    def predict_proba(self, X):
+        return self.model.predict_proba(X)[:, 1]
+
+
+COMPILED_SCORERS = {cls.kind: cls for cls in (LinearScorer, TreeEnsembleScorer)}
+
+
+def build_scorer(model):
+    """Pick the fastest scorer available for a fitted model."""
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier, ExtraTreesClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.tree import DecisionTreeClassifier
+
+    if isinstance(model, LogisticRegression) and model.coef_.shape[0] == 1:
+        return LinearScorer(model.coef_, model.intercept_)
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier, DecisionTreeClassifier)) \
+            and model.n_classes_ == 2 and model.n_outputs_ == 1:
+        return compile_forest(model)
+    if isinstance(model, GradientBoostingClassifier) and model.n_classes_ == 2:
+        return compile_gradient_boosting(model)
+    return SklearnScorer(model)
+
+
+def save_scorer(scorer, directory):
+    """Write a compiled scorer as one .npy file per array.
+
+    Returns the manifest entry needed by load_scorer.
+    """
+    arrays, params = scorer.to_arrays()
+    files = {}
+    for name, array in arrays.items():
+        filename = f"{name}.npy"
+        np.save(os.path.join(directory, filename), np.ascontiguousarray(array))
+        files[name] = filename
+    return {'kind': scorer.kind, 'params': params, 'arrays': files}
+
+
+def load_scorer(directory, spec, mmap=True):
+    """Rebuild a compiled scorer from save_scorer output.
+
+    With mmap the arrays stay file-backed, so every worker process serving
+    the same artifact shares one copy in the page cache.
+    """
+    mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(os.path.join(directory, filename), mmap_mode=mode)
+        for name, filename in spec['arrays'].items()
+    }
+    return COMPILED_SCORERS[spec['kind']].from_arrays(arrays, spec['params'])
@@ -0,0 +1,164 @@
+# search.py
+# Budgeted hyperparameter search for the triage model
+#
+# Successive halving over the three model families: every sampled config is
+# fitted on a small subsample, the best 1/eta (by holdout accuracy) move on
+# to eta times more rows, until the survivors see the full training split
+# or the wall-clock budget runs out. Fits within a rung run in parallel.
+#
+# Every evaluated model is also timed through the scorer ml_service would
+# serve it with (scoring.build_scorer): single-row predict_one and per-row
+# batch predict_proba. Ranking puts models that meet the latency SLO ahead
+# of those that don't, so the selected artifact is the most accurate model
+# that is fast enough to serve.
+
+import math
+import random
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from scoring import build_scorer
+
+SEARCH_SPACE = {
+    'LogisticRegression': (
+        lambda **p: LogisticRegression(max_iter=1000, random_state=42, class_weight='balanced', **p),
+        {'C': [0.01, 0.1, 1.0, 10.0, 100.0]},
+    ),
+    'RandomForest': (
+        lambda **p: RandomForestClassifier(random_state=42, class_weight='balanced', n_jobs=1, **p),
+        {'n_estimators': [25, 50, 100, 200], 'max_depth': [6, 10, 16, None], 'min_samples_leaf': [1, 2, 5, 10]},
+    ),
+    'GradientBoosting': (
+        lambda **p: GradientBoostingClassifier(random_state=42, **p),
+        {'n_estimators': [50, 100, 200, 300], 'learning_rate': [0.03, 0.1, 0.3], 'max_depth': [2, 3, 4, 5]},
+    ),
+}
+
+
+def sample_configs(n_per_family, seed=42):
+    rng = random.Random(seed)
+    configs = []
+    for family, (_, grid) in SEARCH_SPACE.items():
+        seen = set()
+        n_total = math.prod(len(values) for values in grid.values())
+        while len(seen) < min(n_per_family, n_total):
+            params = tuple((name, rng.choice(values)) for name, values in grid.items())
+            if params not in seen:
+                seen.add(params)
+                configs.append((family, dict(params)))
+    return configs
+
+
+def _fit(family, params, X, y, X_test, y_test):
+    start = time.perf_counter()
+    model = SEARCH_SPACE[family][0](**params).fit(X, y)
+    return model, model.score(X_test, y_test), time.perf_counter() - start
+
+
+def measure_latency(model, X, single_rows=200, batch_rows=1000):
+    """Serving latency through the compiled scorer: (single-row ms, batch us/row)."""
+    scorer = build_scorer(model)
+    rows = X[:single_rows].tolist()
+    scorer.predict_one(rows[0])
+    times = []
+    for row in rows:
+        start = time.perf_counter()
+        scorer.predict_one(row)
+        times.append(time.perf_counter() - start)
+    batch = X[:batch_rows]
+    start = time.perf_counter()
+    scorer.predict_proba(batch)
+    batch_us = (time.perf_counter() - start) / len(batch) * 1e6
+    return float(np.percentile(times, 50) * 1000), batch_us
+
+
+def _evaluate(family, params, rows, fit, X_test, slo_single_ms, slo_batch_us):
+    model, accuracy, fit_seconds = fit
+    single_ms, batch_us = measure_latency(model, X_test)
+    return {
+        'family': family, 'params': params, 'rows': rows, 'accuracy': accuracy,
+        'fit_seconds': fit_seconds, 'single_ms': single_ms, 'batch_us': batch_us,
+        'meets_slo': single_ms <= slo_single_ms and batch_us <= slo_batch_us,
+        'model': model,
+    }
+
+
+def successive_halving(X_train, y_train, X_test, y_test, budget_seconds=120.0, n_per_family=9,
+                       min_rows=1000, eta=3, slo_single_ms=1.0, slo_batch_us=50.0, n_jobs=-1, seed=42):
+    """Run the search; returns {'best', 'per_family', 'rungs', 'elapsed', 'completed'}.
+
+    Each candidate dict carries family, params, rows, accuracy, fit_seconds,
+    single_ms, batch_us, meets_slo and the fitted model.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(X_train))
+    survivors = sample_configs(n_per_family, seed)
+    rows = min(min_rows, len(X_train))
+    evaluated = []
+    rungs = []
+    last_rung_seconds = 0.0
+    completed = True
+
+    while survivors:
+        elapsed = time.perf_counter() - start
+        # Rungs cost about the same (1/eta the configs on eta times the rows)
+        if rungs and elapsed + last_rung_seconds > budget_seconds:
+            completed = False
+            break
+        rung_start = time.perf_counter()
+        idx = np.sort(order[:rows])
+        fits = Parallel(n_jobs=n_jobs)(
+            delayed(_fit)(family, params, X_train[idx], y_train[idx], X_test, y_test)
+            for family, params in survivors
+        )
+        results = [_evaluate(family, params, rows, fit, X_test, slo_single_ms, slo_batch_us)
+                   for (family, params), fit in zip(survivors, fits)]
+        results.sort(key=lambda r: (r['meets_slo'], r['accuracy']), reverse=True)
+        evaluated.extend(results)
+        last_rung_seconds = time.perf_counter() - rung_start
+        rungs.append({'rows': rows, 'candidates': len(results), 'seconds': last_rung_seconds})
+        print(f"   Rung {len(rungs)}: {len(results):3d} candidates x {rows:6d} rows  "
+              f"{last_rung_seconds:6.1f}s  best {results[0]['family']} {results[0]['accuracy']:.4f}")
+
+        if rows >= len(X_train):
+            break
+        survivors = [(r['family'], r['params']) for r in results[:max(1, len(results) // eta)]]
+        rows = min(rows * eta, len(X_train))
+
+    # Within the SLO, prefer models that reached more rows, then accuracy
+    rank = lambda r: (r['meets_slo'], r['rows'], r['accuracy'])
+    per_family = {}
+    for r in evaluated:
+        if r['family'] not in per_family or rank(r) > rank(per_family[r['family']]):
+            per_family[r['family']] = r
+    best = max(evaluated, key=rank)
+    if best['rows'] < len(X_train):
+        # The budget ran out first: the shipped model still gets the full split
+        fit = _fit(best['family'], best['params'], X_train, y_train, X_test, y_test)
+        best = _evaluate(best['family'], best['params'], len(X_train), fit, X_test, slo_single_ms, slo_batch_us)
+        per_family[best['family']] = best
+    return {
+        'best': best,
+        'per_family': per_family,
+        'rungs': rungs,
+        'elapsed': time.perf_counter() - start,
+        'completed': completed,
+    }
+
+
+def print_report(result, slo_single_ms, slo_batch_us):
+    print(f"\n⏱  Search finished in {result['elapsed']:.1f}s"
+          f"{'' if result['completed'] else ' (budget reached before the full-data rung)'}")
+    print(f"   SLO: single-row <= {slo_single_ms} ms, batch <= {slo_batch_us} us/row")
+    for family, r in result['per_family'].items():
+        slo = "✓" if r['meets_slo'] else "✗"
+        print(f"   {slo} {family:20s} acc {r['accuracy']:.4f}  single {r['single_ms']:6.3f} ms  "
+              f"batch {r['batch_us']:7.1f} us/row  ({r['rows']} rows) {r['params']}")
+    best = result['best']
+    if not best['meets_slo']:
+        print("⚠ Warning: the selected model does not meet the latency SLO")
@@ -0,0 +1,110 @@
+# serve.py
+# Multi-process launcher for ml_service
+#
+# The parent loads the model once, binds the listening socket and forks
+# ML_WORKERS uvicorn workers. Workers inherit the loaded model copy-on-write
+# (memory-mapped array artifacts are shared through the page cache anyway),
+# so adding workers costs neither a reload nor another copy of the model.
+#
+# Usage: ML_WORKERS=4 python serve.py
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import ml_service
+
+HOST = os.getenv("ML_HOST", "0.0.0.0")
+PORT = int(os.getenv("ML_PORT", 8000))
+WORKERS = int(os.getenv("ML_WORKERS", 1))
+ACCESS_LOG = os.getenv("ML_ACCESS_LOG", "1") == "1"
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, sock):
+    ml_service.worker_index = index
+    config = uvicorn.Config(ml_service.app, access_log=ACCESS_LOG)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(index, sock):
+    pid = os.fork()
+    if pid == 0:
+        # Child: default signal handling, uvicorn installs its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            run_worker(index, sock)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    if WORKERS < 1:
+        sys.exit("ML_WORKERS must be >= 1")
+
+    # Preload (and warm up) before forking so every worker starts with the
+    # model in memory and the request path already exercised
+    start = time.perf_counter()
+    if asyncio.run(ml_service.prepare()) is None:
+        print("⚠ Warning: No model available; workers will report not ready")
+    print(f"✓ Preloaded model in {(time.perf_counter() - start)*1000:.0f} ms")
+
+    # One readiness slot per worker, shared with the forked children
+    ml_service.worker_readiness = multiprocessing.Array('b', WORKERS)
+    ml_service.expected_workers = WORKERS
+
+    sock = bind_socket(HOST, PORT)
+    workers = {spawn(i, sock): i for i in range(WORKERS)}
+    print(f"✓ Serving on http://{HOST}:{PORT} with {WORKERS} worker(s)")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # Supervise: replace workers that die unexpectedly
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if index is None:
+            continue
+        ml_service.worker_readiness[index] = 0
+        if not stopping:
+            print(f"⚠ Worker {index} (pid {pid}) exited with status {status}, restarting")
+            workers[spawn(index, sock)] = index
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,566 @@
+# similar_cases.py
+# Nearest historical cases to a patient, from a persisted KD-tree over normalized vitals
+#
+# Cases come from two sources:
+# - HT1_Training_Dataset_4000.csv: priority level and clinical notes.
+# - data.csv: KTAS level, ED diagnosis and disposition.
+# Each case is a point in (age, hr, sbp, spo2, temp, rr), z-scored with the
+# index's own means and standard deviations. Missing vitals (mostly SpO2 in
+# data.csv) take the column median.
+#
+# The KD-tree splits on the widest dimension at the median until a node holds
+# LEAF_SIZE cases. Points are stored leaf by leaf, and every leaf keeps its
+# bounding box. A query takes the k-th nearest distance within its own leaf
+# as a bound, then scans, in one vectorized pass, every leaf whose box lies
+# within that bound. That is under a fifth of the cases for typical vitals.
+# A batch query sorts its rows by leaf and shares one scan per QUERY_CHUNK rows.
+#
+# The built index is plain .npy arrays keyed on the sources' sha256, like
+# dataset.py's cache. It is built ahead of time, by `python similar_cases.py
+# --build`, train_with_real_data.py or the Docker image build. ml_service
+# only memory-maps it (SimilarCases.load), so serving needs neither the CSVs,
+# pandas nor scikit-learn. New patients go into a delta buffer that queries
+# scan directly. Once it holds DELTA_MAX cases the tree is rebuilt in memory
+# with them. They are also appended to live_cases.jsonl, which is replayed on
+# the next load.
+#
+# Layout:
+#   similar_index/
+#     <key>/manifest.json      <- sources, scaling, leaf count, case count
+#     <key>/points.npy ...     <- normalized points, leaf offsets and boxes, case columns
+#     live_cases.jsonl         <- cases inserted while serving
+#
+# Usage:
+#   python similar_cases.py --build       # build and save the index if the sources changed
+#   python similar_cases.py [--rebuild]   # also benchmark latency and exactness vs. brute force
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from model_registry import file_sha256
+
+DATA_DIR = os.getenv("ML_DATA_DIR", "../data_for_ml")
+INDEX_DIR = os.getenv("ML_SIMILAR_INDEX", "similar_index")
+SOURCES = ("HT1_Training_Dataset_4000.csv", "data.csv")
+MANIFEST_FILE = "manifest.json"
+LIVE_LOG = "live_cases.jsonl"
+
+# Bump when the build logic changes so existing indexes are not reused
+BUILD_VERSION = 1
+
+SPACE = ('age', 'hr', 'sbp', 'spo2', 'temp', 'rr')
+LEAF_SIZE = 64
+DELTA_MAX = 256
+MAX_K = 50
+QUERY_CHUNK = 8  # rows sharing one candidate scan in a batch query
+
+# Case columns stored next to the points, in leaf order
+CASE_COLUMNS = ('source', 'case_id', 'priority', 'high_priority', 'summary', 'disposition')
+
+# data.csv Disposition codes
+DISPOSITIONS = {
+    1: 'discharge', 2: 'ward admission', 3: 'ICU admission', 4: 'discharge against advice',
+    5: 'transfer', 6: 'death', 7: 'surgery',
+}
+
+
+# HT1 priority levels by triage score (the dataset's own cut-offs), for live cases
+PRIORITY_LEVELS = ((85, 'CRITICAL'), (70, 'HIGH'), (50, 'MODERATE'), (0, 'LOW'))
+
+
+def priority_level(score):
+    return next(level for floor, level in PRIORITY_LEVELS if score >= floor)
+
+
+def load_sources(data_dir=DATA_DIR):
+    """(raw vitals (n, len(SPACE)) with NaN for missing, {column: array}) from the source CSVs."""
+    import pandas as pd
+
+    ht1 = pd.read_csv(os.path.join(data_dir, SOURCES[0]))
+    ht1_vitals = pd.DataFrame({
+        'age': ht1['age'],
+        'hr': ht1['heart_rate_bpm'],
+        'sbp': ht1['systolic_bp_mmhg'],
+        'spo2': ht1['oxygen_saturation_pct'],
+        'temp': ht1['temperature_celsius'],
+        'rr': ht1['respiratory_rate_per_min'],
+    })
+    ht1_cases = pd.DataFrame({
+        'source': 'ht1',
+        'case_id': ht1['patient_id'].astype(str),
+        'priority': ht1['priority_level'],
+        'high_priority': ht1['priority_level'].isin(['CRITICAL', 'HIGH']).astype(np.uint8),
+        'summary': ht1['clinical_notes'].fillna(''),
+        'disposition': '',
+    })
+
+    ktas = pd.read_csv(os.path.join(data_dir, SOURCES[1]), sep=';', encoding='latin-1')
+    ktas_vitals = pd.DataFrame({
+        name: pd.to_numeric(ktas[col], errors='coerce')
+        for name, col in zip(SPACE, ('Age', 'HR', 'SBP', 'Saturation', 'BT', 'RR'))
+    })
+    ktas_cases = pd.DataFrame({
+        'source': 'ktas',
+        'case_id': [f"ktas-{i}" for i in range(len(ktas))],
+        'priority': 'KTAS ' + ktas['KTAS_expert'].astype(str),
+        'high_priority': (ktas['KTAS_expert'] <= 3).astype(np.uint8),  # Same cut as dataset.py
+        'summary': (ktas['Diagnosis in ED'].fillna('').str.strip() + ' (' +
+                    ktas['Chief_complain'].fillna('').str.strip() + ')'),
+        'disposition': ktas['Disposition'].map(DISPOSITIONS).fillna(''),
+    })
+
+    vitals = pd.concat([ht1_vitals, ktas_vitals], ignore_index=True)
+    cases = pd.concat([ht1_cases, ktas_cases], ignore_index=True)
+    columns = {name: cases[name].to_numpy() for name in CASE_COLUMNS}
+    columns['high_priority'] = columns['high_priority'].astype(np.uint8)
+    for name in CASE_COLUMNS:
+        if name != 'high_priority':
+            columns[name] = columns[name].astype(str)
+    return vitals[list(SPACE)].to_numpy(dtype=np.float64), columns
+
+
+def build_tree(points, leaf_size=LEAF_SIZE):
+    """(order, leaf offsets): points[order] stored leaf by leaf, leaf i = offsets[i]:offsets[i+1]."""
+    order = np.arange(len(points))
+    bounds = [0]
+    stack = [(0, len(points))]
+    while stack:
+        start, end = stack.pop()
+        if end - start <= leaf_size:
+            bounds.append(end)
+            continue
+        block = points[order[start:end]]
+        dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+        mid = (start + end) // 2
+        part = np.argpartition(block[:, dim], mid - start)
+        order[start:end] = order[start:end][part]
+        # Right half pushed first so leaves come out left to right
+        stack.append((mid, end))
+        stack.append((start, mid))
+    return order, np.array(bounds, dtype=np.int64)
+
+
+def _leaf_boxes(points, offsets):
+    lo = np.minimum.reduceat(points, offsets[:-1], axis=0)
+    hi = np.maximum.reduceat(points, offsets[:-1], axis=0)
+    return lo, hi
+
+
+def _merge(best_d, best_i, cand_d, cand_i, k):
+    """Row-wise k smallest of two (rows, *) distance/index arrays."""
+    d = np.concatenate([best_d, cand_d], axis=1)
+    i = np.concatenate([best_i, cand_i], axis=1)
+    if d.shape[1] > k:
+        keep = np.argpartition(d, k - 1, axis=1)[:, :k]
+        d = np.take_along_axis(d, keep, axis=1)
+        i = np.take_along_axis(i, keep, axis=1)
+    return d, i
+
+
+class _Tree:
+    """Immutable snapshot: normalized points in leaf order, leaf offsets and boxes, case columns."""
+
+    def __init__(self, points, offsets, raw, columns):
+        self.points = np.asarray(points)  # plain view: memmap slicing is slow per call
+        self.offsets = offsets
+        self.lo, self.hi = _leaf_boxes(points, offsets)
+        self.leaf_of = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self.raw = np.asarray(raw)
+        self.columns = {name: np.asarray(values) for name, values in columns.items()}
+
+    def __len__(self):
+        return len(self.points)
+
+    def box_dist2(self, Q):
+        """(m, leaves) squared distance from each query to each leaf box."""
+        gap = np.maximum(self.lo[None] - Q[:, None], 0) + np.maximum(Q[:, None] - self.hi[None], 0)
+        return np.einsum('mld,mld->ml', gap, gap)
+
+    def _nearest(self, Q, leaves, k, bound=False):
+        """k nearest points in the given leaves for each row of Q, or the k-th distance if bound."""
+        rows = np.flatnonzero(leaves[self.leaf_of])
+        diff = self.points[rows][None] - Q[:, None]
+        d = np.einsum('mnd,mnd->mn', diff, diff)
+        if d.shape[1] <= k:
+            if bound:
+                return np.full(len(Q), np.inf)
+            return d, np.broadcast_to(rows, d.shape)
+        keep = np.argpartition(d, k - 1, axis=1)[:, :k]
+        if bound:
+            return np.take_along_axis(d, keep[:, -1:], axis=1)[:, 0]
+        return np.take_along_axis(d, keep, axis=1), rows[keep]
+
+    def query_one(self, q, k):
+        """query() for a single row, on 1-d arrays: the nearest leaf bounds the scan."""
+        gap = np.maximum(self.lo - q, 0) + np.maximum(q - self.hi, 0)
+        bd = np.einsum('ld,ld->l', gap, gap)
+        home = bd.argmin()
+        start, end = self.offsets[home], self.offsets[home + 1]
+        if end - start >= k:
+            diff = self.points[start:end] - q
+            kth = np.partition(np.einsum('nd,nd->n', diff, diff), k - 1)[k - 1]
+            rows = np.flatnonzero((bd <= kth)[self.leaf_of])
+        else:
+            rows = np.arange(len(self.points))
+        diff = self.points[rows] - q
+        d = np.einsum('nd,nd->n', diff, diff)
+        if len(d) > k:
+            keep = np.argpartition(d, k - 1)[:k]
+            d, rows = d[keep], rows[keep]
+        best_d = np.full((1, k), np.inf)
+        best_i = np.full((1, k), -1, dtype=np.int64)
+        best_d[0, :len(d)], best_i[0, :len(d)] = d, rows
+        return best_d, best_i
+
+    def query(self, Q, k):
+        """Exact k nearest for each row of Q: (m, k) squared distances and point rows, inf / -1 padded.
+
+        Rows go in chunks of neighbours (sorted by nearest leaf). The k-th distance
+        within the chunk's own leaves bounds each row; only leaves whose box is
+        within that bound of some row in the chunk are scanned.
+        """
+        bd = self.box_dist2(Q)
+        home = np.argmin(bd, axis=1)
+        order = np.argsort(home, kind='stable')
+        best_d = np.full((len(Q), k), np.inf)
+        best_i = np.full((len(Q), k), -1, dtype=np.int64)
+        for start in range(0, len(Q), QUERY_CHUNK):
+            rows = order[start:start + QUERY_CHUNK]
+            own = np.zeros(len(self.offsets) - 1, dtype=bool)
+            own[home[rows]] = True
+            kth = self._nearest(Q[rows], own, k, bound=True)
+            wanted = (bd[rows] <= kth[:, None]).any(axis=0)
+            d, i = self._nearest(Q[rows], wanted, k)
+            best_d[rows, :d.shape[1]], best_i[rows, :d.shape[1]] = d, i
+        return best_d, best_i
+
+
+class SimilarCases:
+    """Persisted KD-tree of historical cases plus a delta buffer of live ones."""
+
+    def __init__(self, points, offsets, raw, columns, mean, scale, key=None,
+                 index_dir=INDEX_DIR, delta_max=DELTA_MAX):
+        self.mean = mean
+        self.scale = scale
+        self.key = key
+        self.index_dir = index_dir
+        self.delta_max = delta_max
+        self._state = self._snapshot(_Tree(points, offsets, raw, columns))
+        self._live_ids = set()
+        self._lock = threading.Lock()
+        self.inserts = 0
+        self.compactions = 0
+
+    def _snapshot(self, tree):
+        # (tree, delta points, delta raw vitals, delta cases), swapped as one on compaction.
+        # Inserts write a buffer row before appending its case, so len(cases) rows are valid.
+        return (tree, np.empty((self.delta_max, len(SPACE))), np.empty((self.delta_max, len(SPACE))), [])
+
+    # ---- build / persist / load -------------------------------------------------
+
+    @classmethod
+    def build(cls, data_dir=DATA_DIR, leaf_size=LEAF_SIZE, **kwargs):
+        raw, columns = load_sources(data_dir)
+        filled = np.where(np.isnan(raw), np.nanmedian(raw, axis=0), raw)
+        mean = filled.mean(axis=0)
+        scale = filled.std(axis=0)
+        scale[scale == 0] = 1.0
+        points = (filled - mean) / scale
+        order, offsets = build_tree(points, leaf_size)
+        columns = {name: values[order] for name, values in columns.items()}
+        return cls(points[order], offsets, raw[order], columns, mean, scale, **kwargs)
+
+    def save(self, key, sources, index_dir=INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        # Build in a temp dir and rename into place, like registry versions
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=index_dir)
+        tree = self._state[0]
+        try:
+            arrays = {'points': tree.points, 'offsets': tree.offsets, 'raw': tree.raw,
+                      'mean': self.mean, 'scale': self.scale, **tree.columns}
+            for name, values in arrays.items():
+                np.save(os.path.join(staging, f"{name}.npy"), values)
+            manifest = {
+                'key': key,
+                'build_version': BUILD_VERSION,
+                'sources': sources,
+                'space': list(SPACE),
+                'n_cases': len(tree),
+                'n_leaves': len(tree.offsets) - 1,
+                'mean': self.mean.round(4).tolist(),
+                'scale': self.scale.round(4).tolist(),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            }
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            target = os.path.join(index_dir, key)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.rename(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        # Indexes of older source versions are never read again
+        for name in os.listdir(index_dir):
+            path = os.path.join(index_dir, name)
+            if name != key and not name.startswith('.') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        self.key = key
+        return manifest
+
+    @classmethod
+    def read(cls, key, index_dir=INDEX_DIR, mmap=True, **kwargs):
+        path = os.path.join(index_dir, key)
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+                  for name in ('points', 'offsets', 'raw', 'mean', 'scale') + CASE_COLUMNS}
+        columns = {name: arrays[name] for name in CASE_COLUMNS}
+        return cls(arrays['points'], np.asarray(arrays['offsets']), arrays['raw'], columns,
+                   np.asarray(arrays['mean']), np.asarray(arrays['scale']), key=key, index_dir=index_dir, **kwargs)
+
+    @classmethod
+    def open(cls, data_dir=DATA_DIR, index_dir=INDEX_DIR, rebuild=False, **kwargs):
+        """The index for the current sources: memory-mapped when built before, else built and saved.
+
+        Cases in live_cases.jsonl are replayed into the delta buffer.
+        """
+        start = time.perf_counter()
+        key, sources = cache_key(data_dir)
+        if not rebuild and os.path.exists(os.path.join(index_dir, key, MANIFEST_FILE)):
+            index = cls.read(key, index_dir, **kwargs)
+            built = False
+        else:
+            index = cls.build(data_dir, index_dir=index_dir, **kwargs)
+            index.save(key, sources, index_dir)
+            built = True
+        replayed = index.replay(os.path.join(index_dir, LIVE_LOG))
+        print(f"✓ Similar-cases index {key} {'built' if built else 'loaded'} "
+              f"({len(index._state[0])} cases, {replayed} live) in {(time.perf_counter() - start)*1000:.0f} ms")
+        return index
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR, data_dir=DATA_DIR, **kwargs):
+        """The saved index, memory-mapped and never built; raises FileNotFoundError when none was built.
+
+        Cases in live_cases.jsonl are replayed into the delta buffer.
+        """
+        start = time.perf_counter()
+        keys = [name for name in os.listdir(index_dir)
+                if os.path.exists(os.path.join(index_dir, name, MANIFEST_FILE))] if os.path.isdir(index_dir) else []
+        if not keys:
+            raise FileNotFoundError(f"no similar-cases index in '{index_dir}'; build it with "
+                                    f"`python similar_cases.py --build`")
+        key = max(keys, key=lambda name: os.path.getmtime(os.path.join(index_dir, name, MANIFEST_FILE)))
+        index = cls.read(key, index_dir, **kwargs)
+        if all(os.path.exists(os.path.join(data_dir, name)) for name in SOURCES) and cache_key(data_dir)[0] != key:
+            print(f"⚠ Warning: similar-cases index {key} was built from older sources; "
+                  f"rebuild it with `python similar_cases.py --build`")
+        replayed = index.replay(os.path.join(index_dir, LIVE_LOG))
+        print(f"✓ Similar-cases index {key} loaded ({len(index._state[0])} cases, {replayed} live) "
+              f"in {(time.perf_counter() - start)*1000:.0f} ms")
+        return index
+
+    def replay(self, path):
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    case = json.loads(line)
+                    self.insert(case.pop('vitals'), log=False, **case)
+                    count += 1
+                except (ValueError, KeyError, TypeError):
+                    continue  # A torn last line from a crash
+        return count
+
+    # ---- queries ----------------------------------------------------------------
+
+    def normalize(self, vitals):
+        """Raw (m, len(SPACE)) vitals -> index space; NaN takes the index mean."""
+        X = (np.asarray(vitals, dtype=np.float64) - self.mean) / self.scale
+        X[np.isnan(X)] = 0.0
+        return X
+
+    def search(self, vitals, k=5):
+        """k nearest cases for each row of raw vitals: [[(distance, case dict), ...], ...]."""
+        k = max(1, min(int(k), MAX_K))
+        Q = self.normalize(np.atleast_2d(vitals))
+        state = self._state
+        tree, delta, _, cases = state
+        n_delta = len(cases)
+        delta = delta[:n_delta]
+        best_d, best_i = tree.query_one(Q[0], k) if len(Q) == 1 else tree.query(Q, k)
+        if n_delta:
+            diff = delta[None] - Q[:, None]
+            d = np.einsum('mnd,mnd->mn', diff, diff)
+            idx = np.broadcast_to(np.arange(len(tree), len(tree) + n_delta), d.shape)
+            best_d, best_i = _merge(best_d, best_i, d, idx, k)
+        order = np.argsort(best_d, axis=1)
+        best_d = np.take_along_axis(best_d, order, axis=1)
+        best_i = np.take_along_axis(best_i, order, axis=1)
+        return [[(float(np.sqrt(d)), self.case(i, state)) for d, i in zip(row_d, row_i) if i >= 0]
+                for row_d, row_i in zip(best_d, best_i)]
+
+    def case(self, row, state=None):
+        tree, _, delta_raw, cases = state or self._state
+        if row >= len(tree):
+            case = dict(cases[row - len(tree)])
+            raw = delta_raw[row - len(tree)]
+        else:
+            case = {name: tree.columns[name][row].item() for name in CASE_COLUMNS}
+            raw = tree.raw[row]
+        case['high_priority'] = bool(case['high_priority'])
+        case['disposition'] = case['disposition'] or None
+        case['vitals'] = {name: (None if v != v else round(v, 1)) for name, v in zip(SPACE, raw.tolist())}
+        return case
+
+    # ---- live inserts -----------------------------------------------------------
+
+    def insert(self, vitals, case_id, priority='', high_priority=False, summary='', source='live',
+               disposition='', log=True):
+        """Add a case; the next query sees it. Returns False for an id already inserted."""
+        case_id = str(case_id)
+        with self._lock:
+            if case_id in self._live_ids:
+                return False
+            raw = np.array([np.nan if v is None else v for v in vitals], dtype=np.float64)
+            _, delta, delta_raw, cases = self._state
+            n = len(cases)
+            delta[n] = self.normalize(raw[None])[0]
+            delta_raw[n] = raw
+            cases.append({'source': source, 'case_id': case_id, 'priority': priority,
+                          'high_priority': int(bool(high_priority)), 'summary': summary,
+                          'disposition': disposition})
+            self._live_ids.add(case_id)
+            self.inserts += 1
+            if log:
+                os.makedirs(self.index_dir, exist_ok=True)
+                with open(os.path.join(self.index_dir, LIVE_LOG), 'a') as f:
+                    f.write(json.dumps({'vitals': [None if np.isnan(v) else v for v in raw.tolist()],
+                                        'case_id': case_id, 'priority': priority,
+                                        'high_priority': bool(high_priority), 'summary': summary,
+                                        'source': source, 'disposition': disposition}) + '\n')
+            if len(cases) >= self.delta_max:
+                self._compact()
+            return True
+
+    def _compact(self):
+        """Rebuild the tree with the delta buffer folded in (in memory; the log keeps the cases)."""
+        tree, delta, delta_raw, cases = self._state
+        n = len(cases)
+        points = np.concatenate([tree.points, delta[:n]])
+        raw = np.concatenate([tree.raw, delta_raw[:n]])
+        columns = {}
+        for name in CASE_COLUMNS:
+            values = [c[name] for c in cases]
+            if name == 'high_priority':
+                columns[name] = np.concatenate([tree.columns[name], np.array(values, dtype=np.uint8)])
+            else:
+                columns[name] = np.concatenate([np.asarray(tree.columns[name]).astype(str),
+                                                np.array(values, dtype=str)])
+        order, offsets = build_tree(points, LEAF_SIZE)
+        # Fresh buffers: a search still holding the old snapshot keeps reading the old ones
+        self._state = self._snapshot(_Tree(points[order], offsets, raw[order],
+                                           {k: v[order] for k, v in columns.items()}))
+        self.compactions += 1
+
+    def stats(self):
+        tree, _, _, cases = self._state
+        return {
+            'key': self.key,
+            'cases': len(tree) + len(cases),
+            'leaves': len(tree.offsets) - 1,
+            'delta': len(cases),
+            'inserts': self.inserts,
+            'compactions': self.compactions,
+        }
+
+
+def cache_key(data_dir=DATA_DIR):
+    sources = {name: file_sha256(os.path.join(data_dir, name)) for name in SOURCES}
+    h = hashlib.sha256(json.dumps({'build': BUILD_VERSION, 'leaf_size': LEAF_SIZE, 'sources': sources},
+                                  sort_keys=True).encode())
+    return h.hexdigest()[:16], sources
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the similar-cases index and benchmark it")
+    parser.add_argument('--rebuild', action='store_true', help="ignore an existing index")
+    parser.add_argument('--build', action='store_true', help="only build and save the index, then exit")
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.build:
+        SimilarCases.open(rebuild=args.rebuild)
+        raise SystemExit(0)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # The benchmark inserts cases; keep them out of the real live log
+        index = SimilarCases.open(rebuild=args.rebuild)
+        index = SimilarCases.read(index.key, INDEX_DIR)
+        index.index_dir = scratch
+        rng = np.random.default_rng(0)
+        raw = np.asarray(index._state[0].raw)
+        picks = raw[rng.integers(0, len(raw), args.queries)]
+        queries = np.where(np.isnan(picks), np.nanmedian(raw, axis=0), picks) + rng.normal(0, 2, picks.shape)
+
+        def brute(Q, k):
+            tree, delta, _, cases = index._state
+            points = np.concatenate([tree.points, delta[:len(cases)]])
+            diff = points[None] - Q[:, None]
+            d = np.einsum('mnd,mnd->mn', diff, diff)
+            return np.take_along_axis(d, np.argpartition(d, k - 1, axis=1)[:, :k], axis=1)
+
+        def check(Q):
+            got = index.search(Q, args.k)
+            expected = np.sqrt(np.sort(brute(index.normalize(Q), args.k), axis=1))
+            return sum(not np.allclose([d for d, _ in row], exp) for row, exp in zip(got, expected))
+
+        def per_row_us(fn, rows):
+            start = time.perf_counter()
+            fn(rows)
+            return (time.perf_counter() - start) / len(queries) * 1e6
+
+        Q = index.normalize(queries)
+        tree = index._state[0]
+        lookup_us = per_row_us(lambda rows: [tree.query_one(q, args.k) for q in rows], Q)
+        brute_us = per_row_us(lambda rows: [brute(q[None], args.k) for q in rows], Q)
+        batch_us = per_row_us(lambda rows: tree.query(rows, args.k), Q)
+        brute_batch_us = per_row_us(lambda rows: [brute(rows[i:i + 64], args.k)
+                                                  for i in range(0, len(rows), 64)], Q)
+        single_us = per_row_us(lambda rows: [index.search(q, args.k) for q in rows], queries)
+        mismatches = check(queries[:500]) + sum(check(q[None]) for q in queries[:200])
+
+        start = time.perf_counter()
+        for i, q in enumerate(queries[:DELTA_MAX - 1]):
+            index.insert(q, f"bench-{i}", priority='LOW')
+        insert_us = (time.perf_counter() - start) / (DELTA_MAX - 1) * 1e6
+        start = time.perf_counter()
+        for q in queries[:500]:
+            index.search(q, args.k)
+        delta_us = (time.perf_counter() - start) / 500 * 1e6
+        mismatches += check(queries[:500]) + sum(check(q[None]) for q in queries[:100])
+        start = time.perf_counter()
+        index.insert(queries[-1], "bench-compact")
+        compact_ms = (time.perf_counter() - start) * 1000
+        mismatches += check(queries[:500])
+
+        stats = index.stats()
+        print(f"{stats['cases'] - DELTA_MAX:,} cases in {stats['leaves']} leaves, k={args.k}")
+        print(f"  neighbour lookup {lookup_us:.0f} us (numpy brute force {brute_us:.0f} us); "
+              f"batch of {len(queries):,} {batch_us:.0f} us per row (brute force {brute_batch_us:.0f} us)")
+        print(f"  search() with case records {single_us:.0f} us")
+        print(f"  insert {insert_us:.0f} us; single query with {DELTA_MAX - 1} cases in the delta "
+              f"{delta_us:.0f} us; compaction {compact_ms:.1f} ms")
+        print(f"  {'✓' if not mismatches else '⚠'} neighbours match brute force ({mismatches} mismatches)")
@@ -0,0 +1,354 @@
+# sla_scheduler.py
+# SLA deadlines for waiting patients on a hierarchical timing wheel
+#
+# Every waiting patient has a deadline: arrival + the SLA of their triage score
+# tier (SLA_TIERS). Deadlines sit in a hierarchical timing wheel:
+# - Level 0 has one slot per tick.
+# - Each level above has slots as wide as the whole level below.
+# Scheduling and cancelling are a dict insert/delete, O(1). When the clock
+# crosses a higher-level slot, its timers cascade down a level, so each
+# timer moves at most len(WHEEL_SLOTS) - 1 times. A breach therefore costs
+# O(1) amortized and fires on the first tick at or after its deadline.
+# Nothing rescans the waiting patients.
+#
+# ml_service drives the wheel from an asyncio task and feeds it the same
+# writes as the queue engine (queue_engine.py). Breaches go into a numbered
+# log that the backend long-polls through GET /sla/breaches.
+#
+# Usage: python sla_scheduler.py [--patients 50000]   # simulation vs. the 30 s scan
+
+import itertools
+import math
+import threading
+import time
+import uuid
+from collections import deque
+
+# (minimum triage score, minutes until the patient must be seen); highest first.
+# Nobody waits longer than the backend's old flat 30-minute SLA.
+SLA_TIERS = ((85, 10), (60, 20), (0, 30))
+
+TICK_SECONDS = 1.0
+WHEEL_SLOTS = (256, 64, 64, 64)  # 1 s ticks: 4.3 min, 4.6 h, 12 days, 2.1 years
+
+
+def parse_tiers(spec):
+    """'85:10,60:20,0:30' -> ((85, 10.0), (60, 20.0), (0, 30.0))."""
+    tiers = []
+    for part in spec.split(','):
+        score, minutes = part.split(':')
+        tiers.append((float(score), float(minutes)))
+    return tuple(sorted(tiers, reverse=True))
+
+
+def sla_minutes(score, tiers=SLA_TIERS):
+    for min_score, minutes in tiers:
+        if score >= min_score:
+            return minutes
+    return tiers[-1][1]
+
+
+class TimingWheel:
+    """key -> (deadline, payload) timers; advance(now) returns the ones that came due."""
+
+    def __init__(self, tick=TICK_SECONDS, slots=WHEEL_SLOTS, now=None):
+        self.tick = tick
+        self.sizes = slots
+        self.spans = [math.prod(slots[:level]) for level in range(len(slots))]  # Ticks per slot
+        self.current = int((time.time() if now is None else now) // tick)  # Last tick processed
+        self.wheels = [[{} for _ in range(size)] for size in slots]
+        self.overflow = {}
+        self._due = {}  # Timers that were already due when added
+        self._timers = {}  # key -> [expire tick, deadline, payload, bucket]
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def deadline(self, key):
+        record = self._timers.get(key)
+        return record[1] if record is not None else None
+
+    def schedule(self, key, deadline, payload=None):
+        """Add or move key's timer; O(1)."""
+        self.cancel(key)
+        record = [math.ceil(deadline / self.tick), deadline, payload, None]
+        self._timers[key] = record
+        self._place(key, record)
+
+    def cancel(self, key):
+        record = self._timers.pop(key, None)
+        if record is None:
+            return False
+        del record[3][key]
+        return True
+
+    def _place(self, key, record):
+        expire = record[0]
+        if expire <= self.current:
+            bucket = self._due
+        else:
+            for level, (size, span) in enumerate(zip(self.sizes, self.spans)):
+                # The window this level covers starts at the current tick rounded to its slot width
+                if expire < self.current - self.current % span + size * span:
+                    bucket = self.wheels[level][(expire // span) % size]
+                    break
+            else:
+                bucket = self.overflow
+        record[3] = bucket
+        bucket[key] = record
+
+    def _take(self, bucket):
+        items = list(bucket.items())
+        bucket.clear()
+        return items
+
+    def advance(self, now=None):
+        """Process every tick up to now; [(key, deadline, payload)] that came due."""
+        target = int((time.time() if now is None else now) // self.tick)
+        fired = []
+        for key, record in self._take(self._due):
+            del self._timers[key]
+            fired.append((key, record[1], record[2]))
+        top = len(self.sizes) - 1
+        while self.current < target:
+            self.current += 1
+            t = self.current
+            if t % (self.spans[top] * self.sizes[top]) == 0:
+                for key, record in self._take(self.overflow):
+                    self._place(key, record)
+            # Cascade from the top so a timer can drop several levels in one tick
+            for level in range(top, 0, -1):
+                span = self.spans[level]
+                if t % span == 0:
+                    for key, record in self._take(self.wheels[level][(t // span) % self.sizes[level]]):
+                        self._place(key, record)
+            for bucket in (self.wheels[0][t % self.sizes[0]], self._due):
+                for key, record in self._take(bucket):
+                    del self._timers[key]
+                    fired.append((key, record[1], record[2]))
+        return fired
+
+
+class SlaScheduler:
+    """Per-patient SLA deadlines plus a numbered log of the breaches they fired."""
+
+    def __init__(self, tiers=SLA_TIERS, tick=TICK_SECONDS, log_size=10000, now=None):
+        self.tiers = tiers
+        self.wheel = TimingWheel(tick, now=now)
+        self.log = deque(maxlen=log_size)
+        self.stream_id = uuid.uuid4().hex[:12]  # Changes on restart, so pollers know to start over
+        self._seq = itertools.count(1)
+        self.last_seq = 0
+        self._breached = set()  # Breached during their current wait; not rescheduled
+        self._lock = threading.Lock()
+        self.fired = 0
+        self.max_late_seconds = 0.0
+
+    def track(self, patient_id, hospital_id, score, arrival, status, now=None):
+        """Schedule, move or cancel a patient's deadline after any change; O(1)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._track(str(patient_id), hospital_id, score, arrival, status, now)
+
+    def _track(self, patient_id, hospital_id, score, arrival, status, now):
+        # Caller holds self._lock
+        if status != 'waiting':
+            self.wheel.cancel(patient_id)
+            self._breached.discard(patient_id)
+            return None
+        if patient_id in self._breached:
+            return None
+        minutes = sla_minutes(score, self.tiers)
+        deadline = arrival + minutes * 60
+        # A deadline that is already past when set (a rescore into a stricter tier) is due now
+        payload = (hospital_id, score, arrival, minutes, max(deadline, now))
+        if self.wheel.deadline(patient_id) != deadline:
+            self.wheel.schedule(patient_id, deadline, payload)
+        else:
+            # Same deadline, fresher payload (e.g. transferred to another hospital)
+            self.wheel._timers[patient_id][2] = payload[:4] + self.wheel._timers[patient_id][2][4:]
+        return deadline
+
+    def forget(self, patient_id):
+        patient_id = str(patient_id)
+        with self._lock:
+            self._breached.discard(patient_id)
+            return self.wheel.cancel(patient_id)
+
+    def replace(self, patients, now=None):
+        """Rebuild from (patient_id, hospital_id, score, arrival, status) rows.
+
+        Patients already reported as breached stay quiet if they are still
+        waiting, so a periodic resync does not repeat their events. The lock
+        is held for the whole rebuild, so a concurrent track() or forget()
+        lands either before it (and is replaced by the snapshot) or after it.
+        """
+        clock = time.time() if now is None else now
+        with self._lock:
+            breached, self._breached = self._breached, set()
+            self.wheel = TimingWheel(self.wheel.tick, self.wheel.sizes, now=now)
+            for patient_id, hospital_id, score, arrival, status in patients:
+                patient_id = str(patient_id)
+                if status == 'waiting' and patient_id in breached:
+                    self._breached.add(patient_id)
+                else:
+                    self._track(patient_id, hospital_id, score, arrival, status, clock)
+
+    def advance(self, now=None):
+        """Fire every deadline up to now into the log; returns the new events."""
+        now = time.time() if now is None else now
+        with self._lock:
+            events = []
+            for patient_id, deadline, (hospital_id, score, arrival, minutes, due) in self.wheel.advance(now):
+                self._breached.add(patient_id)
+                late = max(0.0, now - due)
+                self.max_late_seconds = max(self.max_late_seconds, late)
+                event = {
+                    'seq': next(self._seq),
+                    'patient_id': patient_id,
+                    'hospital_id': hospital_id,
+                    'triage_score': score,
+                    'sla_minutes': minutes,
+                    'wait_time_mins': round((now - arrival) / 60),
+                    'deadline': deadline,
+                    'fired_at': now,
+                    'late_seconds': round(late, 3),
+                }
+                self.log.append(event)
+                events.append(event)
+            if events:
+                self.last_seq = events[-1]['seq']
+                self.fired += len(events)
+            return events
+
+    def events_after(self, seq):
+        with self._lock:
+            if seq >= self.last_seq:
+                return []
+            return [e for e in itertools.islice(self.log, max(0, len(self.log) - (self.last_seq - seq)), None)]
+
+    def next_tick_at(self):
+        return (self.wheel.current + 1) * self.wheel.tick
+
+    def stats(self):
+        return {
+            'scheduled': len(self.wheel),
+            'breached_waiting': len(self._breached),
+            'fired': self.fired,
+            'last_seq': self.last_seq,
+            'max_late_seconds': round(self.max_late_seconds, 3),
+            'tiers': [{'min_score': s, 'minutes': m} for s, m in self.tiers],
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import heapq
+    import random
+
+    parser = argparse.ArgumentParser(description="SLA scheduler simulation vs. a periodic full scan")
+    parser.add_argument("--patients", type=int, default=50000, help="Concurrently waiting patients")
+    parser.add_argument("--minutes", type=float, default=60, help="Simulated time")
+    parser.add_argument("--scan-interval", type=float, default=30, help="Seconds between scans (old SLA worker)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    t0 = 1_700_000_000.0
+    end = t0 + args.minutes * 60
+    sla = SlaScheduler(now=t0)
+    patients = {}  # id -> [score, arrival, status]
+
+    # Reference for the parity check: a heap with lazy deletion, same breach-once-per-wait rule
+    ref_deadline, ref_heap, ref_breached = {}, [], set()
+
+    def ref_track(pid):
+        score, arrival, status = patients[pid]
+        if status != 'waiting':
+            ref_deadline.pop(pid, None)
+            ref_breached.discard(pid)
+        elif pid not in ref_breached:
+            ref_deadline[pid] = arrival + sla_minutes(score) * 60
+            heapq.heappush(ref_heap, (ref_deadline[pid], pid))
+
+    def ref_advance(now):
+        due = set()
+        while ref_heap and ref_heap[0][0] <= now:
+            deadline, pid = heapq.heappop(ref_heap)
+            if ref_deadline.get(pid) == deadline:
+                del ref_deadline[pid]
+                ref_breached.add(pid)
+                due.add(str(pid))
+        return due
+
+    # Start with a full waiting room, then keep it full: arrivals, rescores, and patients being seen
+    ops = []
+    start = time.perf_counter()
+    for i in range(args.patients):
+        arrival = t0 - rng.uniform(0, 25 * 60)
+        patients[i] = [rng.randint(5, 99), arrival, 'waiting']
+        sla.track(i, 1, patients[i][0], arrival, 'waiting', t0)
+    schedule_us = (time.perf_counter() - start) / args.patients * 1e6
+    for i in range(args.patients):
+        ref_track(i)
+
+    events_per_second = args.patients / 900  # About one patient in 15 minutes turns over per second
+    next_id = args.patients
+    fired = []
+    late = []
+    mismatches = 0
+    update_s = advance_s = 0.0
+    n_updates = 0
+    now = t0
+    while now < end:
+        now += 1.0
+        changed = []
+        start = time.perf_counter()
+        for _ in range(int(events_per_second)):
+            roll = rng.random()
+            if roll < 0.4:
+                pid = next_id
+                next_id += 1
+                patients[pid] = [rng.randint(5, 99), now, 'waiting']
+            else:
+                pid = rng.randrange(next_id)
+                if patients[pid][2] != 'waiting':
+                    continue
+                if roll < 0.7:
+                    patients[pid][0] = rng.randint(5, 99)
+                else:
+                    patients[pid][2] = 'in_treatment'
+            sla.track(pid, 1, patients[pid][0], patients[pid][1], patients[pid][2], now)
+            changed.append(pid)
+            n_updates += 1
+        update_s += time.perf_counter() - start
+        start = time.perf_counter()
+        events = sla.advance(now)
+        advance_s += time.perf_counter() - start
+        fired += events
+        late += [e['late_seconds'] for e in events]
+        for pid in changed:
+            ref_track(pid)
+        mismatches += len({e['patient_id'] for e in events} ^ ref_advance(now))
+
+
+    # The old worker: scan every waiting patient each interval, then one lookup per overdue one
+    waiting = [(p[0], p[1]) for p in patients.values() if p[2] == 'waiting']
+    start = time.perf_counter()
+    overdue = [1 for score, arrival in waiting if now - arrival > 30 * 60]
+    scan_ms = (time.perf_counter() - start) * 1000
+    scans = int(args.minutes * 60 / args.scan_interval)
+
+    print(f"{args.patients:,} waiting patients, {args.minutes:.0f} simulated minutes, "
+          f"{n_updates:,} check-ins/rescores/status changes")
+    print(f"  schedule {schedule_us:.1f} us, reschedule/cancel {update_s / max(n_updates, 1) * 1e6:.1f} us per change")
+    print(f"  {len(fired):,} breaches fired; advancing the clock cost {advance_s * 1000:.0f} ms in total "
+          f"({advance_s / max(len(fired), 1) * 1e6:.1f} us per breach)")
+    print(f"  lateness: max {max(late, default=0):.2f} s, mean {sum(late) / max(len(late), 1):.2f} s "
+          f"(tick {sla.wheel.tick:.0f} s)")
+    print(f"  old worker: {scans} scans x {len(waiting):,} rows ({scan_ms:.1f} ms in-process each, "
+          f"plus the table read and {len(overdue):,} alert lookups), up to {args.scan_interval:.0f} s late")
+    print(f"  {'✓' if not mismatches else '⚠'} every second's breaches match a reference heap "
+          f"({mismatches} differences)")
@@ -0,0 +1,253 @@
+# symptoms.py
+# Free-text symptom recognition with a compiled multi-keyword matcher
+#
+# The synonym table is compiled once into an Aho-Corasick automaton, so a
+# complaint is scanned for every phrase in a single linear pass, with no
+# per-row regexes. Text is lowercased and punctuation is folded to spaces
+# with str.translate. Phrases match on word boundaries; a trailing '*' makes
+# a phrase a prefix ('dyspn*' matches dyspnea and dyspnoea).
+#
+# A negation cue ('no', 'denies', 'without', "doesn't", ...) drops every
+# match after it up to the end of its clause, so "no chest pain or SOB, has
+# fever" finds only fever. Clauses end at punctuation and at 'but'. Cues and
+# clause breaks are marker phrases in the same automaton, so negation costs
+# nothing beyond the one scan.
+#
+# Used by ml_service (symptom lists and free-text complaints) and by
+# dataset.py (the Chief_complain column of data.csv).
+#
+# Usage: python symptoms.py   # coverage on the bundled datasets + throughput vs regex
+
+import functools
+import string
+from collections import deque
+
+import numpy as np
+
+# Canonical symptom -> phrases. The first two feed the model's chest_pain and
+# breathless features, the strongest inputs it has, so they list only phrases
+# that name the symptom itself (no 'heart*', which matches heartburn). The
+# rest cover the vocabulary of medical_triage_500.csv and the most common
+# data.csv complaints. Two-letter abbreviations ('ha', 'dz') are left out:
+# they collide with ordinary words.
+SYNONYMS = {
+    'chest_pain': ['chest pain', 'chest tightness', 'chest discomfort', 'chest pressure', 'tight chest',
+                   'angina*'],
+    'shortness_of_breath': ['shortness of breath', 'short of breath', 'breathless*', 'breathing difficulty',
+                            'difficulty breathing', 'trouble breathing', 'can t breathe', 'cannot breathe',
+                            'unable to breathe', 'dyspn*', 'sob'],
+    'altered_consciousness': ['altered consciousness', 'mental change', 'confusion', 'confused',
+                              'unresponsive', 'syncope', 'loss of consciousness', 'stupor'],
+    'abdominal_pain': ['abdominal pain', 'abd pain', 'abd', 'abdomen pain', 'epigastric pain',
+                       'ruq pain', 'rlq pain', 'llq pain', 'luq pain', 'pain abdominal', 'stomach ache'],
+    'blurred_vision': ['blurred vision', 'blurry vision', 'visual disturbance', 'blurring'],
+    'diarrhea': ['diarrhea', 'diarrhoea', 'loose stool*'],
+    'dizziness': ['dizziness', 'dizzy', 'vertigo', 'lightheaded*'],
+    'fever': ['fever', 'febrile', 'pyrexia', 'high temperature', 'chills'],
+    'headache': ['headache', 'head ache', 'migraine'],
+    'joint_pain': ['joint pain', 'arthralgia', 'knee pain', 'ankle pain', 'shoulder pain'],
+    'rash': ['rash', 'urticaria*', 'hives', 'skin eruption'],
+    'vomiting': ['vomiting', 'vomit*', 'emesis', 'hematemesis'],
+    'nausea': ['nausea', 'nauseous'],
+    'bleeding': ['bleeding', 'hemorrhage', 'haemorrhage', 'hematochezia', 'melena', 'epistaxis'],
+    'seizure': ['seizure*', 'convulsion*', 'fits'],
+    'palpitations': ['palpitation*'],
+    'weakness': ['weakness', 'general weakness', 'motor weakness', 'fatigue'],
+    'injury': ['injury', 'wound', 'laceration', 'fracture', 'trauma'],
+}
+
+# Lowercase, every non-alphanumeric character becomes a space
+_FOLD = str.maketrans(
+    string.ascii_uppercase + string.punctuation + '\t\n\r',
+    string.ascii_lowercase + ' ' * (len(string.punctuation) + 3),
+)
+
+# Phrases that negate the rest of their clause, and words that end a clause
+NEGATION_CUES = ['no', 'not', 'never', 'without', 'denies', 'denied', 'deny', 'denying', 'negative for',
+                 "doesn't", "don't", "didn't", "isn't", "wasn't", "hasn't", "haven't"]
+CLAUSE_WORDS = ['but']
+
+# For scanning, clause-ending punctuation becomes '|' instead of a space. The
+# scan steps the automaton over it as a space (so 'pain, abdominal' still
+# matches 'pain abdominal') and then ends the clause.
+_CLAUSE_MARK = '|'
+_SCAN_FOLD = {**_FOLD, **{ord(ch): _CLAUSE_MARK for ch in '.;:,!?\n'}}
+
+# Automaton outputs besides symptom indices
+_NEGATE = -1
+_BREAK = -2
+
+
+def normalize(text):
+    return ' ' + ' '.join(text.translate(_FOLD).split()) + ' '
+
+
+class SymptomMatcher:
+    """Aho-Corasick automaton over the synonym phrases."""
+
+    def __init__(self, synonyms=SYNONYMS):
+        self.symptoms = list(synonyms)
+        self.index = {name: i for i, name in enumerate(self.symptoms)}
+        # Node 0 is the root; goto[node] maps a character to the next node
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for name, phrases in synonyms.items():
+            for phrase in phrases:
+                prefix = phrase.endswith('*')
+                key = normalize(phrase.rstrip('*'))
+                self._add(key[:-1] if prefix else key, self.index[name])
+        for cue in NEGATION_CUES:
+            self._add(normalize(cue), _NEGATE)
+        for word in CLAUSE_WORDS:
+            self._add(f' {word} ', _BREAK)
+        self._build_failure_links()
+        self.find = functools.lru_cache(maxsize=8192)(self._find)
+
+    def _add(self, key, symptom):
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] = self._out[node] + (symptom,)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _find(self, text):
+        """Canonical symptoms mentioned in text, as a frozenset of indices."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        negated = False
+        scan = ' '.join(text.translate(_SCAN_FOLD).split()).replace('| ', '|').replace(' |', '|')
+        for ch in ' ' + scan + ' ':
+            mark = ch == '|'
+            if mark:
+                ch = ' '
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for hit in out[node]:
+                if hit >= 0:
+                    if not negated:
+                        found.add(hit)
+                else:
+                    negated = hit == _NEGATE
+            if mark:
+                negated = False
+        return frozenset(found)
+
+    def match(self, texts):
+        """Union of find() over one or more texts."""
+        if isinstance(texts, str):
+            return self.find(texts)
+        if len(texts) == 1:
+            return self.find(texts[0])
+        found = frozenset()
+        for text in texts:
+            found |= self.find(text)
+        return found
+
+    def names(self, texts):
+        """Canonical symptom names found across one or more texts."""
+        return self.names_of(self.match(texts))
+
+    @functools.lru_cache(maxsize=4096)
+    def names_of(self, found):
+        return tuple(sorted(self.symptoms[i] for i in found))
+
+    def flags(self, texts, symptoms=None):
+        """0/1 per symptom (default: all, in self.symptoms order) for one text or list of texts."""
+        found = self.match(texts)
+        symptoms = self.symptoms if symptoms is None else symptoms
+        return [1 if self.index[s] in found else 0 for s in symptoms]
+
+    def flag_matrix(self, texts, symptoms=None):
+        """(n, k) uint8 flags for a column of texts; each distinct text is scanned once."""
+        symptoms = self.symptoms if symptoms is None else symptoms
+        cols = np.array([self.index[s] for s in symptoms], dtype=np.int64)
+        codes = {}
+        inverse = np.empty(len(texts), dtype=np.int64)
+        uniques = []
+        for i, text in enumerate(texts):
+            text = text if isinstance(text, str) else ''
+            code = codes.get(text)
+            if code is None:
+                code = codes[text] = len(uniques)
+                uniques.append(text)
+            inverse[i] = code
+        table = np.zeros((len(uniques), len(self.symptoms)), dtype=np.uint8)
+        for row, text in enumerate(uniques):
+            for idx in self._find(text):
+                table[row, idx] = 1
+        return table[inverse][:, cols]
+
+
+@functools.lru_cache(maxsize=1)
+def default_matcher():
+    return SymptomMatcher(SYNONYMS)
+
+
+if __name__ == "__main__":
+    import os
+    import re
+    import time
+
+    import pandas as pd
+
+    data_dir = os.getenv("ML_DATA_DIR", "../data_for_ml")
+    matcher = default_matcher()
+
+    vocab = pd.read_csv(os.path.join(data_dir, "medical_triage_500.csv"))['symptoms']
+    terms = sorted({t.strip() for row in vocab for t in row.split(';')})
+    missing = [t for t in terms if not matcher.names(t)]
+    print(f"medical_triage_500.csv: {len(terms) - len(missing)}/{len(terms)} terms recognized"
+          + (f" (missing: {missing})" if missing else ""))
+
+    complaints = pd.read_csv(os.path.join(data_dir, "data.csv"), sep=';', encoding='latin-1')['Chief_complain']
+    complaints = complaints.fillna('').str.lower()
+    flags = matcher.flag_matrix(complaints.tolist())
+    print(f"data.csv Chief_complain: {(flags.sum(axis=1) > 0).mean()*100:.1f}% of {len(complaints)} rows "
+          f"mapped to at least one symptom")
+
+    # Throughput on a large column: regex str.contains (as train_with_real_data.py did) vs the automaton
+    big = pd.concat([complaints] * 100, ignore_index=True)
+    start = time.perf_counter()
+    big.str.contains('chest|angina|cardiac|coronary|heart', case=False)
+    big.str.contains('breath|dyspnea|sob|respiratory|oxygen', case=False)
+    regex_s = time.perf_counter() - start
+    fresh = SymptomMatcher(SYNONYMS)
+    start = time.perf_counter()
+    fresh.flag_matrix(big.tolist(), ['chest_pain', 'shortness_of_breath'])
+    column_s = time.perf_counter() - start
+    texts = [f"pt reports {c} since morning" for c in complaints.tolist()] * 10
+    start = time.perf_counter()
+    for t in texts:
+        fresh._find(t)
+    row_us = (time.perf_counter() - start) / len(texts) * 1e6
+    pattern = re.compile('chest|angina|cardiac|coronary|heart|breath|dyspnea|sob|respiratory|oxygen')
+    start = time.perf_counter()
+    for t in texts:
+        pattern.findall(t)
+    regex_row_us = (time.perf_counter() - start) / len(texts) * 1e6
+    print(f"Column of {len(big):,} complaints: regex x2 {regex_s*1000:.0f} ms, "
+          f"automaton ({len(SYNONYMS)} symptoms) {column_s*1000:.0f} ms")
+    print(f"Uncached single text: automaton {row_us:.1f} us ({len(SYNONYMS)} symptoms), "
+          f"one 10-alternative regex {regex_row_us:.1f} us (2 symptoms)")
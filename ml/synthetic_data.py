@@ -0,0 +1,144 @@
+# synthetic_data.py
+# Vectorized synthetic triage data generator
+#
+# Same marginal distributions and labeling rule as generate_and_train.generate_row,
+# drawn with NumPy a chunk at a time so any row count streams to disk with
+# flat memory. Output is reproducible for a given (seed, chunk_size).
+#
+# Usage:
+#   python synthetic_data.py --rows 1000000 --out synthetic_1m.csv
+#   python synthetic_data.py --benchmark
+
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_spec import FEATURE_NAMES
+
+COLUMNS = FEATURE_NAMES + ['label']
+CHUNK_SIZE = 100_000
+
+# Mixtures as (probability, low, high), both bounds inclusive like random.randint
+TEMP_MIXTURE = ((0.70, 36.1, 37.2),   # normal
+                (0.15, 37.3, 38.4),   # mild fever
+                (0.10, 38.5, 40.0),   # high fever
+                (0.05, 35.0, 41.0))   # hypothermia or very high fever
+RR_MIXTURE = ((0.70, 12, 20),         # normal
+              (0.15, 21, 24),         # mild tachypnea
+              (0.10, 25, 35),         # severe tachypnea
+              (0.05, 8, 11))          # bradypnea
+INJURY_MIXTURE = ((0.85, 0, 0),
+                  (0.10, 10, 40),     # minor
+                  (0.05, 50, 100))    # severe
+COMORBID_P = (0.70, 0.30 * 0.8, 0.30 * 0.2)
+
+
+def high_priority(age, hr, sbp, spo2, temp, rr, chest_pain, breathless, injury_score):
+    """Labeling rule; works on scalars and on NumPy columns alike."""
+    return ((chest_pain == 1) | (breathless == 1) |
+            (spo2 < 92) | (sbp < 90) | (sbp > 160) |
+            (hr > 130) | (hr < 50) |
+            (age > 75) |
+            (temp > 38.5) | (temp < 36.0) |   # high fever / hypothermia
+            (rr > 24) | (rr < 10) |           # tachypnea / bradypnea
+            (injury_score > 40))              # significant visible injury
+
+
+def _mixture(rng, n, mixture, integer):
+    probs = np.array([p for p, _, _ in mixture])
+    component = rng.choice(len(mixture), size=n, p=probs / probs.sum())
+    low = np.array([lo for _, lo, _ in mixture])[component]
+    high = np.array([hi for _, _, hi in mixture])[component]
+    if integer:
+        return rng.integers(low, high + 1)
+    return np.round(rng.uniform(low, high), 1)
+
+
+def generate_chunk(n, rng):
+    """n synthetic patients as a DataFrame in COLUMNS order."""
+    age = rng.integers(1, 91, n)
+    hr = rng.integers(50, 171, n)
+    sbp = rng.integers(70, 181, n)
+    spo2 = rng.integers(80, 101, n)
+    temp = _mixture(rng, n, TEMP_MIXTURE, integer=False)
+    rr = _mixture(rng, n, RR_MIXTURE, integer=True)
+    chest_pain = (rng.random(n) < 0.12).astype(np.int8)
+    breathless = (rng.random(n) < 0.12).astype(np.int8)
+    comorbid = rng.choice(3, size=n, p=COMORBID_P).astype(np.int8)
+    injury_score = _mixture(rng, n, INJURY_MIXTURE, integer=True)
+    label = high_priority(age, hr, sbp, spo2, temp, rr, chest_pain, breathless, injury_score)
+    return pd.DataFrame({
+        'age': age.astype(np.int16), 'hr': hr.astype(np.int16), 'sbp': sbp.astype(np.int16),
+        'spo2': spo2.astype(np.int16), 'temp': temp, 'rr': rr.astype(np.int16),
+        'chest_pain': chest_pain, 'breathless': breathless, 'comorbid': comorbid,
+        'injury_score': injury_score.astype(np.int16), 'label': label.astype(np.int8),
+    }, columns=COLUMNS)
+
+
+def iter_chunks(n_rows, chunk_size=CHUNK_SIZE, seed=42):
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, chunk_size):
+        yield generate_chunk(min(chunk_size, n_rows - start), rng)
+
+
+def generate(n_rows, seed=42, chunk_size=CHUNK_SIZE):
+    """Whole dataset in memory; use write_csv for large row counts."""
+    return pd.concat(iter_chunks(n_rows, chunk_size, seed), ignore_index=True)
+
+
+def write_csv(path, n_rows, seed=42, chunk_size=CHUNK_SIZE):
+    """Stream n_rows to a CSV one chunk at a time; returns rows written."""
+    written = 0
+    with open(path, 'w', newline='') as f:
+        for chunk in iter_chunks(n_rows, chunk_size, seed):
+            chunk.to_csv(f, index=False, header=written == 0, float_format='%.1f')
+            written += len(chunk)
+    return written
+
+
+def benchmark(n_rows=1_000_000, loop_rows=50_000, chunk_size=CHUNK_SIZE):
+    from generate_and_train import generate_row
+
+    rng = random.Random(42)
+    start = time.perf_counter()
+    loop = [generate_row(rng) for _ in range(loop_rows)]
+    loop_rate = loop_rows / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    label_sum = sum(int(chunk['label'].sum()) for chunk in iter_chunks(n_rows, chunk_size))
+    vec_rate = n_rows / (time.perf_counter() - start)
+
+    path = f"/tmp/synthetic_bench_{os.getpid()}.csv"
+    start = time.perf_counter()
+    write_csv(path, n_rows, chunk_size=chunk_size)
+    csv_rate = n_rows / (time.perf_counter() - start)
+    size = os.path.getsize(path)
+    os.remove(path)
+
+    loop_label = sum(row[-1] for row in loop) / loop_rows
+    print(f"Per-row loop       : {loop_rate:12,.0f} rows/s  (high priority {loop_label*100:.1f}%)")
+    print(f"Vectorized         : {vec_rate:12,.0f} rows/s  (high priority {label_sum / n_rows*100:.1f}%)  "
+          f"{vec_rate / loop_rate:.0f}x")
+    print(f"Vectorized -> CSV  : {csv_rate:12,.0f} rows/s  ({size / n_rows:.1f} bytes/row)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic triage data")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--out', default='synthetic_data.csv')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--benchmark', action='store_true', help="compare rows/s against the per-row loop")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.rows, chunk_size=args.chunk_size)
+    else:
+        start = time.perf_counter()
+        n = write_csv(args.out, args.rows, args.seed, args.chunk_size)
+        elapsed = time.perf_counter() - start
+        print(f"✓ Wrote {n:,} rows to '{args.out}' in {elapsed:.2f}s ({n / elapsed:,.0f} rows/s)")
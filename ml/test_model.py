@@ -1,13 +1,22 @@
 # test_model.py - Test the trained triage model
 
+import sys
+
 import joblib
-import numpy as np
+import pandas as pd
+
+import feature_spec
 
 # Load the LogisticRegression model (for probability scores)
 model = joblib.load('triage_model_lr.pkl')
 print('Model loaded successfully!')
 print(f'Model type: {type(model).__name__}')
 
+problems = feature_spec.artifact_problems(feature_spec.FEATURE_NAMES, model)
+if problems:
+    print(f"Model does not match the feature spec: {'; '.join(problems)}. Retrain with train_with_real_data.py.")
+    sys.exit(1)
+
 # Test cases
 test_cases = [
     {'name': 'Critical: elderly + chest pain + low SpO2', 'age': 75, 'hr': 110, 'sbp': 90, 'spo2': 88, 'chest_pain': 1, 'breathless': 1, 'comorbid': 2},
@@ -17,11 +26,13 @@ test_cases = [
     {'name': 'High: tachycardia + breathless', 'age': 55, 'hr': 145, 'sbp': 100, 'spo2': 91, 'chest_pain': 0, 'breathless': 1, 'comorbid': 1},
 ]
 
+# temp, rr and injury_score take their spec defaults
+X = feature_spec.from_frame(pd.DataFrame(test_cases))
+
 print('\nTest Predictions:')
 print('-' * 70)
-for case in test_cases:
-    features = np.array([[case['age'], case['hr'], case['sbp'], case['spo2'], case['chest_pain'], case['breathless'], case['comorbid']]])
-    prob = model.predict_proba(features)[0][1]
+for case, features in zip(test_cases, X):
+    prob = model.predict_proba(features[None, :])[0][1]
     score = int(prob * 100)
     status = 'CRITICAL' if score >= 85 else 'HIGH' if score >= 50 else 'LOW'
     print(f"{case['name']}")
@@ -31,7 +42,6 @@ for case in test_cases:
 # Feature coefficients
 print('\nFeature Coefficients:')
 print('-' * 40)
-feature_names = ['age', 'hr', 'sbp', 'spo2', 'chest_pain', 'breathless', 'comorbid']
-for feat, coef in zip(feature_names, model.coef_[0]):
+for feat, coef in zip(feature_spec.FEATURE_NAMES, model.coef_[0]):
     sign = '+' if coef > 0 else ''
     print(f"  {feat:15s}: {sign}{coef:.4f}")
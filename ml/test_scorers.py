@@ -0,0 +1,66 @@
+# test_scorers.py - Check the compiled scorers against scikit-learn
+#
+# Fits a LogisticRegression, a RandomForest and a GradientBoosting model on
+# synthetic patients, compiles each with scoring.build_scorer, and asserts
+# that predict_proba, predict_one, a save/load round trip (mmap) and the
+# explanation sums all agree with sklearn's predict_proba. Exits non-zero on
+# the first mismatch.
+#
+# Usage: python test_scorers.py
+
+import tempfile
+
+import numpy as np
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+import feature_spec
+from scoring import build_scorer, load_scorer, save_scorer
+from synthetic_data import generate
+
+TOLERANCE = 1e-9
+
+train = generate(4000, seed=1)
+test = generate(2000, seed=2)
+X_train = feature_spec.from_frame(train)
+X_test = feature_spec.from_frame(test)
+y_train = train['label'].to_numpy()
+
+models = {
+    'LogisticRegression': LogisticRegression(max_iter=1000),
+    'RandomForest': RandomForestClassifier(n_estimators=50, max_depth=10, random_state=42),
+    'GradientBoosting': GradientBoostingClassifier(n_estimators=50, max_depth=3, random_state=42),
+}
+
+for name, model in models.items():
+    model.fit(X_train, y_train)
+    expected = model.predict_proba(X_test)[:, 1]
+    scorer = build_scorer(model)
+    assert scorer.kind != 'sklearn', f"{name}: no compiled scorer"
+
+    batch = scorer.predict_proba(X_test)
+    assert np.abs(batch - expected).max() < TOLERANCE, f"{name}: predict_proba differs from sklearn"
+    assert (np.rint(batch * 100) == np.rint(expected * 100)).all(), f"{name}: triage scores differ from sklearn"
+
+    single = np.array([scorer.predict_one(row) for row in X_test[:200].tolist()])
+    assert np.abs(single - expected[:200]).max() < TOLERANCE, f"{name}: predict_one differs from sklearn"
+
+    with tempfile.TemporaryDirectory() as directory:
+        loaded = load_scorer(directory, save_scorer(scorer, directory), mmap=True)
+        assert np.abs(loaded.predict_proba(X_test) - expected).max() < TOLERANCE, f"{name}: reloaded scorer differs"
+        del loaded
+
+    # Contributions must add up to the prediction they explain
+    if scorer.kind == 'linear':
+        probs, baseline, contrib = scorer.explain(X_test, np.zeros(X_test.shape[1]))
+    else:
+        probs, baseline, contrib = scorer.explain(X_test)
+    total = baseline + contrib.sum(axis=1)
+    if scorer.units == 'log_odds':
+        total = 1.0 / (1.0 + np.exp(-total))
+    assert np.abs(probs - expected).max() < TOLERANCE, f"{name}: explain probabilities differ from sklearn"
+    assert np.abs(total - probs).max() < 1e-6, f"{name}: contributions do not add up to the prediction"
+
+    print(f"✓ {name}: {scorer.kind} scorer matches sklearn on {len(X_test)} rows")
+
+print("All scorer parity checks passed")
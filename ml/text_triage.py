@@ -0,0 +1,323 @@
+# text_triage.py
+# Specialty and urgency of a free-text symptom description, from a local linear model
+#
+# Trained on Triage-Medical-Data-3.csv: 1,112 labelled symptom descriptions,
+# each with a specialty (10 classes), an urgency level (Emergency, Urgent,
+# Observation, Routine) and the labeller's confidence, used as sample weight.
+# Check-in texts are usually a sentence or two, so every description also
+# trains as its "Patient Symptoms:" line alone and as that line's first sentence.
+#
+# Features are word unigrams and bigrams of the symptoms.py-normalized text,
+# hashed with crc32 into N_BUCKETS columns (no vocabulary to store or
+# keep in sync). Counts are log-scaled and the row is L2-normalized. Each
+# target is a one-vs-rest logistic regression (scikit-learn SGD) trained at
+# build time only. Serving gathers the weight rows of the hashed n-grams, so
+# it needs neither scikit-learn nor scipy: 0.1-0.3 ms per text.
+#
+# The model is saved as .npy arrays keyed on the CSV's sha256, like
+# similar_cases.py. It is built ahead of time, by `python text_triage.py
+# --build`, train_with_real_data.py or the Docker image build; ml_service only
+# loads it (TextTriage.load) and never trains on startup.
+#
+# Layout:
+#   text_model/
+#     <key>/manifest.json      <- source, classes, held-out accuracy
+#     <key>/*.npy              <- (N_BUCKETS, classes) weights and intercepts per target
+#
+# Usage:
+#   python text_triage.py --build                          # train and save the model if the CSV changed
+#   python text_triage.py [--rebuild] ["symptom text" ...]   # also evaluate, time and classify
+
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from model_registry import file_sha256
+from symptoms import normalize
+
+DATA_DIR = os.getenv("ML_DATA_DIR", "../data_for_ml")
+MODEL_DIR = os.getenv("ML_TEXT_MODEL", "text_model")
+SOURCE = "Triage-Medical-Data-3.csv"
+MANIFEST_FILE = "manifest.json"
+
+# Bump to invalidate cached models when features or training change
+BUILD_VERSION = 1
+N_BUCKETS = 1 << 16
+TARGETS = ('specialty', 'urgency')
+HOLDOUT = 0.2
+
+# Points added to the triage score (the 0-40 scale of the LLM prompt it replaces),
+# severity and suggested action per urgency level
+URGENCY_BOOST = {'Emergency': 40, 'Urgent': 25, 'Observation': 10, 'Routine': 0}
+SEVERITY = {'Emergency': 'critical', 'Urgent': 'high', 'Observation': 'moderate', 'Routine': 'low'}
+ACTIONS = {
+    'Emergency': 'Immediate assessment by the emergency team',
+    'Urgent': 'Prioritise for prompt physician assessment',
+    'Observation': 'Monitor and reassess vitals',
+    'Routine': 'Standard triage protocol',
+}
+
+
+def ngrams(text):
+    words = normalize(text).split()
+    return words + list(map(' '.join, zip(words, words[1:])))
+
+
+@functools.lru_cache(maxsize=1 << 17)
+def bucket(gram):
+    # Symptom texts reuse a small vocabulary, so most n-grams are hashed once per process
+    return zlib.crc32(gram.encode()) & (N_BUCKETS - 1)
+
+
+def hash_features(text):
+    """(bucket indices, values, n-grams) for one text: log counts per n-gram, L2-normalized.
+
+    N-grams that collide keep separate entries; the dot product adds them up.
+    """
+    counts = Counter(ngrams(text))
+    grams = list(counts)
+    index = np.fromiter(map(bucket, grams), dtype=np.int64, count=len(grams))
+    values = np.log1p(np.fromiter(counts.values(), dtype=np.float64, count=len(grams)))
+    norm = np.sqrt(values @ values)
+    return index, (values / norm if norm else values), grams
+
+
+def symptoms_line(text):
+    return text.split('\n', 1)[0].replace('Patient Symptoms:', '').strip()
+
+
+def first_sentence(text):
+    return re.split(r'(?<=[.!?])\s', symptoms_line(text), 1)[0]
+
+
+# The forms each description trains (and is evaluated) as
+FORMS = (('text', lambda t: t), ('symptoms_line', symptoms_line), ('first_sentence', first_sentence))
+
+
+def load_examples(data_dir=DATA_DIR):
+    """(texts, {target: labels}, confidence) from the source CSV."""
+    import pandas as pd
+
+    df = pd.read_csv(os.path.join(data_dir, SOURCE))
+    df = df.dropna(subset=['input', *TARGETS])
+    labels = {t: df[t].str.strip().to_numpy() for t in TARGETS}
+    return df['input'].tolist(), labels, df['confidence'].fillna(1.0).to_numpy()
+
+
+def _fit(texts, labels, weights):
+    from scipy import sparse
+    from sklearn.linear_model import SGDClassifier
+
+    rows = [hash_features(form(t)) for _, form in FORMS for t in texts]
+    X = sparse.csr_matrix((np.concatenate([v for _, v, _ in rows]),
+                           np.concatenate([i for i, _, _ in rows]),
+                           np.cumsum([0] + [len(i) for i, _, _ in rows])),
+                          shape=(len(rows), N_BUCKETS))
+    weights = np.tile(weights, len(FORMS))
+    models = {}
+    for target in TARGETS:
+        clf = SGDClassifier(loss='log_loss', alpha=1e-5, max_iter=50, tol=None, random_state=0)
+        clf.fit(X, np.tile(labels[target], len(FORMS)), sample_weight=weights)
+        models[target] = (clf.classes_.astype(str), clf.coef_.T.astype(np.float32), clf.intercept_)
+    return models
+
+
+class TextTriage:
+    """Hashed n-gram linear models for specialty and urgency."""
+
+    def __init__(self, models, key=None, manifest=None):
+        self.models = models  # target -> (classes, (N_BUCKETS, classes) weights, intercepts)
+        self.key = key
+        self.manifest = manifest or {}
+        self.calls = 0
+
+    @classmethod
+    def train(cls, data_dir=DATA_DIR):
+        """Fit on a held-out split for the manifest's accuracy, then on everything."""
+        texts, labels, weights = load_examples(data_dir)
+        test = np.random.default_rng(0).permutation(len(texts))[:int(len(texts) * HOLDOUT)]
+        train = np.setdiff1d(np.arange(len(texts)), test)
+        held_out = cls(_fit([texts[i] for i in train], {t: y[train] for t, y in labels.items()}, weights[train]))
+        accuracy = {}
+        for target in TARGETS:
+            for name, form in FORMS:
+                predicted = [held_out.predict(form(texts[i]))[target] for i in test]
+                accuracy[f"{target}_{name}"] = round(float(np.mean(np.array(predicted) == labels[target][test])), 4)
+        model = cls(_fit(texts, labels, weights))
+        model.manifest = {'n_examples': len(texts), 'holdout': HOLDOUT, 'holdout_accuracy': accuracy}
+        return model
+
+    def save(self, key, source_sha, model_dir=MODEL_DIR):
+        os.makedirs(model_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=model_dir)
+        try:
+            for target, (classes, coef, intercept) in self.models.items():
+                np.save(os.path.join(staging, f"{target}_classes.npy"), classes)
+                np.save(os.path.join(staging, f"{target}_coef.npy"), coef)
+                np.save(os.path.join(staging, f"{target}_intercept.npy"), intercept)
+            self.manifest.update({
+                'key': key,
+                'build_version': BUILD_VERSION,
+                'source': {SOURCE: source_sha},
+                'n_buckets': N_BUCKETS,
+                'classes': {t: m[0].tolist() for t, m in self.models.items()},
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            })
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(self.manifest, f, indent=2)
+            target = os.path.join(model_dir, key)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.rename(staging, target)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        for name in os.listdir(model_dir):
+            path = os.path.join(model_dir, name)
+            if name != key and not name.startswith('.') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        self.key = key
+        return self.manifest
+
+    @classmethod
+    def read(cls, key, model_dir=MODEL_DIR):
+        path = os.path.join(model_dir, key)
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        models = {t: tuple(np.load(os.path.join(path, f"{t}_{part}.npy"))
+                           for part in ('classes', 'coef', 'intercept')) for t in TARGETS}
+        return cls(models, key=key, manifest=manifest)
+
+    @classmethod
+    def open(cls, data_dir=DATA_DIR, model_dir=MODEL_DIR, rebuild=False):
+        """The model for the current source file: loaded when trained before, else trained and saved."""
+        start = time.perf_counter()
+        key, source_sha = cache_key(data_dir)
+        if not rebuild and os.path.exists(os.path.join(model_dir, key, MANIFEST_FILE)):
+            model = cls.read(key, model_dir)
+            built = False
+        else:
+            model = cls.train(data_dir)
+            model.save(key, source_sha, model_dir)
+            built = True
+        print(f"✓ Text triage model {key} {'trained' if built else 'loaded'} "
+              f"in {(time.perf_counter() - start)*1000:.0f} ms")
+        return model
+
+    @classmethod
+    def load(cls, model_dir=MODEL_DIR, data_dir=DATA_DIR):
+        """The saved model, without training; raises FileNotFoundError when none was built."""
+        start = time.perf_counter()
+        keys = [name for name in os.listdir(model_dir)
+                if os.path.exists(os.path.join(model_dir, name, MANIFEST_FILE))] if os.path.isdir(model_dir) else []
+        if not keys:
+            raise FileNotFoundError(f"no text triage model in '{model_dir}'; build it with "
+                                    f"`python text_triage.py --build`")
+        key = max(keys, key=lambda name: os.path.getmtime(os.path.join(model_dir, name, MANIFEST_FILE)))
+        model = cls.read(key, model_dir)
+        if os.path.exists(os.path.join(data_dir, SOURCE)) and cache_key(data_dir)[0] != key:
+            print(f"⚠ Warning: text triage model {key} was built from an older {SOURCE}; "
+                  f"rebuild it with `python text_triage.py --build`")
+        print(f"✓ Text triage model {key} loaded in {(time.perf_counter() - start)*1000:.0f} ms")
+        return model
+
+    # ---- inference --------------------------------------------------------------
+
+    def probabilities(self, index, values):
+        """{target: class probabilities} for hashed features."""
+        result = {}
+        for target, (classes, coef, intercept) in self.models.items():
+            z = values @ coef[index] + intercept
+            # One-vs-rest probabilities, normalized as scikit-learn does
+            p = 1.0 / (1.0 + np.exp(-z))
+            result[target] = p / p.sum()
+        return result
+
+    def predict(self, text):
+        """{target: label} for one text."""
+        found = self.probabilities(*hash_features(text)[:2])
+        return {t: str(self.models[t][0][np.argmax(p)]) for t, p in found.items()}
+
+    def classify(self, text):
+        """The check-in analysis for a symptom text: the analyzeCustomSymptoms response plus specialty."""
+        self.calls += 1
+        index, values, grams = hash_features(text)
+        found = self.probabilities(index, values)
+        labels = {t: self.models[t][0].tolist() for t in TARGETS}
+        best = {t: int(np.argmax(p)) for t, p in found.items()}
+        urgency, urgency_p = labels['urgency'][best['urgency']], float(found['urgency'][best['urgency']])
+        specialty, specialty_p = labels['specialty'][best['specialty']], float(found['specialty'][best['specialty']])
+        # Expected boost over the urgency levels, so an unsure Emergency/Urgent call lands in between
+        boost = sum(URGENCY_BOOST.get(level, 0) * p for level, p in zip(labels['urgency'], found['urgency'].tolist()))
+        # The n-grams that pushed hardest towards the chosen urgency
+        pull = values * self.models['urgency'][1][index, best['urgency']]
+        terms = [grams[i] for i in np.argsort(-pull)[:3] if pull[i] > 0]
+        reason = f" ({', '.join(repr(t) for t in terms)})" if terms else ''
+        return {
+            'urgency': urgency,
+            'urgency_boost': int(round(boost)),
+            'severity': SEVERITY.get(urgency, 'unknown'),
+            'specialty': specialty,
+            'confidence': round(urgency_p, 4),
+            'specialty_confidence': round(specialty_p, 4),
+            'explanation': f"{urgency} ({urgency_p:.0%}), {specialty} ({specialty_p:.0%}){reason}",
+            'recommended_action': ACTIONS.get(urgency, ACTIONS['Routine']),
+            'model': self.key,
+        }
+
+    def stats(self):
+        return {'key': self.key, 'calls': self.calls,
+                'holdout_accuracy': self.manifest.get('holdout_accuracy')}
+
+
+def cache_key(data_dir=DATA_DIR):
+    source_sha = file_sha256(os.path.join(data_dir, SOURCE))
+    h = hashlib.sha256(json.dumps({'build': BUILD_VERSION, 'buckets': N_BUCKETS, 'source': source_sha},
+                                  sort_keys=True).encode())
+    return h.hexdigest()[:16], source_sha
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the text triage model, report accuracy and latency")
+    parser.add_argument('texts', nargs='*', help="symptom descriptions to classify")
+    parser.add_argument('--rebuild', action='store_true', help="retrain even if a cached model exists")
+    parser.add_argument('--build', action='store_true', help="only train and save the model, then exit")
+    args = parser.parse_args()
+
+    model = TextTriage.open(rebuild=args.rebuild)
+    if args.build:
+        raise SystemExit(0)
+    print(f"Held-out accuracy ({HOLDOUT:.0%} of {model.manifest.get('n_examples')} descriptions):")
+    for name, value in (model.manifest.get('holdout_accuracy') or {}).items():
+        print(f"  {name:28} {value:.3f}")
+
+    samples = args.texts or [
+        "crushing chest pain radiating to my left arm, sweating and short of breath",
+        "itchy red rash on both forearms for two weeks",
+        "worst headache of my life, sudden, with neck stiffness and vomiting",
+        "mild knee pain after running, can still walk",
+    ]
+    for text in samples:
+        result = model.classify(text)
+        print(f"  +{result['urgency_boost']:2d} {result['severity']:8} {result['specialty']:18} "
+              f"conf {result['confidence']:.2f}  {text[:60]}")
+
+    texts, _, _ = load_examples()
+    for label, batch in (('full description', texts), ('symptoms line', [symptoms_line(t) for t in texts]),
+                         ('sample sentences', samples * 250)):
+        start = time.perf_counter()
+        for text in batch:
+            model.classify(text)
+        per_call = (time.perf_counter() - start) / len(batch) * 1e6
+        print(f"  classify ({label}, {np.mean([len(t) for t in batch]):.0f} chars): {per_call:.0f} us per text")
@@ -2,132 +2,50 @@
 # Trains a triage model using REAL hospital data uploaded by user
 # Combines multiple datasets for robust training
 
+# Usage:
+#   python train_with_real_data.py                   # candidates x CV folds in parallel on all cores
+#   python train_with_real_data.py --jobs 1          # serial
+#   python train_with_real_data.py --compare-serial  # also time the serial path and report the speedup
+#   python train_with_real_data.py --search --budget 60 --slo-single-ms 0.5
+
+import argparse
+import time
+
 import pandas as pd
 import numpy as np
+from sklearn.base import clone
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import classification_report
 import joblib
-import os
+from joblib import Parallel, delayed
+
+import dataset
+import feature_spec
+import model_registry
+import search
+from similar_cases import SimilarCases
+from text_triage import TextTriage
+
+parser = argparse.ArgumentParser(description="Train the triage model on the real hospital datasets")
+parser.add_argument('--jobs', type=int, default=-1, help="parallel fit jobs (-1 = all cores, 1 = serial)")
+parser.add_argument('--folds', type=int, default=5, help="cross-validation folds")
+parser.add_argument('--compare-serial', action='store_true', help="re-run the fits serially and report the speedup")
+parser.add_argument('--search', action='store_true', help="successive-halving hyperparameter search (see search.py)")
+parser.add_argument('--budget', type=float, default=120.0, help="search wall-clock budget in seconds")
+parser.add_argument('--slo-single-ms', type=float, default=1.0, help="max single-row serving latency (ms)")
+parser.add_argument('--slo-batch-us', type=float, default=50.0, help="max batch serving latency per row (us)")
+parser.add_argument('--activate', action='store_true',
+                    help="make the published version active (refused if a feature has no signal)")
+args = parser.parse_args()
 
 print("=" * 60)
 print("🏥 HT-1 Triage Model Training with Real Hospital Data")
 print("=" * 60)
 
-DATA_DIR = "../data_for_ml"
-
-# =============================================================================
-# DATASET 1: Synthetic Medical Triage (18,000 samples)
-# Features: age, heart_rate, sbp, spo2, temperature, symptom_count, 
-#           comorbid_count, previous_er_visits, arrival_mode, triage_level
-# =============================================================================
-
-print("\n📊 Loading synthetic_medical_triage.csv...")
-df_synthetic = pd.read_csv(os.path.join(DATA_DIR, "synthetic_medical_triage.csv"))
-print(f"   Loaded {len(df_synthetic)} samples")
-print(f"   Columns: {list(df_synthetic.columns)}")
-
-# Map arrival_mode to numeric
-df_synthetic['arrival_mode_num'] = df_synthetic['arrival_mode'].map({
-    'walk_in': 0,
-    'ambulance': 1
-}).fillna(0)
-
-# Triage level: 0=low, 1=medium, 2=high, 3=critical
-# Convert to binary: 0,1 = low priority (0), 2,3 = high priority (1)
-df_synthetic['high_priority'] = (df_synthetic['triage_level'] >= 2).astype(int)
-
-print(f"   High priority distribution: {df_synthetic['high_priority'].value_counts().to_dict()}")
-
-# =============================================================================
-# DATASET 2: Real ER Data (1,267 samples with KTAS triage)
-# KTAS: 1=Resuscitation, 2=Emergency, 3=Urgent, 4=Less Urgent, 5=Non-urgent
-# =============================================================================
-
-print("\n📊 Loading data.csv (real ER data with KTAS triage)...")
-df_real = pd.read_csv(os.path.join(DATA_DIR, "data.csv"), sep=';', encoding='latin-1')
-print(f"   Loaded {len(df_real)} real emergency room cases")
-print(f"   KTAS distribution: {df_real['KTAS_expert'].value_counts().sort_index().to_dict()}")
-
-# Map KTAS to high priority (1,2,3 = high/critical; 4,5 = low priority)
-df_real['high_priority'] = (df_real['KTAS_expert'] <= 3).astype(int)
-
-# Extract vital signs (handle missing values)
-df_real['Age'] = pd.to_numeric(df_real['Age'], errors='coerce')
-df_real['HR'] = pd.to_numeric(df_real['HR'], errors='coerce')
-df_real['SBP'] = pd.to_numeric(df_real['SBP'], errors='coerce')
-df_real['Saturation'] = pd.to_numeric(df_real['Saturation'], errors='coerce')
-df_real['BT'] = pd.to_numeric(df_real['BT'], errors='coerce')
-df_real['RR'] = pd.to_numeric(df_real['RR'], errors='coerce')
-df_real['NRS_pain'] = pd.to_numeric(df_real['NRS_pain'], errors='coerce')
-
-# Injury indicator
-df_real['is_injury'] = (df_real['Injury'] == 2).astype(int)  # 2 = injury in dataset
-
-# Arrival mode (1=walk, 2=119 ambulance, 3=private, 4=transfer)
-df_real['arrival_severity'] = df_real['Arrival mode'].map({
-    1: 0,  # walk = low
-    3: 0,  # private = low  
-    2: 1,  # ambulance = high
-    4: 1   # transfer = high
-}).fillna(0)
-
-print(f"   High priority distribution: {df_real['high_priority'].value_counts().to_dict()}")
-
-# =============================================================================
-# COMBINE DATASETS - Create unified feature set
-# =============================================================================
-
-print("\n🔄 Combining datasets with unified features...")
-
-# Features we'll use (matching ml_service.py expectations):
-# age, hr, sbp, spo2, chest_pain, breathless, comorbid
-
-# From synthetic dataset
-X_synthetic = pd.DataFrame({
-    'age': df_synthetic['age'],
-    'hr': df_synthetic['heart_rate'],
-    'sbp': df_synthetic['systolic_blood_pressure'],
-    'spo2': df_synthetic['oxygen_saturation'],
-    'chest_pain': (df_synthetic['pain_level'] >= 6).astype(int),  # High pain = potential chest pain
-    'breathless': (df_synthetic['oxygen_saturation'] < 94).astype(int),  # Low SpO2 = breathing issue
-    'comorbid': df_synthetic['chronic_disease_count'].clip(0, 2)
-})
-y_synthetic = df_synthetic['high_priority']
-
-# From real ER dataset
-# Detect chest pain and breathlessness from chief complaint
-df_real['Chief_complain'] = df_real['Chief_complain'].fillna('').str.lower()
-df_real['chest_pain_detected'] = df_real['Chief_complain'].str.contains(
-    'chest|angina|cardiac|coronary|heart', case=False
-).astype(int)
-df_real['breathless_detected'] = df_real['Chief_complain'].str.contains(
-    'breath|dyspnea|sob|respiratory|oxygen', case=False
-).astype(int)
-
-X_real = pd.DataFrame({
-    'age': df_real['Age'],
-    'hr': df_real['HR'],
-    'sbp': df_real['SBP'],
-    'spo2': df_real['Saturation'],
-    'chest_pain': df_real['chest_pain_detected'],
-    'breathless': df_real['breathless_detected'],
-    'comorbid': df_real['is_injury']  # Using injury as comorbid indicator
-})
-y_real = df_real['high_priority']
-
-# Fill missing values with medians from synthetic dataset
-for col in X_real.columns:
-    if X_real[col].isna().sum() > 0:
-        median_val = X_synthetic[col].median()
-        X_real[col] = X_real[col].fillna(median_val)
-        print(f"   Filled {col} NaN with median: {median_val:.1f}")
-
-# Combine datasets
-X_combined = pd.concat([X_synthetic, X_real], ignore_index=True)
-y_combined = pd.concat([y_synthetic, y_real], ignore_index=True)
+# Parsed once per change to the source CSVs, see dataset.py
+X_combined, y_combined = dataset.load_dataset()
 
 print(f"\n📊 Combined dataset: {len(X_combined)} samples")
 print(f"   Features: {list(X_combined.columns)}")
@@ -135,14 +53,27 @@ print(f"   High priority: {y_combined.sum()} ({y_combined.mean()*100:.1f}%)")
 print(f"   Low priority:  {len(y_combined) - y_combined.sum()} ({(1-y_combined.mean())*100:.1f}%)")
 
 # =============================================================================
-# TRAIN-TEST SPLIT
+# FOLD SPLITS (computed once, shared by every candidate)
 # =============================================================================
 
-X_train, X_test, y_train, y_test = train_test_split(
-    X_combined, y_combined, test_size=0.2, random_state=42, stratify=y_combined
-)
-
-print(f"\n📊 Split: {len(X_train)} train / {len(X_test)} test")
+# Fold 0 doubles as the train/test holdout, so each candidate is fitted
+# once per fold and never again just for the holdout scores
+X_values = feature_spec.from_frame(X_combined)
+y_values = y_combined.to_numpy()
+outliers = feature_spec.out_of_range(X_values)
+if outliers:
+    print(f"⚠ Warning: values outside the feature spec ranges: {outliers}")
+# A served feature the data never varies is one the model cannot use (see --activate)
+weak_features = feature_spec.signal_problems(X_values)
+for name, problem in weak_features.items():
+    print(f"⚠ Warning: feature '{name}' is {problem}")
+dead_features = [name for name, problem in weak_features.items() if problem.startswith('constant')]
+folds = list(StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42).split(X_values, y_values))
+train_idx, test_idx = folds[0]
+X_train, X_test = X_values[train_idx], X_values[test_idx]
+y_train, y_test = y_values[train_idx], y_values[test_idx]
+
+print(f"\n📊 Split: {len(X_train)} train / {len(X_test)} test (fold 0 of {args.folds})")
 
 # =============================================================================
 # TRAIN MULTIPLE MODELS & COMPARE
@@ -152,34 +83,81 @@ print("\n" + "=" * 60)
 print("🧠 Training Multiple Models...")
 print("=" * 60)
 
+# Candidates stay single-threaded; the parallelism is across (model, fold) fits
 models = {
     'LogisticRegression': LogisticRegression(max_iter=1000, random_state=42, class_weight='balanced'),
-    'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced'),
+    'RandomForest': RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced', n_jobs=1),
     'GradientBoosting': GradientBoostingClassifier(n_estimators=100, random_state=42)
 }
 
-best_model = None
-best_accuracy = 0
-best_model_name = ""
 
-for name, model in models.items():
-    print(f"\n🔄 Training {name}...")
-    model.fit(X_train, y_train)
-    
-    train_acc = model.score(X_train, y_train)
-    test_acc = model.score(X_test, y_test)
-    
-    # Cross-validation
-    cv_scores = cross_val_score(model, X_combined, y_combined, cv=5)
-    
-    print(f"   Train Accuracy: {train_acc:.4f}")
-    print(f"   Test Accuracy:  {test_acc:.4f}")
-    print(f"   CV Mean:        {cv_scores.mean():.4f} (+/- {cv_scores.std()*2:.4f})")
-    
-    if test_acc > best_accuracy:
-        best_accuracy = test_acc
-        best_model = model
-        best_model_name = name
+def fit_fold(name, estimator, fold, train, test):
+    start = time.perf_counter()
+    model = clone(estimator).fit(X_values[train], y_values[train])
+    test_acc = model.score(X_values[test], y_values[test])
+    train_acc = model.score(X_values[train], y_values[train]) if fold == 0 else None
+    # Only the holdout fit is kept; shipping the other fold models back is wasted work
+    return name, fold, model if fold == 0 else None, train_acc, test_acc, time.perf_counter() - start
+
+
+def run_fits(n_jobs):
+    tasks = [delayed(fit_fold)(name, estimator, fold, train, test)
+             for name, estimator in models.items()
+             for fold, (train, test) in enumerate(folds)]
+    start = time.perf_counter()
+    # Tree ensembles first so the slowest fits do not straggle at the end
+    results = Parallel(n_jobs=n_jobs)(tasks[::-1])
+    return results, time.perf_counter() - start
+
+
+if args.search:
+    print(f"\n🔎 Successive-halving search (budget {args.budget:.0f}s)...")
+    result = search.successive_halving(
+        X_train, y_train, X_test, y_test, budget_seconds=args.budget, slo_single_ms=args.slo_single_ms,
+        slo_batch_us=args.slo_batch_us, n_jobs=args.jobs
+    )
+    search.print_report(result, args.slo_single_ms, args.slo_batch_us)
+    models = {family: r['model'] for family, r in result['per_family'].items()}
+    best = result['best']
+    best_model, best_accuracy, best_model_name = best['model'], best['accuracy'], best['family']
+    serving_latency = {'single_ms': round(best['single_ms'], 4), 'batch_us_per_row': round(best['batch_us'], 2)}
+else:
+    serving_latency = None
+    results, wall_seconds = run_fits(args.jobs)
+
+    best_model = None
+    best_accuracy = 0
+    best_model_name = ""
+    fit_seconds = {}
+
+    for name in models:
+        runs = sorted((r for r in results if r[0] == name), key=lambda r: r[1])
+        _, _, model, train_acc, test_acc, _ = runs[0]
+        models[name] = model
+        cv_scores = np.array([r[4] for r in runs])
+        fit_seconds[name] = [r[5] for r in runs]
+
+        print(f"\n🔄 {name}")
+        print(f"   Train Accuracy: {train_acc:.4f}")
+        print(f"   Test Accuracy:  {test_acc:.4f}")
+        print(f"   CV Mean:        {cv_scores.mean():.4f} (+/- {cv_scores.std()*2:.4f})")
+
+        if test_acc > best_accuracy:
+            best_accuracy = test_acc
+            best_model = model
+            best_model_name = name
+
+    n_jobs = joblib.effective_n_jobs(args.jobs)
+    serial_estimate = sum(sum(t) for t in fit_seconds.values())
+    print(f"\n⏱  Wall-clock breakdown ({len(results)} fits on {n_jobs} job(s)):")
+    for name, times in fit_seconds.items():
+        print(f"   {name:20s}: {sum(times):7.2f}s total, {max(times):6.2f}s slowest fold")
+    print(f"   {'elapsed':20s}: {wall_seconds:7.2f}s (sum of fits {serial_estimate:.2f}s, "
+          f"{serial_estimate / wall_seconds:.2f}x)")
+
+    if args.compare_serial:
+        _, serial_seconds = run_fits(1)
+        print(f"   {'serial path':20s}: {serial_seconds:7.2f}s → speedup {serial_seconds / wall_seconds:.2f}x")
 
 print(f"\n🏆 Best Model: {best_model_name} (Test Accuracy: {best_accuracy:.4f})")
 
@@ -223,6 +201,31 @@ lr_model = models['LogisticRegression']
 joblib.dump(lr_model, 'triage_model_lr.pkl')
 print(f"✅ LogisticRegression backup saved to 'triage_model_lr.pkl'")
 
+# Trained on feature_spec's columns, so ml_service can serve it as is. Published
+# inactive unless --activate is given and every served feature has signal
+activate = args.activate and not dead_features
+version = model_registry.publish(best_model, feature_spec.FEATURE_NAMES, metrics={
+    'test_accuracy': round(best_accuracy, 4),
+    'n_samples': len(X_combined),
+    'serving_latency': serving_latency,
+    'feature_problems': weak_features,
+}, activate=activate, feature_stats=feature_spec.feature_stats(X_train))
+if activate:
+    print(f"✅ Published to registry '{model_registry.REGISTRY_DIR}' as {version} (active)")
+else:
+    print(f"✅ Published to registry '{model_registry.REGISTRY_DIR}' as {version} (not active)")
+    if args.activate:
+        print(f"⚠ Not activated: no signal in {dead_features}; the model would ignore them when serving")
+    print(f"   To serve it: POST /admin/reload {{\"version\": \"{version}\"}}")
+
+# =============================================================================
+# SERVING ARTIFACTS
+# =============================================================================
+
+# Built from the same data directory, so ml_service only has to load them
+TextTriage.open(dataset.DATA_DIR)
+SimilarCases.open(dataset.DATA_DIR)
+
 # =============================================================================
 # TEST PREDICTIONS
 # =============================================================================
@@ -238,11 +241,12 @@ test_cases = [
     {"age": 45, "hr": 72, "sbp": 135, "spo2": 98, "chest_pain": 0, "breathless": 0, "comorbid": 0},
 ]
 
-for i, case in enumerate(test_cases, 1):
-    features = np.array([[case[f] for f in ['age', 'hr', 'sbp', 'spo2', 'chest_pain', 'breathless', 'comorbid']]])
-    
+# temp, rr and injury_score are left to their spec defaults
+case_features = feature_spec.from_frame(pd.DataFrame(test_cases))
+
+for i, (case, features) in enumerate(zip(test_cases, case_features), 1):
     # Use LogisticRegression for probability
-    prob = lr_model.predict_proba(features)[0][1]
+    prob = lr_model.predict_proba(features[None, :])[0][1]
     score = int(prob * 100)
     
     priority = "🔴 HIGH" if score >= 50 else "🟢 LOW"
@@ -0,0 +1,217 @@
+# trends.py
+# Per-patient vitals trends with O(1) updates per reading
+#
+# Each patient keeps a sliding window of their last readings (at most
+# WINDOW_READINGS, none older than WINDOW_MINUTES behind the newest) and
+# running sums of t, t^2, x, x^2 and t*x per vital. Adding a reading and
+# evicting an old one only touch those sums, so slope (least squares, per
+# hour), delta vs. the previous reading and standard deviation come out in
+# constant time without rescanning the history.
+#
+# The trend head turns worsening changes into a log-odds shift on top of the
+# snapshot model's probability. Its weights are hand-set to the deterioration
+# thresholds backend/services/mlService.js alerts on (HR +20, SpO2 -3,
+# SBP -20 / +30); there is no labeled trajectory data to fit them on.
+#
+# State lives in the process: with serve.py each worker has its own store,
+# which is why /predict/trend can reseed a patient from a short history.
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+VITALS = ('hr', 'sbp', 'spo2', 'rr', 'temp')
+
+WINDOW_READINGS = 6
+WINDOW_MINUTES = 240.0
+
+# (vital, worsening direction) -> log-odds per unit of change across the window
+TREND_WEIGHTS = {
+    ('hr', 1): 0.05,     # +20 bpm   -> +1.0
+    ('spo2', -1): 0.3,   # -3 %      -> +0.9
+    ('sbp', -1): 0.05,   # -20 mmHg  -> +1.0
+    ('sbp', 1): 0.02,    # +30 mmHg  -> +0.6
+    ('rr', 1): 0.15,     # +6 /min   -> +0.9
+    ('temp', 1): 0.5,    # +1.0 C    -> +0.5
+}
+MAX_SHIFT = 3.0
+
+
+class TrendWindow:
+    """Sliding window of (minutes, vitals) with running sums."""
+
+    __slots__ = ('max_readings', 'max_minutes', 'anchor', 'readings', 'st', 'stt', 'sx', 'sxx', 'stx')
+
+    def __init__(self, max_readings=WINDOW_READINGS, max_minutes=WINDOW_MINUTES):
+        self.max_readings = max_readings
+        self.max_minutes = max_minutes
+        self.anchor = None  # epoch seconds of the first reading; t is minutes since then
+        self.readings = deque()
+        self.st = self.stt = 0.0
+        self.sx = [0.0] * len(VITALS)
+        self.sxx = [0.0] * len(VITALS)
+        self.stx = [0.0] * len(VITALS)
+
+    def __len__(self):
+        return len(self.readings)
+
+    @property
+    def last_timestamp(self):
+        return self.anchor + self.readings[-1][0] * 60 if self.readings else None
+
+    def add(self, timestamp, values):
+        """Append one reading (epoch seconds, values in VITALS order); amortized O(1).
+
+        A reading with the latest reading's timestamp replaces it, so a retried
+        request is not counted twice.
+        """
+        if self.anchor is None:
+            self.anchor = timestamp
+        t = (timestamp - self.anchor) / 60.0
+        if self.readings and t < self.readings[-1][0]:
+            raise ValueError("Reading is older than the patient's latest reading")
+        values = tuple(float(v) for v in values)
+        if self.readings and t == self.readings[-1][0]:
+            _, old_values = self.readings.pop()
+            self._apply(t, old_values, -1.0)
+        self.readings.append((t, values))
+        self._apply(t, values, 1.0)
+        # Each reading is evicted at most once, so this loop is O(1) amortized
+        while len(self.readings) > self.max_readings or t - self.readings[0][0] > self.max_minutes:
+            old_t, old_values = self.readings.popleft()
+            self._apply(old_t, old_values, -1.0)
+        if len(self.readings) == 1:
+            # Re-anchor on the lone reading so t (and the t^2 sums) stay small
+            self.anchor = timestamp
+            self.readings[0] = (0.0, values)
+            self.st = self.stt = 0.0
+            self.stx = [0.0] * len(VITALS)
+
+    def _apply(self, t, values, sign):
+        self.st += sign * t
+        self.stt += sign * t * t
+        for i, x in enumerate(values):
+            self.sx[i] += sign * x
+            self.sxx[i] += sign * x * x
+            self.stx[i] += sign * t * x
+
+    def features(self):
+        """{'readings', 'span_minutes', 'vitals': {vital: {slope_per_hour, delta, std}}}."""
+        n = len(self.readings)
+        span = self.readings[-1][0] - self.readings[0][0] if n else 0.0
+        denom = n * self.stt - self.st * self.st
+        vitals = {}
+        for i, name in enumerate(VITALS):
+            if n < 2:
+                vitals[name] = {'slope_per_hour': 0.0, 'delta': 0.0, 'std': 0.0}
+                continue
+            slope = (n * self.stx[i] - self.st * self.sx[i]) / denom * 60.0 if denom > 1e-9 else 0.0
+            mean = self.sx[i] / n
+            vitals[name] = {
+                'slope_per_hour': round(slope, 4),
+                'delta': round(self.readings[-1][1][i] - self.readings[-2][1][i], 4),
+                'std': round(math.sqrt(max(0.0, self.sxx[i] / n - mean * mean)), 4),
+            }
+        return {'readings': n, 'span_minutes': round(span, 2), 'vitals': vitals}
+
+
+def trend_shift(features):
+    """(log-odds shift, {'<vital>_rise'/'<vital>_drop': log-odds}) from window features.
+
+    The change a vital is charged for is the fitted slope across the window
+    (equal to the delta with two readings), so one noisy reading in a longer
+    window moves the score less than a sustained trend.
+    """
+    if features['readings'] < 2:
+        return 0.0, {}
+    hours = features['span_minutes'] / 60.0
+    contributions = {}
+    for (vital, direction), weight in TREND_WEIGHTS.items():
+        v = features['vitals'][vital]
+        change = v['slope_per_hour'] * hours if hours > 0 else v['delta']
+        worsening = change * direction
+        if worsening > 0:
+            contributions[f"{vital}_{'rise' if direction > 0 else 'drop'}"] = round(weight * worsening, 6)
+    shift = sum(contributions.values())
+    return max(-MAX_SHIFT, min(MAX_SHIFT, shift)), contributions
+
+
+def adjust_probability(prob, shift):
+    p = min(max(prob, 1e-6), 1 - 1e-6)
+    return 1.0 / (1.0 + math.exp(-(math.log(p / (1 - p)) + shift)))
+
+
+class TrendStore:
+    """patient_id -> TrendWindow, LRU-bounded, idle patients expire after ttl seconds."""
+
+    def __init__(self, max_patients=10000, ttl=24 * 3600, max_readings=WINDOW_READINGS,
+                 max_minutes=WINDOW_MINUTES):
+        self.max_patients = max_patients
+        self.ttl = ttl
+        self.max_readings = max_readings
+        self.max_minutes = max_minutes
+        self._windows = OrderedDict()  # patient_id -> (last update monotonic, TrendWindow)
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.reseeds = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expire(self, now):
+        while self._windows:
+            patient_id, (touched, _) = next(iter(self._windows.items()))
+            if now - touched <= self.ttl:
+                break
+            del self._windows[patient_id]
+            self.expirations += 1
+
+    def update(self, patient_id, timestamp, values, history=None):
+        """Add a reading for patient_id and return its window features.
+
+        `history` is a list of (timestamp, values) ending before `timestamp`.
+        It is only replayed when this process has no state for the patient or
+        has missed readings (history ends after our newest reading).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._windows.get(patient_id)
+            window = entry[1] if entry is not None else None
+            # A replay builds a fresh window and add() checks before it changes
+            # anything, so a ValueError here leaves the stored state as it was
+            if history and (window is None or history[-1][0] > window.last_timestamp):
+                replayed = TrendWindow(self.max_readings, self.max_minutes)
+                for ts, vals in history[-self.max_readings:]:
+                    replayed.add(ts, vals)
+                replayed.add(timestamp, values)
+                window = replayed
+                self.reseeds += 1
+            else:
+                window = window if window is not None else TrendWindow(self.max_readings, self.max_minutes)
+                window.add(timestamp, values)
+            self._windows.pop(patient_id, None)
+            self._windows[patient_id] = (now, window)
+            while len(self._windows) > self.max_patients:
+                self._windows.popitem(last=False)
+                self.evictions += 1
+            self.updates += 1
+            return window.features()
+
+    def get(self, patient_id):
+        with self._lock:
+            entry = self._windows.get(patient_id)
+            return entry[1].features() if entry is not None else None
+
+    def discard(self, patient_id):
+        with self._lock:
+            return self._windows.pop(patient_id, None) is not None
+
+    def stats(self):
+        return {
+            'patients': len(self._windows),
+            'updates': self.updates,
+            'reseeds': self.reseeds,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }